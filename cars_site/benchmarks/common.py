@@ -0,0 +1,80 @@
+"""
+Helpers shared by the benchmarks. Every benchmark runs against its own throw-away SQLite database,
+so the development database is never touched.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def setup_django(db_path=None):
+    """Configure Django to use a fresh database at `db_path` and create its tables."""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "cars_site.settings")
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix="cars-benchmark-"), "db.sqlite3")
+    settings.DATABASES["default"]["NAME"] = db_path
+    # Otherwise every executed query would be kept in memory.
+    settings.DEBUG = False
+    django.setup()
+    call_command("migrate", verbosity=0)
+    return db_path
+
+
+def insert_cars(count, start=0, max_rates_number=1000, seed=0):
+    """
+    Insert `count` cars with skewed (Pareto distributed) rating counts, bypassing the ORM for
+    speed. Only the aggregates stored on the cars are filled, not the rates themselves.
+    """
+    from django.db import connection, transaction
+    from cars_app.models import Car
+
+    rng = random.Random(seed + start)
+    rates_numbers = (
+        min(int(rng.paretovariate(1.2)) - 1, max_rates_number)
+        for _ in range(start, start + count)
+    )
+    # All rates are 3s.
+    names = (("Make-{}".format(i % 1000), "Model-{}".format(i)) for i in range(start, start + count))
+    rows = (
+        (make, model, *Car.name_key(make, model), n * 3, n, 0, 0, n, 0, 0)
+        for (make, model), n in zip(names, rates_numbers)
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO cars_app_car (make, model, make_key, model_key, rating_sum, rating_count, "
+            "rating_1_count, rating_2_count, rating_3_count, rating_4_count, rating_5_count) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def measure(function, repeat=50, warmup=3):
+    """Call `function` repeatedly and return its latency percentiles in milliseconds."""
+    for _ in range(warmup):
+        function()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return percentiles(timings)
+
+
+def percentiles(timings):
+    """Latency percentiles (in milliseconds) of the given timings (in milliseconds)."""
+    timings = sorted(timings)
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+        "p99_ms": round(timings[max(int(len(timings) * 0.99) - 1, 0)], 3),
+    }
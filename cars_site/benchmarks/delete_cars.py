@@ -0,0 +1,65 @@
+"""
+Measures time and peak Python memory of deleting a car as its number of rates grows - with the
+set-based `CarQuerySet.delete` and with Django's collector, which loads every rate into memory
+once a receiver of the rate deletion signals is connected.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.delete_cars --rates 1000 10000 100000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import models
+    from django.db.models.signals import post_delete
+
+    from cars_app.models import Car, Rate
+
+    def collector_delete(car):
+        def receiver(**kwargs):
+            pass
+
+        post_delete.connect(receiver, sender=Rate)
+        try:
+            models.Model.delete(car)
+        finally:
+            post_delete.disconnect(receiver, sender=Rate)
+
+    results = []
+    for rates_number in sorted(args.rates):
+        result = {"rates": rates_number}
+        for name, delete in (
+            ("set_based", lambda car: car.delete()),
+            ("collector", collector_delete),
+        ):
+            car = Car.objects.create(make="Benchmark", model=f"{name}-{rates_number}")
+            Rate.objects.bulk_create(
+                (Rate(car=car, rating=3) for _ in range(rates_number)), batch_size=10_000
+            )
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            delete(car)
+            duration = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[name] = {"ms": round(duration * 1000, 3), "peak_kb": peak // 1024}
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
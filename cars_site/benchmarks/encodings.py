@@ -0,0 +1,71 @@
+"""
+Measures serialization time and payload size of the list formats (see `cars_app.responses`)
+against the `JsonResponse` encoding (the default one of JSON), and latency of the whole `GET /cars/?unpaged=true`
+with and without a `?fields=` projection.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.encodings --rows 1000 10000 100000
+"""
+import argparse
+import json
+
+from benchmarks.common import insert_cars, measure, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.http import JsonResponse
+    from django.test import RequestFactory
+
+    from cars_app import responses
+    from cars_app.models import Car
+    from cars_app.views import CarsView
+
+    fields = CarsView.fields
+    # JSON as `JsonResponse` encodes it is measured as "JsonResponse".
+    settings.COMPACT_JSON_RESPONSES = True
+    formats = {
+        "json": lambda rows: responses.encode(rows, responses.JSON, fields),
+        "columns": lambda rows: responses.encode(rows, responses.COLUMNAR_JSON, fields),
+    }
+    if responses.msgpack is not None:
+        formats["msgpack"] = lambda rows: responses.encode(rows, responses.MSGPACK, fields)
+    view = CarsView.as_view()
+
+    results = []
+    cars_number = 0
+    for size in sorted(args.rows):
+        insert_cars(size - cars_number, start=cars_number)
+        cars_number = size
+        rows = list(Car.objects.with_avg_rating().order_by("id").values(*fields))
+
+        result = {"rows": size}
+        content = JsonResponse(rows, safe=False).content
+        result["JsonResponse"] = {"bytes": len(content)}
+        result["JsonResponse"].update(
+            measure(lambda: JsonResponse(rows, safe=False), repeat=args.repeat)
+        )
+        for name, encode in formats.items():
+            result[name] = {"bytes": len(encode(rows))}
+            result[name].update(measure(lambda: encode(rows), repeat=args.repeat))
+
+        for name, query in (("all fields", {}), ("fields=id,make", {"fields": "id,make"})):
+            request = RequestFactory().get("/cars/", {"unpaged": "true", **query})
+            result[f"GET /cars/?unpaged=true ({name})"] = measure(
+                lambda: view(request), repeat=args.repeat
+            )
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
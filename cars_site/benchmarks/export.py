@@ -0,0 +1,70 @@
+"""
+Measures throughput (rows per second) and peak Python memory of `GET /export/rates` in both
+formats as the number of rates grows. Memory should stay flat, as the rows are read in chunks.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.export --rates 1000000 3000000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[1_000_000, 3_000_000])
+    parser.add_argument("--cars", type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import RequestFactory
+
+    from cars_app.views import ExportView
+
+    view = ExportView.as_view()
+
+    def export(format):
+        request = RequestFactory().get("/export/rates", {"format": format})
+        size = 0
+        for chunk in view(request, table="rates"):
+            size += len(chunk)
+        return size
+
+    results = []
+    for rates in sorted(args.rates):
+        call_command("generate_dataset", cars=args.cars, rates=rates, clear=True, verbosity=0)
+
+        for format in ("csv", "ndjson"):
+            start = time.perf_counter()
+            size = export(format)
+            elapsed = time.perf_counter() - start
+
+            # Traced separately, tracing slows the export down.
+            tracemalloc.start()
+            try:
+                export(format)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            result = {
+                "rates": rates,
+                "format": format,
+                "seconds": round(elapsed, 2),
+                "rows_per_second": round(rates / elapsed),
+                "megabytes": round(size / 2**20, 1),
+                "peak_memory_kb": round(peak_memory / 1024),
+            }
+            results.append(result)
+            print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
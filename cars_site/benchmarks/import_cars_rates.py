@@ -0,0 +1,79 @@
+"""
+Measures `import_cars_rates` loading NDJSON files of rates (rows per second) with and without
+`SQLITE_IMPORT_PRAGMAS`, compared with sending the same rates as `POST /rate/` requests.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.import_cars_rates --rates 100000 1000000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import insert_cars, setup_django
+
+
+def write_rates(path, car_ids, count, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as file:
+        for i in range(count):
+            rate = {
+                "car_id": rng.choice(car_ids),
+                "rating": rng.randint(1, 5),
+                "created_at": f"2021-03-{1 + i % 28:02}T{i % 24:02}:00:00+00:00",
+            }
+            file.write(json.dumps(rate) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2_000, help="Number of POST /rate/ sent.")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test import RequestFactory
+
+    from cars_app.models import Car, Rate
+    from cars_app.views import RateView
+
+    insert_cars(args.cars)
+    car_ids = list(Car.objects.values_list("id", flat=True))
+    directory = tempfile.mkdtemp(prefix="cars-benchmark-")
+    import_pragmas = settings.SQLITE_IMPORT_PRAGMAS
+
+    view = RateView.as_view()
+    factory = RequestFactory()
+    start = time.perf_counter()
+    for i in range(args.requests):
+        view(factory.post("/rate/", {"car_id": car_ids[i % len(car_ids)], "rating": 1 + i % 5}))
+    requests_per_second = args.requests / (time.perf_counter() - start)
+    Rate.objects.all().delete()
+
+    results = []
+    for rates in sorted(args.rates):
+        path = os.path.join(directory, f"rates-{rates}.ndjson")
+        write_rates(path, car_ids, rates)
+        result = {"rates": rates, "post_rate_per_second": round(requests_per_second)}
+        for name, pragmas in (("default_pragmas", {}), ("import_pragmas", import_pragmas)):
+            settings.SQLITE_IMPORT_PRAGMAS = pragmas
+            start = time.perf_counter()
+            call_command(
+                "import_cars_rates", "rates", path, restart=True, stdout=open(os.devnull, "w")
+            )
+            result[f"{name}_rows_per_second"] = round(rates / (time.perf_counter() - start))
+            Rate.objects.all().delete()
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures the in-process leaderboard as the number of cars grows: time and memory of building it,
+latency of `GET /popular/?limit=N` served from it and from the database, and time of applying a
+single rate.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.leaderboard --sizes 10000 100000 1000000 --limit 10
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.common import insert_cars, measure, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory, override_settings
+
+    from cars_app.leaderboard import Leaderboard
+    from cars_app.models import Car
+    from cars_app.views import Popular
+
+    view = Popular.as_view()
+    request = RequestFactory().get("/popular/", {"limit": args.limit})
+
+    results = []
+    cars_number = 0
+    for size in sorted(args.sizes):
+        insert_cars(size - cars_number, start=cars_number)
+        cars_number = size
+
+        leaderboard = Leaderboard()
+        tracemalloc.start()
+        start = time.perf_counter()
+        leaderboard.build()
+        build_seconds = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rated_cars = Car.objects.filter(rating_count__gt=0).count()
+
+        result = {
+            "cars": size,
+            "rated_cars": rated_cars,
+            "build_ms": round(build_seconds * 1000, 1),
+            "bytes_per_car": round(memory / rated_cars),
+        }
+        with override_settings(LEADERBOARD_ENABLED=False):
+            result["database"] = measure(lambda: view(request), repeat=args.repeat)
+        with override_settings(LEADERBOARD_ENABLED=True), patch_leaderboard(leaderboard):
+            result["leaderboard"] = measure(lambda: view(request), repeat=args.repeat)
+
+        # Reading a car from the middle of the ranking again, as after a rate.
+        car_id = leaderboard._keys[len(leaderboard._keys) // 2][1]
+        result["apply"] = measure(lambda: leaderboard.apply([car_id]), repeat=args.repeat)
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+def patch_leaderboard(leaderboard):
+    from unittest.mock import patch
+
+    return patch("cars_app.views.leaderboard", leaderboard)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures the overhead of the metrics middleware: latency of the same requests handled with and
+without it. With `--multiprocess` the metrics are written to memory-mapped files, like under
+gunicorn with PROMETHEUS_MULTIPROC_DIR set.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.metrics_overhead --cars 10000 --rates 100000
+    python -m benchmarks.metrics_overhead --cars 10000 --rates 100000 --multiprocess
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from benchmarks.common import measure, setup_django
+
+METRICS_MIDDLEWARE = "cars_app.metrics.MetricsMiddleware"
+URLS = ["/popular/?limit=10", "/cars/", "/cache/stats"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--rates", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--multiprocess", action="store_true")
+    args = parser.parse_args()
+
+    if args.multiprocess:
+        # Has to be set before prometheus_client is imported.
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="cars-metrics-")
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.test import Client, override_settings
+
+    settings.ALLOWED_HOSTS = ["*"]
+    call_command("generate_dataset", cars=args.cars, rates=args.rates, verbosity=0)
+
+    without_metrics = [name for name in settings.MIDDLEWARE if name != METRICS_MIDDLEWARE]
+    clients = {}
+    for mode, middleware in (
+        ("without_metrics", without_metrics),
+        ("with_metrics", [METRICS_MIDDLEWARE] + without_metrics),
+    ):
+        with override_settings(MIDDLEWARE=middleware):
+            clients[mode] = Client()
+            # The middleware chain is built on the first request.
+            clients[mode].get(URLS[0])
+
+    results = []
+    for url in URLS:
+        result = {"url": url, "multiprocess": args.multiprocess}
+        for mode, client in clients.items():
+            result[mode] = measure(lambda: client.get(url), repeat=args.repeat, warmup=50)
+        result["p50_overhead_ms"] = round(
+            result["with_metrics"]["p50_ms"] - result["without_metrics"]["p50_ms"], 3
+        )
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Measures latency of `GET /popular/?limit=N` as the number of cars grows. With the ordering done
+by the database over `car_popularity_idx` it should stay flat.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.popular_top_n --sizes 10000 100000 1000000 --limit 10
+"""
+import argparse
+import json
+
+from benchmarks.common import insert_cars, measure, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import RequestFactory
+
+    from cars_app.views import Popular
+
+    view = Popular.as_view()
+    request = RequestFactory().get("/popular/", {"limit": args.limit})
+
+    results = []
+    cars_number = 0
+    for size in sorted(args.sizes):
+        insert_cars(size - cars_number, start=cars_number)
+        cars_number = size
+
+        result = {"cars": size, "limit": args.limit}
+        result.update(measure(lambda: view(request), repeat=args.repeat))
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Measures `POST /rate/` under concurrent clients with the rates applied in the request and with
+`RATE_QUEUE_ENABLED`, and the rate at which `drain_rate_queue` applies the queued rates.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.rate_queue --rates 5000 --concurrency 1 8 32
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import insert_cars, percentiles, setup_django
+
+
+def post_rates(view, car_ids, count, concurrency):
+    from django.db import connections
+    from django.test import RequestFactory
+
+    factory = RequestFactory()
+
+    def post(i):
+        data = {"car_id": car_ids[i % len(car_ids)], "rating": 1 + i % 5}
+        request = factory.post("/rate/", data)
+        start = time.perf_counter()
+        status = view(request).status_code
+        return status, (time.perf_counter() - start) * 1000
+
+    def close_connections(_):
+        connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started_at = time.perf_counter()
+        calls = list(executor.map(post, range(count)))
+        elapsed = time.perf_counter() - started_at
+        # Every thread has its own connections.
+        list(executor.map(close_connections, range(concurrency)))
+
+    result = percentiles([timing for _, timing in calls])
+    result["throughput_rps"] = round(count / elapsed, 1)
+    result["statuses"] = sorted({status for status, _ in calls})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rates", type=int, default=5_000)
+    parser.add_argument("--cars", type=int, default=1_000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from cars_app.models import Car, QueuedRate
+    from cars_app.views import RateView
+
+    insert_cars(args.cars)
+    car_ids = list(Car.objects.values_list("id", flat=True))
+    view = RateView.as_view()
+
+    results = []
+    for concurrency in args.concurrency:
+        result = {"rates": args.rates, "concurrency": concurrency}
+        settings.RATE_QUEUE_ENABLED = False
+        result["direct"] = post_rates(view, car_ids, args.rates, concurrency)
+        settings.RATE_QUEUE_ENABLED = True
+        result["queued"] = post_rates(view, car_ids, args.rates, concurrency)
+
+        queued = QueuedRate.objects.count()
+        start = time.perf_counter()
+        call_command("drain_rate_queue", once=True, stdout=open(os.devnull, "w"))
+        result["drain_rates_per_second"] = round(queued / (time.perf_counter() - start), 1)
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
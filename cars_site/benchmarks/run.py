@@ -0,0 +1,336 @@
+"""
+Benchmarks every endpoint against a generated dataset, both in-process (Django test client) and
+over real HTTP (threaded WSGI server), with the external API replaced by a local stub. Reports
+latency percentiles, throughput, SQL queries per request and peak RSS as JSON, so results of two
+commits can be diffed.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.run --cars 100000 --rates 1000000 --output results.json
+"""
+import argparse
+import json
+import platform
+import resource
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.common import percentiles, setup_django
+from benchmarks.stub_vpic import StubVpicServer, model_name
+
+FORM = "application/x-www-form-urlencoded"
+JSON = "application/json"
+
+
+def endpoints(car_ids):
+    """
+    Name and request factory of every benchmarked endpoint. A factory gets the number of requests
+    to make and a tag unique to the run, and returns (method, path, body, content type) tuples.
+    Writes use new names every time, so they never hit the uniqueness check.
+    """
+    from cars_app.models import Car
+
+    def get(path):
+        return lambda count, tag: [("GET", path, b"", None)] * count
+
+    def post_car(count, tag):
+        # Makes unknown to the catalog, so the external API is called for every request.
+        makes = [f"Bench-{tag}-{i}" for i in range(count)]
+        return [
+            ("POST", "/cars/", urlencode({"make": make, "model": model_name(make)}), FORM)
+            for make in makes
+        ]
+
+    def post_cars_batch(count, tag):
+        return [
+            (
+                "POST",
+                "/cars/batch",
+                json.dumps(
+                    [
+                        {"make": make, "model": model_name(make)}
+                        for make in (f"Batch-{tag}-{i}-{j}" for j in range(10))
+                    ]
+                ),
+                JSON,
+            )
+            for i in range(count)
+        ]
+
+    def post_rate(count, tag):
+        return [
+            (
+                "POST",
+                "/rate/",
+                urlencode({"car_id": car_ids[i % len(car_ids)], "rating": 1 + i % 5}),
+                FORM,
+            )
+            for i in range(count)
+        ]
+
+    def post_rates_bulk(count, tag):
+        return [
+            (
+                "POST",
+                "/rate/bulk",
+                json.dumps(
+                    [
+                        {"car_id": car_ids[(i + j) % len(car_ids)], "rating": 1 + j % 5}
+                        for j in range(100)
+                    ]
+                ),
+                JSON,
+            )
+            for i in range(count)
+        ]
+
+    def delete_car(count, tag):
+        Car.objects.bulk_create(
+            Car(make=f"Deleted-{tag}", model=f"Model-{i}") for i in range(count)
+        )
+        ids = Car.objects.filter(make=f"Deleted-{tag}").values_list("id", flat=True)
+        return [("DELETE", f"/cars/{id}", b"", None) for id in ids]
+
+    def delete_cars_bulk(count, tag):
+        Car.objects.bulk_create(
+            Car(make=f"Bulk-deleted-{tag}", model=f"Model-{i}") for i in range(count * 10)
+        )
+        ids = list(Car.objects.filter(make=f"Bulk-deleted-{tag}").values_list("id", flat=True))
+        return [
+            ("DELETE", f"/cars/?ids={','.join(map(str, ids[i:i + 10]))}", b"", None)
+            for i in range(0, len(ids), 10)
+        ]
+
+    return [
+        ("GET /cars/", get("/cars/")),
+        ("GET /cars/?unpaged=true", get("/cars/?unpaged=true")),
+        ("GET /popular/", get("/popular/")),
+        ("GET /popular/?limit=10", get("/popular/?limit=10")),
+        ("GET /popular/?unpaged=true", get("/popular/?unpaged=true")),
+        ("GET /cars/<id>/ratings", get(f"/cars/{car_ids[0]}/ratings")),
+        ("GET /trending?window=24h", get("/trending?window=24h")),
+        ("GET /trending?window=30d", get("/trending?window=30d")),
+        ("GET /cars/search?q=make-1+model-1", get("/cars/search?q=make-1+model-1")),
+        ("GET /cache/stats", get("/cache/stats")),
+        ("POST /cars/", post_car),
+        ("POST /cars/batch", post_cars_batch),
+        ("POST /rate/", post_rate),
+        ("POST /rate/bulk", post_rates_bulk),
+        ("DELETE /cars/<id>", delete_car),
+        ("DELETE /cars/?ids=", delete_cars_bulk),
+    ]
+
+
+def run_in_process(name, requests, warmup):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+
+    def call(method, path, body, content_type):
+        return client.generic(method, path, body, content_type=content_type).status_code
+
+    for request in requests[:warmup]:
+        call(*request)
+
+    # Counted on a separate request, capturing queries slows them down.
+    with CaptureQueriesContext(connection) as queries:
+        call(*requests[warmup])
+    # Read right away, the log is cleared when the next request starts.
+    queries_number = len(queries)
+
+    statuses = {}
+    timings = []
+    started_at = time.perf_counter()
+    for request in requests[warmup + 1:]:
+        start = time.perf_counter()
+        status = call(*request)
+        timings.append((time.perf_counter() - start) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+    elapsed = time.perf_counter() - started_at
+
+    return _result(name, "in-process", timings, elapsed, statuses, queries=queries_number)
+
+
+def run_over_http(name, requests, warmup, base_url, concurrency):
+    import requests as http
+
+    sessions = threading.local()
+
+    def call(request):
+        method, path, body, content_type = request
+        session = getattr(sessions, "session", None)
+        if session is None:
+            session = sessions.session = http.Session()
+        headers = {"Content-Type": content_type} if content_type else {}
+        start = time.perf_counter()
+        response = session.request(method, base_url + path, data=body, headers=headers)
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, requests[:warmup]))
+
+        started_at = time.perf_counter()
+        calls = list(executor.map(call, requests[warmup:]))
+        elapsed = time.perf_counter() - started_at
+
+    statuses = {}
+    for status, _ in calls:
+        statuses[status] = statuses.get(status, 0) + 1
+    timings = [timing for _, timing in calls]
+    return _result(name, "http", timings, elapsed, statuses, concurrency=concurrency)
+
+
+def _result(name, transport, timings, elapsed, statuses, **extra):
+    result = {"endpoint": name, "transport": transport, "requests": len(timings)}
+    result.update(percentiles(timings))
+    result["throughput_rps"] = round(len(timings) / elapsed, 1)
+    result["statuses"] = {str(status): count for status, count in sorted(statuses.items())}
+    result.update(extra)
+    result["peak_rss_kb"] = peak_rss_kb()
+    return result
+
+
+def peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere.
+    return peak // 1024 if platform.system() == "Darwin" else peak
+
+
+def wsgi_server():
+    from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+    from django.core.wsgi import get_wsgi_application
+
+    class QuietHandler(WSGIRequestHandler):
+        # Otherwise every response waits for the client's delayed ACK (~40 ms).
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, check=True, text=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--rates", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=3.0)
+    parser.add_argument(
+        "--db", help="SQLite file with a dataset made earlier; generated if not given."
+    )
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint.")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel HTTP clients.")
+    parser.add_argument(
+        "--vpic-latency", type=float, default=0.0, help="Stub external API delay in seconds."
+    )
+    parser.add_argument("--transport", choices=["in-process", "http", "all"], default="all")
+    parser.add_argument("--endpoint", action="append", help="Only run endpoints with this name.")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout.")
+    args = parser.parse_args()
+
+    setup_django(args.db)
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from cars_app.models import Car, Rate
+    from cars_app.validation import vpic_client
+
+    settings.ALLOWED_HOSTS = ["*"]
+    if args.db is None:
+        call_command(
+            "generate_dataset",
+            cars=args.cars,
+            rates=args.rates,
+            seed=args.seed,
+            skew=args.skew,
+            verbosity=0,
+        )
+    dataset = {"cars": Car.objects.count(), "rates": Rate.objects.count()}
+    if args.db is None:
+        dataset.update(seed=args.seed, skew=args.skew)
+
+    transports = ["in-process", "http"] if args.transport == "all" else [args.transport]
+    tag = str(int(time.time()))
+    results = []
+    with StubVpicServer(latency=args.vpic_latency) as vpic:
+        vpic_client.base_url = vpic.url
+        server = wsgi_server() if "http" in transports else None
+        try:
+            # Rates go to existing cars, also when a dataset made earlier is used.
+            car_ids = list(Car.objects.order_by("id").values_list("id", flat=True)[:1000])
+            for name, make_requests in endpoints(car_ids):
+                if args.endpoint and name not in args.endpoint:
+                    continue
+                for transport in transports:
+                    requests = make_requests(
+                        args.warmup + args.requests + 1, f"{tag}-{transport}"
+                    )
+                    if transport == "in-process":
+                        result = run_in_process(name, requests, args.warmup)
+                    else:
+                        result = run_over_http(
+                            name,
+                            requests[1:],
+                            args.warmup,
+                            f"http://127.0.0.1:{server.server_address[1]}",
+                            args.concurrency,
+                        )
+                    results.append(result)
+                    print(json.dumps(result), flush=True)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "database": settings.DATABASES["default"]["ENGINE"],
+        "dataset": dataset,
+        "options": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "vpic_latency": args.vpic_latency,
+        },
+        "peak_rss_kb": peak_rss_kb(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
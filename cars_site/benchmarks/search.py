@@ -0,0 +1,65 @@
+"""
+Measures latency of `GET /cars/search` as the number of cars grows, for a few typical typeahead
+queries. The FTS5 index is compared with the LIKE search used on other databases, run on the same
+SQLite database.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.search --cars 100000 1000000 3000000
+"""
+import argparse
+import json
+
+from benchmarks.common import measure, setup_django
+
+# Generated cars are named "Make-<id % makes>" / "Model-<id>".
+QUERIES = {
+    "short prefix": "mo",
+    "make": "make-42",
+    "make and model": "make-1 model-1",
+    "single car": "model-12345",
+    "no match": "golf",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--cars", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import RequestFactory
+
+    from cars_app import search
+    from cars_app.models import Car
+    from cars_app.views import SearchView
+
+    view = SearchView.as_view()
+    results = []
+    for cars_number in sorted(args.cars):
+        call_command("generate_dataset", cars=cars_number, rates=0, clear=True, verbosity=0)
+
+        for name, query in QUERIES.items():
+            words = search.query_words(query)
+            request = RequestFactory().get(
+                "/cars/search", {"q": query, "limit": args.limit, "rating": "true"}
+            )
+            like_matches = search._like_matches(Car.objects.with_avg_rating(), words)
+            result = {"cars": cars_number, "query": name}
+            result["fts"] = measure(lambda: view(request), repeat=args.repeat)
+            result["like"] = measure(
+                lambda: list(like_matches.values("id", "make", "model")[: args.limit]),
+                repeat=max(args.repeat // 10, 1),
+                warmup=1,
+            )
+            results.append(result)
+            print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
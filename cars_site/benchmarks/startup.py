@@ -0,0 +1,124 @@
+"""
+Compares the settings profiles (`DJANGO_PROFILE`): time to import and set up the application,
+time until a new gunicorn worker answers its first request, and latency of a request which makes
+no query (`GET /cache/stats`) - mostly the middleware.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.startup --profiles full api --repeat 10
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.common import percentiles
+
+# Prints the milliseconds taken to load the WSGI application with its URL configuration, and the
+# latency percentiles of a request made in the same process.
+CHILD = """
+import json, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import resolve
+resolve("/cars/")
+import_ms = (time.perf_counter() - start) * 1000
+
+from django.test import Client
+from benchmarks.common import measure
+client = Client()
+print(json.dumps({"import_ms": import_ms, "request": measure(
+    lambda: client.get("/cache/stats"), repeat=%(requests)d, warmup=100
+)}))
+"""
+
+
+def environment(profile, db_path):
+    return {
+        **os.environ,
+        "DJANGO_PROFILE": profile,
+        "DJANGO_SETTINGS_MODULE": "cars_site.settings",
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark"),
+        "ALLOWED_HOSTS": "testserver;127.0.0.1",
+        "DEBUG": "false",
+        "DATABASE_NAME": db_path,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def boot_worker(env):
+    """Milliseconds from starting gunicorn with a single worker to its first response."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        ["gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}", "cars_site.wsgi"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/cache/stats", timeout=1).read()
+                return (time.perf_counter() - start) * 1000
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("gunicorn exited")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--profiles", nargs="+", default=["full", "api"])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="cars-benchmark-"), "db.sqlite3")
+    results = []
+    for profile in args.profiles:
+        env = environment(profile, db_path)
+        runs = [
+            json.loads(
+                subprocess.run(
+                    [sys.executable, "-c", CHILD % {"requests": args.requests}],
+                    env=env,
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+            )
+            for _ in range(args.repeat)
+        ]
+        result = {
+            "profile": profile,
+            "import": percentiles([run["import_ms"] for run in runs]),
+            "worker_boot": percentiles([boot_worker(env) for _ in range(args.repeat)]),
+            # Median of the per-run percentiles.
+            "request": {
+                key: sorted(run["request"][key] for run in runs)[len(runs) // 2]
+                for key in runs[0]["request"]
+            },
+        }
+        results.append(result)
+        print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
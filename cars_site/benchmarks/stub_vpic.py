@@ -0,0 +1,59 @@
+"""
+Stand-in for the external vPIC API, so benchmarks do not depend on (or load) the real service.
+Every make has a single model named "<make> Model".
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+MODELS_PATH = "/vehicles/GetModelsForMake/"
+
+
+def model_name(make):
+    return f"{make} Model"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        path = urlparse(self.path).path
+        if path.startswith(MODELS_PATH):
+            make = unquote(path[len(MODELS_PATH):])
+            results = [{"Make_Name": make, "Model_Name": model_name(make)}]
+        else:
+            results = []
+
+        body = json.dumps({"Count": len(results), "Results": results}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubVpicServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency = latency
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
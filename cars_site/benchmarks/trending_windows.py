@@ -0,0 +1,65 @@
+"""
+Measures latency of `GET /trending?window=...` as the rating history grows. Only the buckets of
+the window are read, so it should stay flat - unlike counting the rates of the window directly,
+which is measured for comparison.
+
+Run from the `cars_site` directory:
+
+    python -m benchmarks.trending_windows --days 30 90 365 --rates-per-day 10000
+"""
+import argparse
+import json
+
+from benchmarks.common import measure, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--days", type=int, nargs="+", default=[30, 90, 365])
+    parser.add_argument("--rates-per-day", type=int, default=10_000)
+    parser.add_argument("--cars", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.db.models import Count
+    from django.test import RequestFactory
+
+    from cars_app.models import Rate
+    from cars_app.trending import WINDOWS, window_start
+    from cars_app.views import Trending
+
+    view = Trending.as_view()
+    results = []
+    for days in sorted(args.days):
+        call_command(
+            "generate_dataset",
+            cars=args.cars,
+            rates=days * args.rates_per_day,
+            days=days,
+            clear=True,
+            verbosity=0,
+        )
+
+        for window in WINDOWS:
+            request = RequestFactory().get("/trending", {"window": window, "limit": 10})
+            rates_of_window = (
+                Rate.objects.filter(created_at__gte=window_start(window))
+                .values("car")
+                .annotate(rates_number=Count("id"))
+                .order_by("-rates_number", "car")
+            )
+            result = {"history_days": days, "rates": days * args.rates_per_day, "window": window}
+            result["buckets"] = measure(lambda: view(request), repeat=args.repeat)
+            result["rates_scan"] = measure(
+                lambda: list(rates_of_window[:10]), repeat=max(args.repeat // 4, 1), warmup=1
+            )
+            results.append(result)
+            print(json.dumps(result))
+
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
 
 
 class CarsAppConfig(AppConfig):
     name = 'cars_app'
+
+    def ready(self):
+        from . import db, leaderboard, metrics, models, trending
+
+        request_started.connect(db.close_broken_connections)
+        connection_created.connect(db.configure_sqlite)
+        if settings.METRICS_ENABLED:
+            connection_created.connect(metrics.record_queries)
+        request_finished.connect(trending.expire_in_background_if_due)
+        models.rating_aggregates_changed.connect(leaderboard.on_rating_aggregates_changed)
+        models.cars_deleted.connect(leaderboard.on_cars_deleted)
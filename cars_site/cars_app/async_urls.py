@@ -0,0 +1,24 @@
+from django.urls import path, register_converter
+
+from . import async_views, views
+from .converters import IdConverter
+
+register_converter(IdConverter, 'id')
+
+urlpatterns = [
+    path('cars/', async_views.AsyncCarsView.as_view()),
+    path('cars/batch', views.CarsBatchView.as_view()),
+    path('cars/search', views.SearchView.as_view()),
+    path('cars/<id:id>', async_views.AsyncCarsDeleteView.as_view()),
+    path('cars/<id:id>/ratings', views.CarRatingsView.as_view()),
+    path('rate/', async_views.AsyncRateView.as_view()),
+    path('rate/bulk', views.RateBulkView.as_view()),
+    path('rate/queue', views.RateQueueView.as_view()),
+    path('popular/', async_views.AsyncPopular.as_view()),
+    path('trending', views.Trending.as_view()),
+    path('cache/stats', views.CacheStatsView.as_view()),
+    path('metrics', views.MetricsView.as_view()),
+]
+# The exports (`/export/cars`, `/export/rates`) are left out: Django's ASGI handler iterates
+# streamed responses in the event loop, where the database cannot be queried. The
+# `export_cars_rates` command exports the same data.
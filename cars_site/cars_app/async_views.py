@@ -0,0 +1,100 @@
+"""
+Async versions of the views, used when the app is served over ASGI (see `settings.ASYNC_VIEWS`).
+
+They behave exactly like the sync views. The external API is called with an async HTTP client, so
+a single worker can wait for many validations at once. Django does not support async database
+access yet, so the ORM is called through `sync_to_async`.
+"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import HttpResponse
+
+from .catalog import add_to_catalog, car_in_catalog
+from .validation import VpicUnavailable, async_vpic_client
+from .views import CarsDeleteView, CarsView, Popular, RateView
+
+
+class AsyncViewMixin:
+    """
+    Lets class-based views have async handlers. `View.as_view` returns a sync function, which
+    Django would run in a thread and which would return an un-awaited coroutine.
+    """
+
+    # Django's ASGI handler iterates streaming responses in the event loop, where the database
+    # cannot be queried.
+    stream_lists = False
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The view this one is the async version of, e.g. for the metrics labels.
+        cls.sync_view_class = next(
+            base for base in cls.__mro__[1:] if not issubclass(base, AsyncViewMixin)
+        )
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            response = view(request, *args, **kwargs)
+            # Responses for not allowed methods are returned by the sync `dispatch` directly.
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+
+class AsyncCarsView(AsyncViewMixin, CarsView):
+    async def get(self, request):
+        return await sync_to_async(super().get)(request)
+
+    async def delete(self, request):
+        return await sync_to_async(super().delete)(request)
+
+    async def post(self, request):
+        make = request.POST["make"]
+        model = request.POST["model"]
+        try:
+            car_exists = await self._check_car_exists_async(make, model)
+        except VpicUnavailable:
+            return HttpResponse(
+                "Cannot check the car right now, the external API is unavailable.",
+                status=503,
+            )
+
+        if not car_exists:
+            return HttpResponse(
+                "The provided parameters do not match any real life cars.", status=422
+            )
+
+        else:
+            return await sync_to_async(self._create_car)(make, model)
+
+    async def _check_car_exists_async(self, make, model):
+        if await sync_to_async(car_in_catalog)(make, model):
+            return True
+
+        model_names = await async_vpic_client.get_model_names(make)
+        # Remember the fetched models, so next cars of this make are checked locally.
+        await sync_to_async(add_to_catalog)((make, model_name) for model_name in model_names)
+
+        return self._model_in(model, model_names)
+
+
+class AsyncCarsDeleteView(AsyncViewMixin, CarsDeleteView):
+    async def delete(self, request, id):
+        return await sync_to_async(super().delete)(request, id)
+
+
+class AsyncRateView(AsyncViewMixin, RateView):
+    async def post(self, request):
+        return await sync_to_async(super().post)(request)
+
+
+class AsyncPopular(AsyncViewMixin, Popular):
+    async def get(self, request):
+        return await sync_to_async(super().get)(request)
@@ -0,0 +1,207 @@
+"""
+Server-side cache of the read endpoint responses.
+
+Every car or rating write bumps a single data version number, which makes all cached responses
+outdated at once (O(1) invalidation). Cached responses remember the version they were made for and
+are only served while it is current - or, within the optional stale-while-revalidate window after
+a write, served once more while a fresh response is computed in the background.
+
+The same version is the ETag of the responses (with `CONDITIONAL_GET_ENABLED`), so clients which
+already have the current data get `304 Not Modified` without the view being called.
+"""
+import functools
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .responses import NotAcceptable, negotiate_format
+
+log = logging.getLogger(__file__)
+
+VERSION_KEY = "cars:data-version"
+CHANGED_AT_KEY = "cars:data-changed-at"
+STATS_KEYS = {
+    "hits": "cars:response-cache:hits",
+    "stale_hits": "cars:response-cache:stale-hits",
+    "misses": "cars:response-cache:misses",
+}
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def data_version():
+    """Number which changes on every car or rating write."""
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        # Starts from the current time, so versions given out (e.g. as ETags) before the cache was
+        # emptied are not used again.
+        _cache().add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = _cache().get(VERSION_KEY)
+    return version
+
+
+def data_changed_at():
+    """Time (UNIX timestamp) of the last car or rating write, None if not known."""
+    return _cache().get(CHANGED_AT_KEY)
+
+
+def data_changed():
+    """Mark all cached responses as outdated, once the current transaction commits."""
+    transaction.on_commit(_bump_data_version)
+
+
+def _bump_data_version():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The version was evicted - any new number different from the evicted one will do.
+        cache.set(VERSION_KEY, int(time.time() * 1000), timeout=None)
+    cache.set(CHANGED_AT_KEY, time.time(), timeout=None)
+
+
+def cache_stats():
+    counters = _cache().get_many(STATS_KEYS.values())
+    return {name: counters.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def _count(name):
+    cache = _cache()
+    try:
+        cache.incr(STATS_KEYS[name])
+    except ValueError:
+        if not cache.add(STATS_KEYS[name], 1, timeout=None):
+            cache.incr(STATS_KEYS[name])
+
+
+def cached_response(get):
+    """
+    Decorator of view `get` methods caching their successful, not streamed responses for
+    `RESPONSE_CACHE_TIMEOUT` seconds (0 turns the cache off).
+    """
+
+    @functools.wraps(get)
+    def wrapper(view, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_TIMEOUT:
+            return get(view, request, *args, **kwargs)
+
+        cache = _cache()
+        key = _key(request)
+        version = data_version()
+        entry = cache.get(key)
+
+        if entry is not None and entry["version"] == version:
+            _count("hits")
+            return _to_response(entry, "HIT")
+
+        if entry is not None and _within_stale_window():
+            _count("stale_hits")
+            if cache.add(f"{key}:refreshing", 1, timeout=settings.RESPONSE_CACHE_STALE_TIMEOUT):
+                _refresh_in_background(
+                    lambda: _store(key, version, get(view, request, *args, **kwargs))
+                )
+            return _to_response(entry, "STALE")
+
+        _count("misses")
+        response = get(view, request, *args, **kwargs)
+        _store(key, version, response)
+        response["X-Cache"] = "MISS"
+        return response
+
+    return wrapper
+
+
+def conditional_response(get):
+    """
+    Decorator of view `get` methods adding ETag and Last-Modified headers made from the data
+    version, and answering requests with a matching If-None-Match or If-Modified-Since with 304
+    without calling the view. Turned on with `CONDITIONAL_GET_ENABLED`.
+    """
+    return method_decorator(condition(etag_func=_etag, last_modified_func=_last_modified))(get)
+
+
+def _etag(request, *args, **kwargs):
+    if not settings.CONDITIONAL_GET_ENABLED:
+        return None
+    # Representations of the same URL in different formats need different tags.
+    try:
+        media_type = negotiate_format(request)
+    except NotAcceptable:
+        return None
+    return f"{data_version()}-{media_type}"
+
+
+def _last_modified(request, *args, **kwargs):
+    if not settings.CONDITIONAL_GET_ENABLED:
+        return None
+    changed_at = data_changed_at()
+    # Last-Modified has a precision of a second, so it is only given once the second of the last
+    # write has passed - a next write always changes it then.
+    if changed_at is None or time.time() < int(changed_at) + 1:
+        return None
+    return datetime.fromtimestamp(changed_at, timezone.utc)
+
+
+def _key(request):
+    # Responses of the same URL differ by the format negotiated with the Accept header.
+    try:
+        media_type = negotiate_format(request)
+    except NotAcceptable:
+        media_type = None
+    return f"cars:response:{media_type}:{request.get_full_path()}"
+
+
+def _within_stale_window():
+    changed_at = data_changed_at()
+    return (
+        settings.RESPONSE_CACHE_STALE_TIMEOUT > 0
+        and changed_at is not None
+        and time.time() - changed_at <= settings.RESPONSE_CACHE_STALE_TIMEOUT
+    )
+
+
+def _store(key, version, response):
+    if response.status_code != 200 or response.streaming:
+        return
+    _cache().set(
+        key,
+        {
+            "version": version,
+            "content": response.content,
+            "content_type": response["Content-Type"],
+            "vary": response.get("Vary"),
+        },
+        timeout=settings.RESPONSE_CACHE_TIMEOUT,
+    )
+    _cache().delete(f"{key}:refreshing")
+
+
+def _to_response(entry, cache_status):
+    response = HttpResponse(entry["content"], content_type=entry["content_type"])
+    if entry.get("vary"):
+        response["Vary"] = entry["vary"]
+    response["X-Cache"] = cache_status
+    return response
+
+
+def _refresh_in_background(refresh):
+    def run():
+        try:
+            refresh()
+        except Exception:
+            log.exception("Refreshing a cached response failed.")
+        finally:
+            # Connections are per thread, this one would never be reused.
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
@@ -0,0 +1,62 @@
+"""
+Local replica of the make/model catalog of the external API. Lets checking if a car exists be done
+with an indexed lookup, without a network round-trip.
+"""
+import csv
+import json
+from typing import Iterable, Iterator, Tuple
+
+from django.conf import settings
+
+from .models import CatalogEntry, normalize_name
+
+
+def car_in_catalog(make, model) -> bool:
+    return CatalogEntry.objects.filter(
+        make_key=normalize_name(make), model_key=normalize_name(model)
+    ).exists()
+
+
+def add_to_catalog(pairs: Iterable[Tuple[str, str]]) -> int:
+    """
+    Insert the (make, model) pairs which are not in the catalog yet. Return number of processed
+    pairs.
+    """
+    entries = (
+        CatalogEntry(
+            make=make,
+            model=model,
+            make_key=normalize_name(make),
+            model_key=normalize_name(model),
+        )
+        for make, model in pairs
+    )
+    processed = 0
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.CATALOG_BATCH_SIZE:
+            CatalogEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+            batch = []
+    CatalogEntry.objects.bulk_create(batch, ignore_conflicts=True)
+    return processed + len(batch)
+
+
+def read_snapshot(path) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (make, model) pairs from a catalog snapshot file.
+
+    JSON files may hold an API response (`{"Results": [...]}`) or just the list of results, each
+    having "Make_Name" and "Model_Name" keys. CSV files need a header with the same column names.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if str(path).lower().endswith(".csv"):
+            rows = csv.DictReader(file)
+        else:
+            rows = json.load(file)
+            if isinstance(rows, dict):
+                rows = rows["Results"]
+
+        for row in rows:
+            yield row["Make_Name"], row["Model_Name"]
@@ -0,0 +1,13 @@
+from django.urls.converters import IntConverter
+
+from .models import is_db_integer
+
+
+class IdConverter(IntConverter):
+    """Like `int`, but out of the range the database can be queried with the URL doesn't match."""
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        if not is_db_integer(value):
+            raise ValueError(f"{value} is out of the database integer range.")
+        return value
@@ -0,0 +1,164 @@
+"""
+Database connection handling: routing reads to replicas with read-your-writes pinning, health
+checks of persistent connections and SQLite tuning.
+"""
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+
+PIN_COOKIE = "pin_primary"
+
+# Whether the current request has to read from the primary database.
+_pinned_to_primary = contextvars.ContextVar("pinned_to_primary", default=False)
+
+
+class PrimaryReplicaRouter:
+    """Sends writes to the primary database and reads to a random replica, unless pinned."""
+
+    def db_for_read(self, model, **hints):
+        replicas = [alias for alias in settings.DATABASES if alias != "default"]
+        if _pinned_to_primary.get() or not replicas:
+            return "default"
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # All databases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary.
+        return db == "default"
+
+
+class ReplicaPinningMiddleware:
+    """
+    Pins requests which write, and for `DATABASE_REPLICA_PIN_SECONDS` all next requests of the same
+    client, to the primary database, so clients always see their own writes.
+    """
+
+    UNSAFE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django see the middleware as async and await it in the event loop.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._async_call(request)
+        pinned = self._pinned(request)
+        token = _pinned_to_primary.set(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._process_response(request, response, pinned)
+
+    async def _async_call(self, request):
+        pinned = self._pinned(request)
+        # Passed on to the threads the async views query the database in.
+        token = _pinned_to_primary.set(pinned)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pinned_to_primary.reset(token)
+        return self._process_response(request, response, pinned)
+
+    def _pinned(self, request):
+        pinned_until = request.COOKIES.get(PIN_COOKIE, "")
+        return self._writes(request) or (
+            pinned_until.isdigit() and int(pinned_until) > time.time()
+        )
+
+    def _writes(self, request):
+        return request.method in self.UNSAFE_METHODS
+
+    def _process_response(self, request, response, pinned):
+        if response.streaming:
+            # Streamed bodies (e.g. exports) query the database while they are iterated, after
+            # this method returned.
+            response.streaming_content = _pinned_iteration(response.streaming_content, pinned)
+
+        if self._writes(request) and settings.DATABASE_REPLICA_PIN_SECONDS:
+            response.set_cookie(
+                PIN_COOKIE,
+                str(int(time.time()) + settings.DATABASE_REPLICA_PIN_SECONDS),
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+            )
+        return response
+
+
+def _pinned_iteration(content, pinned):
+    """Iterate `content` with the database pinning of its request."""
+    iterator = iter(content)
+    while True:
+        # Set only for each step, the generator runs in the context of whoever iterates it.
+        token = _pinned_to_primary.set(pinned)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _pinned_to_primary.reset(token)
+        yield chunk
+
+
+def close_broken_connections(**kwargs):
+    """Close persistent connections which stopped working, e.g. closed by the database server."""
+    if not settings.DATABASE_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+    # Transactions (`atomic` blocks) take the write lock when they start. A deferred transaction
+    # which reads first - also implicitly, like the FTS5 search index triggers do - fails with
+    # "database is locked" instead of waiting when another connection wrote in the meantime.
+    def begin_immediate():
+        connection.cursor().execute("BEGIN IMMEDIATE")
+
+    connection._start_transaction_under_autocommit = begin_immediate
+
+
+@contextlib.contextmanager
+def import_sqlite_pragmas(connection):
+    """
+    Apply `SQLITE_IMPORT_PRAGMAS` to the connection for the duration of a bulk load, then restore
+    the previous values and checkpoint the write-ahead log. Does nothing for other databases, or
+    inside a transaction, where SQLite doesn't allow changing them.
+    """
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        previous = {}
+        for name, value in settings.SQLITE_IMPORT_PRAGMAS.items():
+            previous[name] = cursor.execute(f"PRAGMA {name}").fetchone()[0]
+            cursor.execute(f"PRAGMA {name} = {value}")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in previous.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
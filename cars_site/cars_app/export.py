@@ -0,0 +1,74 @@
+"""
+Bulk export of the cars and the rates as CSV or NDJSON, served by `GET /export/cars` and
+`GET /export/rates` and written by the `export_cars_rates` command.
+
+Rows are read in the order of their IDs, `EXPORT_CHUNK_SIZE` at a time, each chunk with its own
+query starting after the last exported ID - so memory use does not depend on the number of rows
+and no read transaction is held open for the whole export. Exports can start after a given ID, so
+a periodic job only has to fetch the rows added since its previous run.
+"""
+import csv
+import io
+
+from django.conf import settings
+
+from .models import Car, Rate
+from .responses import json_dumps
+
+# Exported fields of every table; the ID comes first.
+TABLES = {
+    "cars": (Car, ["id", "make", "model", "rating_count", "rating_sum"]),
+    "rates": (Rate, ["id", "car_id", "rating", "created_at"]),
+}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_rows(table, since=0, chunk_size=None):
+    """Rows (tuples of the `TABLES` fields) of the table with an ID above `since`, by ID."""
+    model, fields = TABLES[table]
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    last_id = since
+    while True:
+        rows = list(
+            model.objects.filter(id__gt=last_id).order_by("id").values_list(*fields)[:chunk_size]
+        )
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def export_chunks(table, format, since=0, chunk_size=None):
+    """The export of the table in the given format, as byte strings of up to `chunk_size` rows."""
+    model, fields = TABLES[table]
+    if format == "csv":
+        yield _csv_lines([fields])
+        # Written in the same ISO 8601 format as in NDJSON.
+        datetime_columns = [
+            index
+            for index, field in enumerate(fields)
+            if model._meta.get_field(field).get_internal_type() == "DateTimeField"
+        ]
+    for rows in export_rows(table, since, chunk_size):
+        if not rows:
+            continue
+        if format == "csv":
+            if datetime_columns:
+                rows = [_with_isoformat(row, datetime_columns) for row in rows]
+            yield _csv_lines(rows)
+        else:
+            yield b"".join(json_dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+def _with_isoformat(row, columns):
+    row = list(row)
+    for index in columns:
+        if row[index] is not None:
+            row[index] = row[index].isoformat()
+    return row
+
+
+def _csv_lines(rows):
+    lines = io.StringIO()
+    csv.writer(lines).writerows(rows)
+    return lines.getvalue().encode()
@@ -0,0 +1,210 @@
+"""
+Bulk import of cars and rates from CSV or NDJSON files in the format of the exports (see
+`export.py`), used by the `import_cars_rates` command.
+
+Rows are validated like `POST /cars/batch` and `POST /rate/bulk` validate them, except that the
+external API is never called - cars are checked against the local catalog, or not at all - and
+inserted with `bulk_create` a batch at a time. IDs given in the file are kept, so rates can refer
+to the imported cars. Rejected rows are returned with the reason, for the report of the import.
+"""
+import csv
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connections, router
+from django.utils import timezone
+
+from .catalog import normalize_name
+from .models import Car, CatalogEntry, Rate, is_db_integer
+
+FORMATS = ("csv", "ndjson")
+
+
+def read_rows(file, format):
+    """
+    Rows of an open text file as dicts (CSV needs a header). NDJSON lines which are not valid
+    JSON are returned as they are, to be rejected. Blank lines are skipped.
+    """
+    if format == "csv":
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield line.rstrip("\n")
+
+
+def import_batch(table, rows, check_catalog=True):
+    """
+    Insert the valid cars or rates (`table`) of `rows` - (row number, row) pairs - and return
+    their number and the rejected rows as (row number, row, reason) tuples.
+    """
+    clean, insert = (_clean_car, _insert_cars) if table == "cars" else (_clean_rate, _insert_rates)
+    rejected = []
+    objects = []
+    for number, row in rows:
+        try:
+            objects.append((number, row, clean(row)))
+        except ValidationError as e:
+            rejected.append((number, row, "; ".join(e.messages)))
+
+    if table == "cars":
+        objects = insert(objects, rejected, check_catalog)
+    else:
+        objects = insert(objects, rejected)
+    rejected.sort(key=lambda rejection: rejection[0])
+    return len(objects), rejected
+
+
+def _clean_car(row):
+    if not isinstance(row, dict):
+        raise ValidationError("Row is not an object.")
+    car = Car(id=_optional_id(row), make=row.get("make"), model=row.get("model"))
+    # The keys are set from the names on insert.
+    _clean_fields(car, ["make_key", "model_key"])
+    return car
+
+
+def _clean_rate(row):
+    if not isinstance(row, dict):
+        raise ValidationError("Row is not an object.")
+    rating = row.get("rating")
+    # `clean` would truncate them, like POST /rate/bulk rejects them.
+    if isinstance(rating, bool) or (isinstance(rating, float) and not rating.is_integer()):
+        raise ValidationError("rating has to be an integer.")
+    rate = Rate(
+        id=_optional_id(row),
+        car_id=_integer(row.get("car_id"), "car_id"),
+        rating=rating,
+        created_at=row.get("created_at") or None,
+    )
+    # The car is checked for the whole batch at once. Rates without a time are kept without it,
+    # like the rates made before it was recorded.
+    exclude = ["car"] if rate.created_at else ["car", "created_at"]
+    _clean_fields(rate, exclude)
+    if rate.created_at is not None and timezone.is_naive(rate.created_at):
+        rate.created_at = timezone.make_aware(rate.created_at, timezone.utc)
+    return rate
+
+
+def _clean_fields(obj, exclude=None):
+    try:
+        obj.clean_fields(exclude)
+    except ValidationError as e:
+        raise ValidationError(
+            [f"{field}: {' '.join(messages)}" for field, messages in e.message_dict.items()]
+        )
+
+
+def _optional_id(row):
+    id = row.get("id")
+    return None if id in (None, "") else _integer(id, "id")
+
+
+def _integer(value, name):
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if not is_db_integer(value) or value < 1:
+        raise ValidationError(f"{name} has to be a positive integer.")
+    return value
+
+
+def _insert_cars(cars, rejected, check_catalog):
+    if check_catalog:
+        catalog_keys = set(
+            CatalogEntry.objects.filter(
+                make_key__in={normalize_name(car.make) for _, _, car in cars},
+                model_key__in={normalize_name(car.model) for _, _, car in cars},
+            ).values_list("make_key", "model_key")
+        )
+        cars = _reject(
+            cars,
+            rejected,
+            lambda car: (normalize_name(car.make), normalize_name(car.model)) not in catalog_keys,
+            "The car is not in the catalog.",
+        )
+
+    keys = {Car.name_key(car.make, car.model) for _, _, car in cars}
+    existing_keys = set(
+        Car.objects.filter(
+            make_key__in={make for make, _ in keys}, model_key__in={model for _, model in keys}
+        ).values_list("make_key", "model_key")
+    )
+    cars = _reject_existing(
+        cars, rejected, existing_keys, lambda car: Car.name_key(car.make, car.model), "Car with "
+        "this make and model already exists."
+    )
+    cars = _reject_existing(
+        cars, rejected, _existing_ids(Car, cars), lambda car: car.id, "Car with this ID already "
+        "exists."
+    )
+    Car.objects.bulk_create([car for _, _, car in cars])
+    return cars
+
+
+def _insert_rates(rates, rejected):
+    existing_car_ids = set(
+        Car.objects.filter(id__in={rate.car_id for _, _, rate in rates}).values_list(
+            "id", flat=True
+        )
+    )
+    rates = _reject(
+        rates,
+        rejected,
+        lambda rate: rate.car_id not in existing_car_ids,
+        "The car does not exist.",
+    )
+    rates = _reject_existing(
+        rates, rejected, _existing_ids(Rate, rates), lambda rate: rate.id, "Rate with this ID "
+        "already exists."
+    )
+    Rate.objects.bulk_create(
+        [rate for _, _, rate in rates], batch_size=settings.RATE_BULK_BATCH_SIZE
+    )
+    return rates
+
+
+def _existing_ids(model, objects):
+    ids = {obj.id for _, _, obj in objects if obj.id is not None}
+    return set(model.objects.filter(id__in=ids).values_list("id", flat=True)) if ids else set()
+
+
+def _reject(objects, rejected, is_invalid, reason):
+    valid = []
+    for number, row, obj in objects:
+        if is_invalid(obj):
+            rejected.append((number, row, reason))
+        else:
+            valid.append((number, row, obj))
+    return valid
+
+
+def _reject_existing(objects, rejected, existing, key, reason):
+    """Reject objects whose key (unless None) exists already, or repeats a key of the batch."""
+    valid = []
+    for number, row, obj in objects:
+        obj_key = key(obj)
+        if obj_key in existing:
+            rejected.append((number, row, reason))
+        else:
+            if obj_key is not None:
+                existing.add(obj_key)
+            valid.append((number, row, obj))
+    return valid
+
+
+def reset_sequence(table):
+    """
+    Move the ID sequence of the table past the imported IDs, so the next inserted rows don't get
+    them. Not needed with SQLite, which always continues after the greatest ID.
+    """
+    model = Car if table == "cars" else Rate
+    connection = connections[router.db_for_write(model)]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+            cursor.execute(sql)
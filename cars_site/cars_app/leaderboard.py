@@ -0,0 +1,191 @@
+"""
+In-process leaderboard of the most rated cars, serving `GET /popular/?limit=K` without a query.
+
+Every worker builds it once, from a single query over the rating counts stored on the cars, and
+then updates it from the rating and car deletion signals of its own writes (see
+`models.rating_aggregates_changed` and `models.cars_deleted`): once a write commits, the changed
+cars are read again. Setting the counts read, instead of adding the changes, makes updating with
+a write which the last build already read harmless.
+
+Writes made by other workers are detected with a version number shared through the cache: every
+write increments it, and a worker whose own last write did not bring it to the shared version is
+outdated. Outdated leaderboards are not read - `/popular/` queries the database - until they are
+built again, in the background. Turned on with `LEADERBOARD_ENABLED`.
+
+Only rated cars are kept, ordered like `/popular/` - by descending number of rates, then by id.
+A rated car takes about 300 bytes (measured with `benchmarks.leaderboard`): the sort key tuple and
+its list slot, the dict entry and the name strings - makes are interned, so cars share them.
+"""
+import bisect
+import logging
+import sys
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+
+from .models import DELETE_BATCH_SIZE, Car
+
+log = logging.getLogger(__file__)
+
+VERSION_KEY = "cars:leaderboard-version"
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def shared_version():
+    version = _cache().get(VERSION_KEY)
+    if version is None:
+        _cache().add(VERSION_KEY, 1, timeout=None)
+        version = _cache().get(VERSION_KEY, 1)
+    return version
+
+
+def _bump_shared_version():
+    try:
+        return _cache().incr(VERSION_KEY)
+    except ValueError:
+        # Evicted - rebuilding every leaderboard is always correct.
+        shared_version()
+        return None
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (-rates number, car ID) of every rated car, in the order of `/popular/`.
+        self._keys = []
+        # Car ID -> [rates number, make, model].
+        self._cars = {}
+        self._version = None
+        # Thread building the leaderboard again, while it is outdated.
+        self._rebuild = None
+
+    def build(self):
+        """Load the rating counts of all rated cars, with a single query."""
+        # Read before the cars - a write committed in between makes the leaderboard outdated,
+        # never current with the write missing.
+        version = shared_version()
+        rows = (
+            Car.objects.filter(rating_count__gt=0)
+            .order_by("-rating_count", "id")
+            .values_list("id", "make", "model", "rating_count")
+        )
+        keys = []
+        cars = {}
+        for id, make, model, rates_number in rows.iterator():
+            keys.append((-rates_number, id))
+            cars[id] = [rates_number, sys.intern(make), model]
+        with self._lock:
+            self._keys = keys
+            self._cars = cars
+            self._version = version
+
+    def top(self, limit):
+        """
+        The `limit` most rated cars, as dicts like `/popular/` returns, or None if the
+        leaderboard is outdated (it is then built again in the background) or fewer cars are
+        rated - the rest of the list are cars without rates, only the database knows them.
+        """
+        version = shared_version()
+        with self._lock:
+            if self._version != version:
+                self._rebuild_in_background()
+                return None
+            if limit > len(self._keys):
+                return None
+            return [
+                {"id": id, "make": car[1], "model": car[2], "rates_number": car[0]}
+                for id, car in ((id, self._cars[id]) for _, id in self._keys[:limit])
+            ]
+
+    def apply(self, car_ids, using="default", deleted=False):
+        """
+        Record a committed write of the rates of the given cars, by reading their rates numbers
+        again (a query per `DELETE_BATCH_SIZE` cars), or the deletion of the cars.
+        """
+        with self._lock:
+            version = _bump_shared_version()
+            # Otherwise the leaderboard is outdated anyway (another worker wrote since the last
+            # update) and is built again on the next read.
+            if self._version is None or version != self._version + 1:
+                self._version = None
+                return
+            self._version = version
+
+            # Read holding the lock, so reads of concurrent writes are set in order.
+            rows = {}
+            for start in range(0, 0 if deleted else len(car_ids), DELETE_BATCH_SIZE):
+                rows.update(
+                    (id, (make, model, rates_number))
+                    for id, make, model, rates_number in Car.objects.using(using)
+                    .filter(id__in=car_ids[start:start + DELETE_BATCH_SIZE])
+                    .values_list("id", "make", "model", "rating_count")
+                )
+            for id in car_ids:
+                car = self._cars.get(id)
+                if car is not None:
+                    self._remove(id)
+                if id not in rows:
+                    continue
+                make, model, rates_number = rows[id]
+                car = car or [0, sys.intern(make), model]
+                car[0] = rates_number
+                if rates_number > 0:
+                    self._cars[id] = car
+                    bisect.insort(self._keys, (-rates_number, id))
+
+    def invalidate(self):
+        with self._lock:
+            self._version = None
+
+    def _rebuild_in_background(self):
+        if self._rebuild is not None:
+            return
+
+        def run():
+            try:
+                self.build()
+            except Exception:
+                log.exception("Building the leaderboard failed.")
+            finally:
+                self._rebuild = None
+                # Connections are per thread, this one would never be reused.
+                connections.close_all()
+
+        self._rebuild = threading.Thread(target=run, daemon=True)
+        self._rebuild.start()
+
+    def _remove(self, id):
+        car = self._cars.pop(id)
+        del self._keys[bisect.bisect_left(self._keys, (-car[0], id))]
+
+
+leaderboard = Leaderboard()
+
+
+def invalidate():
+    """Make every worker rebuild its leaderboard, after writes which sent no signals."""
+    _bump_shared_version()
+    leaderboard.invalidate()
+
+
+def on_rating_aggregates_changed(changes, using, **kwargs):
+    if not settings.LEADERBOARD_ENABLED:
+        return
+    car_ids = [
+        car_id for car_id, rating_changes in changes.items() if sum(rating_changes.values())
+    ]
+    if car_ids:
+        transaction.on_commit(lambda: leaderboard.apply(car_ids, using), using=using)
+
+
+def on_cars_deleted(car_ids, using, **kwargs):
+    if not settings.LEADERBOARD_ENABLED:
+        return
+    transaction.on_commit(
+        lambda: leaderboard.apply(list(car_ids), using, deleted=True), using=using
+    )
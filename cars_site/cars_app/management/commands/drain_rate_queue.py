@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cars_app.rate_queue import drain_batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the rates queued by POST /rate/ with RATE_QUEUE_ENABLED, in batches. Runs until "
+        "stopped, waiting RATE_QUEUE_POLL_INTERVAL seconds whenever the queue is empty."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.RATE_QUEUE_BATCH_SIZE,
+            help="Number of rates applied in one transaction.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop once the queue is empty.",
+        )
+
+    def handle(self, *args, **options):
+        applied_total = dropped_total = 0
+        while True:
+            applied, dropped = drain_batch(options["batch_size"])
+            applied_total += applied
+            dropped_total += dropped
+            if applied or dropped:
+                self.stdout.write(
+                    f"Applied {applied} queued rates, dropped {dropped} of deleted cars."
+                )
+                continue
+            if options["once"]:
+                break
+            time.sleep(settings.RATE_QUEUE_POLL_INTERVAL)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Applied {applied_total} queued rates, dropped {dropped_total} of deleted cars."
+            )
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from cars_app.trending import expire_rating_buckets, rebuild_rating_buckets
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the hourly and daily rating buckets older than TRENDING_HOURLY_RETENTION hours "
+        "and TRENDING_DAILY_RETENTION days. Web workers also do it every "
+        "TRENDING_EXPIRY_INTERVAL seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute all the kept buckets from the rates instead.",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            rebuild_rating_buckets()
+            self.stdout.write(self.style.SUCCESS("Rebuilt rating buckets."))
+        else:
+            deleted = expire_rating_buckets()
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired rating buckets."))
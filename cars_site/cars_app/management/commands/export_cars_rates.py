@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from cars_app.export import FORMATS, TABLES, export_chunks
+
+
+class Command(BaseCommand):
+    help = (
+        "Export the cars or the rates as CSV or NDJSON, the same as GET /export/cars and "
+        "GET /export/rates. Rows are read in chunks, so memory use does not grow with the table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=list(TABLES))
+        parser.add_argument("--format", choices=list(FORMATS), default="csv")
+        parser.add_argument(
+            "--since",
+            type=int,
+            default=0,
+            help="Export only the rows with a greater ID, e.g. the last ID of the previous export.",
+        )
+        parser.add_argument(
+            "--output", help="File to write the export to, the standard output by default."
+        )
+
+    def handle(self, *args, **options):
+        chunks = export_chunks(options["table"], options["format"], options["since"])
+        if options["output"] is None:
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending="")
+            return
+
+        with open(options["output"], "wb") as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stdout.write(
+            self.style.SUCCESS(f"Exported {options['table']} to {options['output']}.")
+        )
@@ -0,0 +1,149 @@
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from cars_app import leaderboard
+from cars_app.cache import data_changed
+from cars_app.models import RATINGS, Car, Rate, RatingBucket, rating_count_field
+
+# Relative frequency of ratings 1-5 - like in most rating systems, high ratings are the most common.
+RATING_WEIGHTS = [8, 6, 12, 30, 44]
+# Filled once all the rates are inserted.
+AGGREGATE_FIELDS = ["rating_sum", "rating_count"] + [rating_count_field(r) for r in RATINGS]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic dataset of cars and rates for benchmarking. The same arguments "
+        "always give the same data (with creation times of rates relative to now). Rates are "
+        "spread over the cars with a power-law skew, so a few cars get most of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cars", type=int, default=10_000, help="Number of cars to create.")
+        parser.add_argument(
+            "--rates", type=int, default=100_000, help="Number of rates to create."
+        )
+        parser.add_argument("--makes", type=int, default=100, help="Number of distinct makes.")
+        parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator.")
+        parser.add_argument(
+            "--skew",
+            type=float,
+            default=3.0,
+            help="How much rates concentrate on the first cars (1 - spread evenly).",
+        )
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=30,
+            help="Rates are created evenly over this many days before now.",
+        )
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument(
+            "--clear", action="store_true", help="Delete all existing cars and rates first."
+        )
+
+    def handle(self, *args, **options):
+        if options["rates"] and not options["cars"]:
+            raise CommandError("Rates need at least one car to be generated.")
+
+        self.verbosity = options["verbosity"]
+        started_at = time.perf_counter()
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+
+        if options["clear"]:
+            # Deleted with plain queries - there are no aggregates to maintain for removed cars.
+            with transaction.atomic():
+                models.QuerySet(Rate).delete()
+                Car.objects.all().delete()
+
+        first_id = (Car.objects.aggregate(max_id=models.Max("id"))["max_id"] or 0) + 1
+        cars_number = options["cars"]
+        zero_aggregates = [0] * len(AGGREGATE_FIELDS)
+        for start in range(0, cars_number, batch_size):
+            ids = range(first_id + start, first_id + min(start + batch_size, cars_number))
+            self._insert(
+                Car,
+                ["id", "make", "model", "make_key", "model_key", *AGGREGATE_FIELDS],
+                (
+                    (id, make, model, *Car.name_key(make, model), *zero_aggregates)
+                    for id, make, model in (
+                        (id, f"Make-{id % options['makes']}", f"Model-{id}") for id in ids
+                    )
+                ),
+            )
+            self._progress("cars", start + len(ids), cars_number)
+
+        rates_number = options["rates"]
+        # Naive UTC times, written as text like Django does.
+        now = timezone.now().replace(tzinfo=None)
+        history_seconds = options["days"] * 24 * 3600
+        buckets = Counter()
+        retained_since = {
+            granularity: RatingBucket.retained_since(granularity).replace(tzinfo=None)
+            for granularity in (RatingBucket.HOUR, RatingBucket.DAY)
+        }
+        for start in range(0, rates_number, batch_size):
+            count = min(batch_size, rates_number - start)
+            ratings = rng.choices(range(1, 6), weights=RATING_WEIGHTS, k=count)
+            rows = []
+            for rating in ratings:
+                car_id = first_id + int(cars_number * rng.random() ** options["skew"])
+                created_at = now - timedelta(seconds=history_seconds * rng.random())
+                rows.append((car_id, rating, str(created_at)))
+
+                hour = created_at.replace(minute=0, second=0, microsecond=0)
+                if hour >= retained_since[RatingBucket.HOUR]:
+                    buckets[RatingBucket.HOUR, hour, car_id] += 1
+                day = hour.replace(hour=0)
+                if day >= retained_since[RatingBucket.DAY]:
+                    buckets[RatingBucket.DAY, day, car_id] += 1
+
+            self._insert(Rate, ["car_id", "rating", "created_at"], rows)
+            self._progress("rates", start + count, rates_number)
+
+        bucket_rows = [
+            (granularity, str(bucket_start), car_id, number)
+            for (granularity, bucket_start, car_id), number in buckets.items()
+        ]
+        for start in range(0, len(bucket_rows), batch_size):
+            self._insert(
+                RatingBucket,
+                ["granularity", "start", "car_id", "rates_number"],
+                bucket_rows[start:start + batch_size],
+            )
+
+        # Aggregates are computed once for all the rates.
+        with transaction.atomic():
+            Car.objects.filter(id__gte=first_id).rebuild_rating_aggregates()
+            data_changed()
+            transaction.on_commit(leaderboard.invalidate)
+
+        if self.verbosity:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Generated {cars_number} cars and {rates_number} rates in "
+                    f"{time.perf_counter() - started_at:.1f}s."
+                )
+            )
+
+    @staticmethod
+    def _insert(model, columns, rows):
+        # Plain SQL - creating model instances would take most of the time for large datasets.
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns_sql = ", ".join(connection.ops.quote_name(column) for column in columns)
+        placeholders = ", ".join(["%s"] * len(columns))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} ({columns_sql}) VALUES ({placeholders})", rows
+            )
+
+    def _progress(self, name, done, total):
+        if self.verbosity > 1:
+            self.stdout.write(f"{name}: {done}/{total}")
@@ -0,0 +1,127 @@
+import itertools
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from cars_app.cache import data_changed
+from cars_app.catalog import add_to_catalog, read_snapshot
+from cars_app.db import import_sqlite_pragmas
+from cars_app.importer import FORMATS, import_batch, read_rows, reset_sequence
+from cars_app.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Import cars or rates from a CSV or NDJSON file in the format of export_cars_rates, in "
+        "batches of one transaction each. An interrupted import continues from its checkpoint, the "
+        "last committed batch, when run again with the same file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=["cars", "rates"])
+        parser.add_argument("path", help="File to import.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Format of the file, by default taken from its extension.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.IMPORT_BATCH_SIZE,
+            help="Number of rows imported in one transaction.",
+        )
+        parser.add_argument(
+            "--validate",
+            choices=["catalog", "skip"],
+            default="catalog",
+            help="Check the imported cars against the local catalog, or not at all. The external "
+            "API is never called.",
+        )
+        parser.add_argument(
+            "--catalog-snapshot",
+            help="Catalog snapshot (JSON or CSV, as for sync_catalog --file) to add to the catalog "
+            "first.",
+        )
+        parser.add_argument(
+            "--rejects",
+            help="File to write the rejected rows to, as NDJSON with the row number and the reason."
+            " <path>.rejected.ndjson by default.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Name of the checkpoint of the import, by default the table and the file path.",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Import the file from the start, ignoring the checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        table, path = options["table"], options["path"]
+        format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in FORMATS:
+            raise CommandError(f"Unknown format of {path}, use --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size has to be positive.")
+
+        if options["catalog_snapshot"]:
+            added = add_to_catalog(read_snapshot(options["catalog_snapshot"]))
+            self.stdout.write(f"Loaded {added} catalog entries.")
+
+        name = options["checkpoint"] or f"{table}:{os.path.abspath(path)}"[-255:]
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(name=name)
+        if options["restart"]:
+            checkpoint.rows = 0
+            checkpoint.save()
+        if checkpoint.rows:
+            self.stdout.write(f"Resuming after {checkpoint.rows} rows.")
+
+        rejects_path = options["rejects"] or f"{path}.rejected.ndjson"
+        # A resumed import adds to the rejects of the previous run.
+        rejects_mode = "a" if checkpoint.rows else "w"
+        imported_total = rejected_total = 0
+        started_at = time.perf_counter()
+
+        with open(path, newline="", encoding="utf-8") as file, import_sqlite_pragmas(connection):
+            rows = itertools.islice(enumerate(read_rows(file, format), 1), checkpoint.rows, None)
+            while True:
+                batch = list(itertools.islice(rows, options["batch_size"]))
+                if not batch:
+                    break
+                with transaction.atomic():
+                    imported, rejected = import_batch(
+                        table, batch, check_catalog=options["validate"] == "catalog"
+                    )
+                    checkpoint.rows = batch[-1][0]
+                    checkpoint.save()
+                    if imported:
+                        data_changed()
+
+                if rejected:
+                    with open(rejects_path, rejects_mode, encoding="utf-8") as rejects:
+                        for number, row, reason in rejected:
+                            rejects.write(
+                                json.dumps({"row": number, "reason": reason, "data": row}) + "\n"
+                            )
+                    rejects_mode = "a"
+                imported_total += imported
+                rejected_total += len(rejected)
+                rows_per_second = (imported_total + rejected_total) / (
+                    time.perf_counter() - started_at
+                )
+                self.stdout.write(
+                    f"{checkpoint.rows} rows: imported {imported_total}, rejected "
+                    f"{rejected_total}, {rows_per_second:.0f} rows/s."
+                )
+
+        reset_sequence(table)
+        message = f"Imported {imported_total} {table}, rejected {rejected_total}"
+        if rejected_total:
+            message += f" (see {rejects_path})"
+        self.stdout.write(self.style.SUCCESS(message + "."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from cars_app import leaderboard
+from cars_app.cache import data_changed
+from cars_app.models import RATINGS, Car, rating_count_field
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the rating sum, count and histogram stored on every car from its rates, "
+        "repairing any drift. With --verify only report the cars whose aggregates are wrong."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Do not change anything, fail if any car has wrong aggregates.",
+        )
+
+    def handle(self, *args, **options):
+        if options["verify"]:
+            fields = ["rating_sum", "rating_count"] + [
+                rating_count_field(rating) for rating in RATINGS
+            ]
+            drifted = Car.objects.with_drifted_rating_aggregates().values(
+                "id", *fields, *(f"actual_{field}" for field in fields)
+            )
+            for car in drifted:
+                differences = ", ".join(
+                    f"{field} stored={car[field]} actual={car[f'actual_{field}']}"
+                    for field in fields
+                    if car[field] != car[f"actual_{field}"]
+                )
+                self.stdout.write(f"Car {car['id']}: {differences}")
+            if drifted:
+                raise CommandError(f"{len(drifted)} cars have wrong rating aggregates.")
+            self.stdout.write(self.style.SUCCESS("Rating aggregates of all cars are correct."))
+
+        else:
+            with transaction.atomic():
+                cars_number = Car.objects.rebuild_rating_aggregates()
+                data_changed()
+                transaction.on_commit(leaderboard.invalidate)
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt rating aggregates of {cars_number} cars.")
+            )
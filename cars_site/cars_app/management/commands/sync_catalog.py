@@ -0,0 +1,103 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cars_app.catalog import add_to_catalog, normalize_name, read_snapshot
+from cars_app.models import CatalogEntry
+from cars_app.validation import VpicUnavailable, vpic_client
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the make/model catalog of the external API into the local database, either from "
+        "the live API or from a JSON/CSV snapshot. Pairs already in the catalog are skipped, so "
+        "the command can be re-run to sync the catalog incrementally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--file", help="Snapshot file (.json or .csv) to load instead of calling the API."
+        )
+        parser.add_argument(
+            "--make",
+            action="append",
+            default=[],
+            help="Sync only models of this make from the API. Can be given multiple times.",
+        )
+        parser.add_argument(
+            "--only-new-makes",
+            action="store_true",
+            help="Skip makes which already have models in the catalog.",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Remove models of the synced makes which are no longer in the source.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of concurrent requests made to the API.",
+        )
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            models_by_make = defaultdict(list)
+            for make, model in read_snapshot(options["file"]):
+                models_by_make[make].append(model)
+        else:
+            models_by_make = self._fetch_models_by_make(options)
+
+        if options["only_new_makes"]:
+            known_makes = set(
+                CatalogEntry.objects.values_list("make_key", flat=True).distinct()
+            )
+            models_by_make = {
+                make: models
+                for make, models in models_by_make.items()
+                if normalize_name(make) not in known_makes
+            }
+
+        entries_before = CatalogEntry.objects.count()
+        add_to_catalog(
+            (make, model) for make, models in models_by_make.items() for model in models
+        )
+        added = CatalogEntry.objects.count() - entries_before
+
+        removed = 0
+        if options["prune"]:
+            removed = self._prune(models_by_make)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Synced {len(models_by_make)} makes: {added} models added, {removed} removed."
+            )
+        )
+
+    def _fetch_models_by_make(self, options):
+        try:
+            makes = options["make"] or vpic_client.get_make_names()
+        except VpicUnavailable as e:
+            raise CommandError(f"Could not fetch makes from the external API: {e}")
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            try:
+                models = list(executor.map(vpic_client.get_model_names, makes))
+            except VpicUnavailable as e:
+                raise CommandError(f"Could not fetch models from the external API: {e}")
+
+        return dict(zip(makes, models))
+
+    @staticmethod
+    def _prune(models_by_make):
+        removed = 0
+        for make, models in models_by_make.items():
+            deleted, _ = (
+                CatalogEntry.objects.filter(make_key=normalize_name(make))
+                .exclude(model_key__in={normalize_name(model) for model in models})
+                .delete()
+            )
+            removed += deleted
+        return removed
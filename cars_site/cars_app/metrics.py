@@ -0,0 +1,154 @@
+"""
+Prometheus metrics of the views and of the external API calls, exposed at `/metrics`.
+
+With `PROMETHEUS_MULTIPROC_DIR` set (it has to be set before the workers start), every worker
+process writes its samples to memory-mapped files in that directory and `/metrics` sums up the
+files of all workers, so the result does not depend on which worker answers the scrape.
+"""
+import asyncio
+import contextvars
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+REQUEST_DURATION = Histogram(
+    "cars_http_request_duration_seconds",
+    "Time of handling a request, by view.",
+    ["view", "method"],
+)
+RESPONSES = Counter(
+    "cars_http_responses",
+    "Returned responses, by view and status code.",
+    ["view", "method", "status"],
+)
+DB_QUERIES = Counter(
+    "cars_db_queries",
+    "SQL queries made while handling requests, by view.",
+    ["view"],
+)
+DB_QUERY_DURATION = Counter(
+    "cars_db_query_duration_seconds",
+    "Time spent in SQL queries while handling requests, by view.",
+    ["view"],
+)
+VPIC_REQUEST_DURATION = Histogram(
+    "cars_vpic_request_duration_seconds",
+    "Time of external API calls, by API operation.",
+    ["operation"],
+)
+VPIC_ERRORS = Counter(
+    "cars_vpic_errors",
+    "External API calls which failed (or were not made, with the circuit open), by reason.",
+    ["operation", "reason"],
+)
+
+# Label of requests which did not reach any view (e.g. 404s).
+UNMATCHED_VIEW = "none"
+
+# Stats of the SQL queries of the current request. A context variable, unlike the connections it
+# is passed on to the threads async views query the database in.
+_query_stats = contextvars.ContextVar("query_stats", default=None)
+
+
+def render():
+    """Return the current metrics in the Prometheus text format and their content type."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def view_name(view_func):
+    view_class = getattr(view_func, "view_class", None)
+    if view_class is None:
+        return view_func.__name__
+    # Async views are labeled like the sync views they extend, see `async_views.AsyncViewMixin`.
+    return getattr(view_class, "sync_view_class", view_class).__name__
+
+
+class _QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def record_queries(sender, connection, **kwargs):
+    """Make the connection count its queries into the stats of the current request."""
+    # Sent again whenever the same connection object reconnects.
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _record_query(execute, sql, params, many, context):
+    queries = _query_stats.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.duration += time.perf_counter() - start
+        queries.count += 1
+
+
+class MetricsMiddleware:
+    """Records latency, status code and SQL queries of every request, labeled with its view."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django see the middleware as async and await it in the event loop.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self._async_call(request)
+        request.metrics_view = UNMATCHED_VIEW
+        queries = _QueryStats()
+        token = _query_stats.set(queries)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def _async_call(self, request):
+        request.metrics_view = UNMATCHED_VIEW
+        queries = _QueryStats()
+        token = _query_stats.set(queries)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    @staticmethod
+    def _record(request, response, duration, queries):
+        # The duration is without the time of sending the content of streamed responses.
+        view = request.metrics_view
+        REQUEST_DURATION.labels(view, request.method).observe(duration)
+        RESPONSES.labels(view, request.method, response.status_code).inc()
+        if queries.count:
+            DB_QUERIES.labels(view).inc(queries.count)
+            DB_QUERY_DURATION.labels(view).inc(queries.duration)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_name(view_func)
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0002_correct_rate_foreign_key_car_column'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('make', models.CharField(max_length=100)),
+                ('model', models.CharField(max_length=100)),
+                ('make_key', models.CharField(max_length=100)),
+                ('model_key', models.CharField(max_length=100)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='catalogentry',
+            constraint=models.UniqueConstraint(fields=('make_key', 'model_key'), name='unique_catalog_make_model'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:14
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def compute_rating_aggregates(apps, schema_editor):
+    Car = apps.get_model('cars_app', 'Car')
+    Rate = apps.get_model('cars_app', 'Rate')
+
+    def rates_aggregate(aggregate):
+        return Subquery(
+            Rate.objects.filter(car=OuterRef('pk'))
+            .order_by()
+            .values('car')
+            .annotate(value=aggregate)
+            .values('value')
+        )
+
+    Car.objects.using(schema_editor.connection.alias).update(
+        rating_sum=Coalesce(rates_aggregate(Sum('rating')), 0),
+        rating_count=Coalesce(rates_aggregate(Count('id')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0003_catalogentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compute_rating_aggregates, migrations.RunPython.noop),
+    ]
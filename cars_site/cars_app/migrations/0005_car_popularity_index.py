@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0004_car_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['-rating_count', 'id'], name='car_popularity_idx'),
+        ),
+    ]
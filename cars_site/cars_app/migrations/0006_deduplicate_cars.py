@@ -0,0 +1,71 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:21
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+BATCH_SIZE = 500
+
+
+def normalize_name(name):
+    # `models.normalize_name` at the time of this migration.
+    return " ".join(name.split()).casefold()
+
+
+def deduplicate_cars(apps, schema_editor):
+    """
+    Set the name keys of the cars and merge cars whose names differ only in letter case or
+    whitespace into the one with the lowest id, moving the rates of the others to it, so the
+    unique constraint on the keys can be added.
+    """
+    Car = apps.get_model('cars_app', 'Car')
+    Rate = apps.get_model('cars_app', 'Rate')
+    db_alias = schema_editor.connection.alias
+
+    ids_by_key = defaultdict(list)
+    batch = []
+    for car in Car.objects.using(db_alias).order_by('id').only('id', 'make', 'model').iterator():
+        car.make_key, car.model_key = normalize_name(car.make), normalize_name(car.model)
+        ids_by_key[car.make_key, car.model_key].append(car.id)
+        batch.append(car)
+        if len(batch) >= BATCH_SIZE:
+            Car.objects.using(db_alias).bulk_update(batch, ['make_key', 'model_key'])
+            batch = []
+    Car.objects.using(db_alias).bulk_update(batch, ['make_key', 'model_key'])
+
+    for kept_id, *duplicate_ids in ids_by_key.values():
+        if not duplicate_ids:
+            continue
+        merged = Car.objects.using(db_alias).filter(id__in=duplicate_ids).aggregate(
+            rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count')
+        )
+        Rate.objects.using(db_alias).filter(car__in=duplicate_ids).update(car=kept_id)
+        Car.objects.using(db_alias).filter(id=kept_id).update(
+            rating_sum=F('rating_sum') + merged['rating_sum'],
+            rating_count=F('rating_count') + merged['rating_count'],
+        )
+        Car.objects.using(db_alias).filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0005_car_popularity_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='make_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='model_key',
+            field=models.CharField(default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(deduplicate_cars, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0006_deduplicate_cars'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['make', 'model'], name='car_make_model_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='car',
+            constraint=models.UniqueConstraint(fields=('make_key', 'model_key'), name='unique_car_make_model_key'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def compute_rating_histograms(apps, schema_editor):
+    Car = apps.get_model('cars_app', 'Car')
+    Rate = apps.get_model('cars_app', 'Rate')
+
+    def rates_number(rating):
+        return Subquery(
+            Rate.objects.filter(car=OuterRef('pk'))
+            .order_by()
+            .values('car')
+            .annotate(value=Count('id', filter=Q(rating=rating)))
+            .values('value')
+        )
+
+    Car.objects.using(schema_editor.connection.alias).update(
+        **{
+            f'rating_{rating}_count': Coalesce(rates_number(rating), 0)
+            for rating in range(1, 6)
+        }
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0007_car_unique_make_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='car',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compute_rating_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.1.7 on 2026-10-18 04:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0008_car_rating_histogram'),
+    ]
+
+    operations = [
+        # Existing rates are left without a timestamp (NULL) - the default is only added to the
+        # state, as it is applied by Django, not by the database.
+        migrations.AddField(
+            model_name='rate',
+            name='created_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='rate',
+                    name='created_at',
+                    field=models.DateTimeField(default=django.utils.timezone.now, null=True),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RatingBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'hour'), ('day', 'day')], max_length=4)),
+                ('start', models.DateTimeField()),
+                ('rates_number', models.PositiveIntegerField(default=0)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cars_app.car')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ratingbucket',
+            constraint=models.UniqueConstraint(fields=('granularity', 'start', 'car'), name='unique_rating_bucket'),
+        ),
+    ]
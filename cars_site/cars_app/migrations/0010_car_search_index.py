@@ -0,0 +1,79 @@
+from django.db import migrations
+
+# Also named in `search.SEARCH_TABLE`.
+SEARCH_TABLE = 'cars_app_car_search'
+
+# External content FTS5 table - it only stores the index, the names are read from the car table.
+# Prefix indexes of 1-3 characters make the short typeahead prefixes cheap.
+SQLITE_CREATE = [
+    f"""
+    CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(
+        make, model,
+        content='cars_app_car', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='1 2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON cars_app_car BEGIN
+        INSERT INTO {SEARCH_TABLE} (rowid, make, model) VALUES (new.id, new.make, new.model);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON cars_app_car BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, make, model)
+        VALUES ('delete', old.id, old.make, old.model);
+    END
+    """,
+    # Only renames - the rating aggregates of the cars are updated on every rate.
+    f"""
+    CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF make, model ON cars_app_car BEGIN
+        INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, make, model)
+        VALUES ('delete', old.id, old.make, old.model);
+        INSERT INTO {SEARCH_TABLE} (rowid, make, model) VALUES (new.id, new.make, new.model);
+    END
+    """,
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+]
+# Other databases search by prefixes of the names (see `search.search_cars`). PostgreSQL compares
+# them upper-cased, so it needs expression indexes; MySQL uses the (make, model) index.
+POSTGRESQL_CREATE = [
+    'CREATE INDEX car_make_prefix_idx ON cars_app_car (UPPER("make"::text) text_pattern_ops)',
+    'CREATE INDEX car_model_prefix_idx ON cars_app_car (UPPER("model"::text) text_pattern_ops)',
+]
+POSTGRESQL_DROP = [
+    "DROP INDEX IF EXISTS car_make_prefix_idx",
+    "DROP INDEX IF EXISTS car_model_prefix_idx",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Search index of the car makes and models. On SQLite the triggers are tied to the car table -
+    a later migration which makes SQLite rebuild that table drops them, so it has to create them
+    again.
+    """
+
+    dependencies = [
+        ('cars_app', '0009_rate_created_at_ratingbucket'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}),
+            run_for_vendor({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 05:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars_app', '0010_car_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedRate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('car_id', models.IntegerField()),
+                ('rating', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,14 +1,492 @@
-from django.db import models
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce, NullIf, TruncHour
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.dispatch import Signal
+from django.utils import timezone
+
+MIN_RATING = 1
+MAX_RATING = 5
+RATINGS = range(MIN_RATING, MAX_RATING + 1)
+
+# Range of the integers the database can be queried with - greater ones make the driver fail
+# (SQLite raises OverflowError) instead of just matching nothing.
+MIN_DB_INTEGER = -(2**63)
+MAX_DB_INTEGER = 2**63 - 1
+
+
+def is_db_integer(value):
+    """Whether `value` is an int (not a bool) the database can be queried with."""
+    return (
+        isinstance(value, int)
+        and not isinstance(value, bool)
+        and MIN_DB_INTEGER <= value <= MAX_DB_INTEGER
+    )
+
+
+# Number of cars deleted with a single query - SQLite limits the number of query parameters.
+DELETE_BATCH_SIZE = 500
+
+# Sent with `changes` (see `_apply_rating_changes`) and `using` once rating aggregates of cars
+# are updated, and with `car_ids` and `using` once cars are deleted by `CarQuerySet.delete`.
+# Both are sent inside the transaction of the write.
+rating_aggregates_changed = Signal()
+cars_deleted = Signal()
+
+
+def normalize_name(name: str) -> str:
+    """Make names differing only in letter case or whitespace compare equal."""
+    return " ".join(name.split()).casefold()
+
+
+def rating_count_field(rating):
+    """Name of the `Car` field counting the rates with the given rating."""
+    if rating not in RATINGS:
+        raise ValueError(f"Rating has to be between {MIN_RATING} and {MAX_RATING}, not {rating}.")
+    return f"rating_{rating}_count"
+
+
+class CarQuerySet(models.QuerySet):
+    def with_avg_rating(self):
+        # NULL for cars without rates, like `Avg` would give.
+        return self.annotate(
+            avg_rating=ExpressionWrapper(
+                Cast("rating_sum", FloatField()) / NullIf("rating_count", 0),
+                output_field=FloatField(),
+            )
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for car in objs:
+            car.set_name_keys()
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def rebuild_rating_aggregates(self):
+        """Recompute rating aggregates of the cars from their rates. Return number of cars."""
+        return self.update(**_actual_rating_aggregates())
+
+    def with_drifted_rating_aggregates(self):
+        """Cars whose rating aggregates do not match their rates."""
+        actual = _actual_rating_aggregates()
+        drifted = Q()
+        for field in actual:
+            drifted |= ~Q(**{field: F(f"actual_{field}")})
+        return self.annotate(
+            **{f"actual_{field}": value for field, value in actual.items()}
+        ).filter(drifted)
+
+    def delete(self):
+        """
+        Delete the cars together with their rates and rating buckets, with one set-based DELETE
+        per table - unlike Django's collector, which would load the related rows of cars with
+        signal receivers or custom deletion into memory first. Deletion signals are not sent.
+        """
+        assert not self.query.is_sliced, "Cannot use 'limit' or 'offset' with delete."
+        self._for_write = True
+        deleted = Counter({Car._meta.label: 0})
+        # Read first, the filters of the queryset could depend on the deleted rates.
+        car_ids = list(self.order_by().values_list("pk", flat=True))
+        with transaction.atomic(using=self.db, savepoint=False):
+            for start in range(0, len(car_ids), DELETE_BATCH_SIZE):
+                batch = car_ids[start:start + DELETE_BATCH_SIZE]
+                for model in (Rate, RatingBucket, Car):
+                    rows = models.QuerySet(model, using=self.db).filter(
+                        **{"pk__in" if model is Car else "car_id__in": batch}
+                    )
+                    deleted[model._meta.label] += rows._raw_delete(self.db)
+        if deleted[Car._meta.label]:
+            cars_deleted.send(sender=Car, car_ids=car_ids, using=self.db)
+        return sum(deleted.values()), dict(deleted)
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
+def _actual_rating_aggregates():
+    """Expressions computing every rating aggregate field of a car from its rates."""
+    aggregates = {"rating_sum": Sum("rating"), "rating_count": Count("id")}
+    for rating in RATINGS:
+        aggregates[rating_count_field(rating)] = Count("id", filter=Q(rating=rating))
+    return {
+        field: Coalesce(Subquery(_rates_aggregate(aggregate)), 0)
+        for field, aggregate in aggregates.items()
+    }
+
+
+def _rates_aggregate(aggregate):
+    return (
+        Rate.objects.filter(car=OuterRef("pk"))
+        .order_by()
+        .values("car")
+        .annotate(value=aggregate)
+        .values("value")
+    )
 
 
 class Car(models.Model):
     make = models.CharField(max_length=30)
     model = models.CharField(max_length=30)
+    # Normalized make and model (see `normalize_name`), set on save and `bulk_create` - cars are
+    # unique by them, like the catalog checks them. Case folding can make names longer.
+    make_key = models.CharField(max_length=100, editable=False)
+    model_key = models.CharField(max_length=100, editable=False)
+    # Aggregates of the car rates, kept up to date by `Rate` and `RateQuerySet` on every write,
+    # so listing cars does not need to scan the rates.
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Histogram of the ratings - number of rates with every possible rating.
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    objects = CarQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["make_key", "model_key"], name="unique_car_make_model_key"
+            ),
+        ]
+        indexes = [
+            # Finds cars by the names as they were given, e.g. for the search on MySQL.
+            models.Index(fields=["make", "model"], name="car_make_model_idx"),
+            # Lets the most popular cars be read in order, without sorting the whole table.
+            models.Index(fields=["-rating_count", "id"], name="car_popularity_idx"),
+        ]
+
+    @staticmethod
+    def name_key(make, model):
+        """The (make, model) pair cars are unique by."""
+        return normalize_name(make), normalize_name(model)
+
+    def set_name_keys(self):
+        self.make_key, self.model_key = self.name_key(self.make, self.model)
+
+    def save(self, *args, **kwargs):
+        self.set_name_keys()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"make", "model"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "make_key", "model_key"}
+        super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        """Delete the car with its rates and rating buckets, see `CarQuerySet.delete`."""
+        using = using or router.db_for_write(Car, instance=self)
+        return Car.objects.using(using).filter(pk=self.pk).delete()
+
+    @property
+    def rating_histogram(self):
+        """Number of rates with every rating, from the lowest rating."""
+        return {rating: getattr(self, rating_count_field(rating)) for rating in RATINGS}
+
+    def rating_distribution(self, percentiles=(25, 75, 90)):
+        """
+        Number of rates with every rating and statistics of the ratings, computed from the
+        histogram. Percentiles use the nearest-rank method. The statistics are None for cars
+        without rates.
+        """
+        histogram = self.rating_histogram
+        count = sum(histogram.values())
+
+        def nth_rating(rank):
+            # Rating of the `rank`-th (from 1) lowest rate.
+            seen = 0
+            for rating, rating_count in histogram.items():
+                seen += rating_count
+                if seen >= rank:
+                    return rating
+
+        statistics = {"mean": None, "median": None}
+        statistics.update({f"p{percentile}": None for percentile in percentiles})
+        if count:
+            statistics["mean"] = sum(r * n for r, n in histogram.items()) / count
+            statistics["median"] = (nth_rating((count + 1) // 2) + nth_rating(count // 2 + 1)) / 2
+            for percentile in percentiles:
+                rank = max(math.ceil(percentile / 100 * count), 1)
+                statistics[f"p{percentile}"] = nth_rating(rank)
+
+        return {
+            "car_id": self.id,
+            "count": count,
+            "counts": {str(rating): rating_count for rating, rating_count in histogram.items()},
+            **statistics,
+        }
+
+
+class RateQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            changes = defaultdict(Counter)
+            bucket_changes = Counter()
+            for rate in objs:
+                changes[rate.car_id][int(rate.rating)] += 1
+                if rate.created_at is not None:
+                    bucket_changes[rate.car_id, rate.created_at] += 1
+            _apply_rating_changes(changes, self.db)
+            _apply_bucket_changes(bucket_changes, self.db)
+        return objs
+
+    def delete(self):
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            removed = self.order_by().values("car_id", "rating").annotate(rates_number=Count("id"))
+            changes = defaultdict(Counter)
+            for row in removed:
+                changes[row["car_id"]][row["rating"]] -= row["rates_number"]
+            removed_by_hour = (
+                self.order_by()
+                .filter(created_at__gte=RatingBucket.retained_since(RatingBucket.DAY))
+                .values("car_id", hour=TruncHour("created_at"))
+                .annotate(rates_number=Count("id"))
+            )
+            bucket_changes = Counter(
+                {(row["car_id"], row["hour"]): -row["rates_number"] for row in removed_by_hour}
+            )
+            deleted = super().delete()
+            _apply_rating_changes(changes, self.db)
+            _apply_bucket_changes(bucket_changes, self.db)
+        return deleted
+
+    delete.alters_data = True
+    delete.queryset_only = True
 
 
 class Rate(models.Model):
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
-    rating = models.IntegerField(validators=[MaxValueValidator(5), MinValueValidator(1)])
+    rating = models.IntegerField(
+        validators=[MaxValueValidator(MAX_RATING), MinValueValidator(MIN_RATING)]
+    )
+    # NULL for rates created before the rates were timestamped.
+    created_at = models.DateTimeField(default=timezone.now, null=True)
+
+    objects = RateQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(Rate, instance=self)
+        with transaction.atomic(using=using):
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Rate.objects.using(using)
+                    .filter(pk=self.pk)
+                    .values("car_id", "rating", "created_at")
+                    .first()
+                )
+            super().save(*args, **kwargs)
+
+            changes = defaultdict(Counter)
+            bucket_changes = Counter()
+            if previous is not None:
+                changes[previous["car_id"]][previous["rating"]] -= 1
+                if previous["created_at"] is not None:
+                    bucket_changes[previous["car_id"], previous["created_at"]] -= 1
+            changes[self.car_id][int(self.rating)] += 1
+            if self.created_at is not None:
+                bucket_changes[self.car_id, self.created_at] += 1
+            _apply_rating_changes(changes, using)
+            _apply_bucket_changes(bucket_changes, using)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(Rate, instance=self)
+        with transaction.atomic(using=using):
+            deleted = super().delete(*args, **kwargs)
+            _apply_rating_changes({self.car_id: {int(self.rating): -1}}, using)
+            if self.created_at is not None:
+                _apply_bucket_changes({(self.car_id, self.created_at): -1}, using)
+        return deleted
+
+
+class QueuedRate(models.Model):
+    """
+    A rate accepted by `POST /rate/` with `RATE_QUEUE_ENABLED`, not applied yet. Queued rates are
+    moved to the rates in batches by the `drain_rate_queue` command, see `rate_queue.py`.
+    """
+
+    # Not a foreign key - the car can be deleted before its rate is applied.
+    car_id = models.IntegerField()
+    rating = models.PositiveSmallIntegerField()
+    # Time of the request, which becomes the time of the rate.
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = models.Manager()
+
+
+def _apply_rating_changes(changes, using):
+    """
+    Update rating aggregates of the cars. `changes` maps car ID to the change of the number of its
+    rates with every rating (`{rating: count change}`).
+
+    Rates removed by deleting their car (cascade) are not passed here - the car, together with its
+    aggregates, is gone.
+
+    :raises ValueError: for ratings out of the allowed range, which have no histogram field.
+    """
+    rows = []
+    for car_id, count_changes in changes.items():
+        count_changes = {rating: n for rating, n in count_changes.items() if n}
+        for rating in count_changes:
+            rating_count_field(rating)
+        if count_changes:
+            rows.append(
+                (
+                    sum(r * n for r, n in count_changes.items()),
+                    sum(count_changes.values()),
+                    *(count_changes.get(rating, 0) for rating in RATINGS),
+                    car_id,
+                )
+            )
+    if rows:
+        _increment_many(
+            Car,
+            ["rating_sum", "rating_count"] + [rating_count_field(r) for r in RATINGS],
+            ["id"],
+            rows,
+            using,
+        )
+        rating_aggregates_changed.send(sender=Car, changes=changes, using=using)
+
+
+def _increment_many(model, fields, key_fields, rows, using):
+    """
+    Add to `fields` of the rows of `model` found by `key_fields`, for every tuple of `rows` (the
+    increments followed by the key values). A single statement is executed for all the rows, so
+    it is not compiled again for every one, as `QuerySet.update` would be.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    key_fields = [model._meta.get_field(name) for name in key_fields]
+    increments = ", ".join(
+        "{0} = {0} + %s".format(quote(model._meta.get_field(name).column)) for name in fields
+    )
+    conditions = " AND ".join(f"{quote(field.column)} = %s" for field in key_fields)
+    params = [
+        (
+            *row[: len(fields)],
+            *(
+                field.get_db_prep_value(value, connection)
+                for field, value in zip(key_fields, row[len(fields):])
+            ),
+        )
+        for row in rows
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(model._meta.db_table)} SET {increments} WHERE {conditions}", params
+        )
+
+
+class RatingBucket(models.Model):
+    """
+    Number of rates a car got in an hour or a day. Lets the cars rated most in a recent time window
+    be found without reading the rates. Buckets are expired after `TRENDING_HOURLY_RETENTION`
+    hours or `TRENDING_DAILY_RETENTION` days, see `trending.expire_rating_buckets`.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+
+    car = models.ForeignKey(Car, on_delete=models.CASCADE)
+    granularity = models.CharField(max_length=4, choices=[(HOUR, "hour"), (DAY, "day")])
+    start = models.DateTimeField()
+    rates_number = models.PositiveIntegerField(default=0)
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            # Also the index for reading the buckets of a time window.
+            models.UniqueConstraint(
+                fields=["granularity", "start", "car"], name="unique_rating_bucket"
+            ),
+        ]
+
+    @classmethod
+    def bucket_start(cls, moment, granularity):
+        """Start of the bucket of the given granularity the (aware) moment falls into."""
+        moment = moment.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0) if granularity == cls.DAY else moment
+
+    @classmethod
+    def retained_since(cls, granularity, now=None):
+        """Start of the oldest kept bucket of the given granularity."""
+        if granularity == cls.DAY:
+            retention = timedelta(days=settings.TRENDING_DAILY_RETENTION - 1)
+        else:
+            retention = timedelta(hours=settings.TRENDING_HOURLY_RETENTION - 1)
+        return cls.bucket_start(now or timezone.now(), granularity) - retention
+
+
+def _apply_bucket_changes(changes, using):
+    """
+    Update the hourly and daily rating buckets. `changes` maps (car ID, rate creation time) pairs
+    to the change of the number of rates. Buckets which are already expired are left out.
+    """
+    bucket_changes = Counter()
+    for (car_id, created_at), count_change in changes.items():
+        for granularity in (RatingBucket.HOUR, RatingBucket.DAY):
+            start = RatingBucket.bucket_start(created_at, granularity)
+            if start >= RatingBucket.retained_since(granularity):
+                bucket_changes[granularity, start, car_id] += count_change
+
+    # Missing buckets are created empty first, so concurrent writes never lose an increment.
+    RatingBucket.objects.using(using).bulk_create(
+        [
+            RatingBucket(granularity=granularity, start=start, car_id=car_id)
+            for (granularity, start, car_id), count_change in bucket_changes.items()
+            if count_change > 0
+        ],
+        ignore_conflicts=True,
+    )
+    rows = [
+        (count_change, granularity, start, car_id)
+        for (granularity, start, car_id), count_change in bucket_changes.items()
+        if count_change
+    ]
+    if rows:
+        _increment_many(
+            RatingBucket, ["rates_number"], ["granularity", "start", "car"], rows, using
+        )
+
+
+class CatalogEntry(models.Model):
+    """
+    A make/model pair known to the external API. Used to check if a car exists without calling
+    the API. `make_key` and `model_key` hold normalized names (see `normalize_name`).
+    """
+
+    make = models.CharField(max_length=100)
+    model = models.CharField(max_length=100)
+    make_key = models.CharField(max_length=100)
+    model_key = models.CharField(max_length=100)
+
+    objects = models.Manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["make_key", "model_key"], name="unique_catalog_make_model"
+            )
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of an `import_cars_rates` run: the number of input rows already handled. Updated in
+    the transaction of every imported batch, so it always matches the imported data.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    rows = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = models.Manager()
@@ -0,0 +1,70 @@
+"""
+Keyset (cursor) pagination. A page is read by seeking past the key of the last row of the
+previous page, which - unlike OFFSET - costs the same for every page when the key is indexed.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+
+from .models import is_db_integer
+
+
+class InvalidPageRequest(Exception):
+    pass
+
+
+def is_unpaged(request):
+    """Whether the client explicitly asked for the whole list, like before the pagination."""
+    return request.GET.get("unpaged", "").lower() == "true"
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key_length):
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, ValueError):
+        raise InvalidPageRequest("Invalid cursor.")
+
+    if (
+        not isinstance(key, list)
+        or len(key) != key_length
+        or not all(is_db_integer(value) for value in key)
+    ):
+        raise InvalidPageRequest("Invalid cursor.")
+    return key
+
+
+def keyset_page(queryset, request, key_fields, seek):
+    """
+    Return a page of `queryset` rows (dicts) selected by the `after` and `page_size` request
+    parameters, together with the cursor of the next page (None for the last page).
+
+    :param queryset: values queryset ordered by `key_fields`.
+    :param seek: function returning `queryset` narrowed to the rows following the given key.
+    :raises InvalidPageRequest: if the request parameters are not valid.
+    """
+    page_size = request.GET.get("page_size", str(settings.PAGE_SIZE))
+    if not page_size.isdigit() or not 1 <= int(page_size) <= settings.MAX_PAGE_SIZE:
+        raise InvalidPageRequest(
+            f"Page size has to be an integer between 1 and {settings.MAX_PAGE_SIZE}."
+        )
+    page_size = int(page_size)
+
+    after = request.GET.get("after")
+    if after is not None:
+        queryset = seek(queryset, *decode_cursor(after, len(key_fields)))
+
+    # One row more tells if there is a next page.
+    rows = list(queryset[: page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([rows[-1][field] for field in key_fields])
+
+    return {"results": rows, "next": next_cursor}
@@ -0,0 +1,67 @@
+"""
+Queue of the rates posted with `RATE_QUEUE_ENABLED`. `POST /rate/` only validates the rate and
+inserts it into the `QueuedRate` table - a single short write - and the `drain_rate_queue` command
+moves the queued rates to the rates in large batches, each in one transaction, so the rating
+aggregates and buckets of a car are updated once per batch instead of once per rate.
+
+A batch is applied and removed from the queue in the same transaction, so every queued rate is
+applied exactly once, even if the command is stopped in the middle of a batch. Several commands
+can drain the queue at once: on SQLite their transactions take turns, other databases skip the
+rows locked by another command.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import data_changed
+from .models import Car, QueuedRate, Rate
+
+
+def enqueue(car_id, rating):
+    QueuedRate.objects.create(car_id=car_id, rating=rating)
+
+
+def drain_batch(batch_size):
+    """
+    Apply the oldest `batch_size` queued rates and remove them from the queue. Rates of cars
+    deleted in the meantime are dropped.
+
+    :returns: numbers of the applied and dropped rates, both 0 if the queue is empty.
+    """
+    with transaction.atomic():
+        queued = list(
+            QueuedRate.objects.select_for_update(skip_locked=True)
+            .order_by("id")
+            .values_list("id", "car_id", "rating", "created_at")[:batch_size]
+        )
+        if not queued:
+            return 0, 0
+
+        existing_car_ids = set(
+            Car.objects.filter(id__in={car_id for _, car_id, _, _ in queued}).values_list(
+                "id", flat=True
+            )
+        )
+        rates = [
+            Rate(car_id=car_id, rating=rating, created_at=created_at)
+            for _, car_id, rating, created_at in queued
+            if car_id in existing_car_ids
+        ]
+        Rate.objects.bulk_create(rates, batch_size=settings.RATE_BULK_BATCH_SIZE)
+
+        ids = [id for id, _, _, _ in queued]
+        step = settings.RATE_BULK_BATCH_SIZE
+        for start in range(0, len(ids), step):
+            QueuedRate.objects.filter(id__in=ids[start:start + step]).delete()
+        if rates:
+            data_changed()
+    return len(rates), len(queued) - len(rates)
+
+
+def queue_status():
+    """Number of the queued rates and seconds the oldest of them waits (0 for an empty queue)."""
+    oldest = QueuedRate.objects.order_by("id").values_list("created_at", flat=True).first()
+    return {
+        "depth": QueuedRate.objects.count(),
+        "lag_seconds": (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,219 @@
+"""
+Encoding of the list endpoint responses. The format is chosen with `?format=` or the Accept
+header:
+
+- `application/json` (default) - an array of objects, encoded like `JsonResponse` does, or with
+  `COMPACT_JSON_RESPONSES` as compact JSON with orjson (if it is installed),
+- `application/vnd.cars.columnar+json` (`?format=columns`) - an object with an array of values for
+  every field, so the field names are not repeated on every row,
+- `application/msgpack` (`?format=msgpack`) - the array of objects in MessagePack, if `msgpack` is
+  installed.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.cars.columnar+json"
+MSGPACK = "application/msgpack"
+FORMATS = {"json": JSON, "columns": COLUMNAR_JSON, "msgpack": MSGPACK}
+# Other names clients use for the same media types.
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK}
+
+
+class NotAcceptable(Exception):
+    pass
+
+
+def json_dumps(value):
+    """
+    Encode `value` as compact JSON bytes, with orjson (several times faster) if it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value, cls=DjangoJSONEncoder, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def negotiate_format(request):
+    """
+    Media type of the list response for the request: given by `?format=`, or the most preferred
+    (by q value, then order) available media type of the Accept header, JSON by default - also
+    when the header names only media types this server doesn't know.
+
+    :raises NotAcceptable: if the format of `?format=` is unknown or not available, or if none of
+        the known media types of the Accept header is available and accepted.
+    """
+    name = request.GET.get("format")
+    if name is not None:
+        if name not in FORMATS:
+            raise NotAcceptable(f"Format has to be one of: {', '.join(FORMATS)}.")
+        if not _is_available(FORMATS[name]):
+            raise NotAcceptable("MessagePack is not available on this server.")
+        return FORMATS[name]
+
+    accepted = _parse_accept(request.META.get("HTTP_ACCEPT", ""))
+    refused = {media_type for media_type, quality in accepted if quality == 0}
+    for media_type, quality in accepted:
+        if quality == 0:
+            continue
+        if media_type in ("*/*", "application/*") and JSON not in refused:
+            return JSON
+        if media_type in FORMATS.values() and _is_available(media_type):
+            return media_type
+    if any(media_type in FORMATS.values() for media_type, _ in accepted):
+        raise NotAcceptable(
+            f"None of the accepted formats is available, use one of: {', '.join(_available())}."
+        )
+    return JSON
+
+
+def _parse_accept(header):
+    """(media type, q value) pairs of an Accept header, the most preferred first."""
+    accepted = []
+    for position, entry in enumerate(header.split(",")):
+        media_type, *parameters = [part.strip() for part in entry.split(";")]
+        if not media_type:
+            continue
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    pass
+        media_type = media_type.lower()
+        accepted.append((-quality, position, MEDIA_TYPE_ALIASES.get(media_type, media_type)))
+    return [(media_type, -quality) for quality, _, media_type in sorted(accepted)]
+
+
+def _is_available(media_type):
+    return media_type != MSGPACK or msgpack is not None
+
+
+def _available():
+    return [name for name, media_type in FORMATS.items() if _is_available(media_type)]
+
+
+def parse_fields(request, fields):
+    """
+    Fields requested with the comma separated `?fields=`, in the order of `fields` (all of them
+    by default).
+
+    :raises ValueError: if an unknown field is requested.
+    """
+    requested = request.GET.get("fields")
+    if requested is None:
+        return list(fields)
+    requested = set(requested.split(","))
+    if not requested <= set(fields):
+        raise ValueError(f"Fields have to be a comma separated subset of: {', '.join(fields)}.")
+    return [field for field in fields if field in requested]
+
+
+def encode(value, media_type, fields):
+    """
+    Encode `value` - a list of row dicts, or a page dict with the rows under "results" - in the
+    given format, with only the `fields` of the rows.
+    """
+    page = value if isinstance(value, dict) else None
+    rows = page["results"] if page is not None else value
+    if media_type == COLUMNAR_JSON:
+        rows = {field: [row[field] for row in rows] for field in fields}
+    elif rows and list(rows[0]) != fields:
+        # Rows can have more fields, e.g. the key of the page.
+        rows = [{field: row[field] for field in fields} for row in rows]
+    value = {**page, "results": rows} if page is not None else rows
+    if media_type == MSGPACK:
+        return msgpack.packb(value)
+    if media_type == JSON and not settings.COMPACT_JSON_RESPONSES:
+        # The encoding of `JsonResponse`, which the lists have always been returned in.
+        return json.dumps(value, cls=DjangoJSONEncoder).encode()
+    return json_dumps(value)
+
+
+def list_format(request, fields):
+    """
+    Media type and fields of the list response for the request, see `negotiate_format` and
+    `parse_fields`.
+    """
+    return negotiate_format(request), parse_fields(request, fields)
+
+
+def list_response(value, media_type, fields):
+    """Respond with `value` (see `encode`) in the given format."""
+    response = HttpResponse(encode(value, media_type, fields), content_type=media_type)
+    response["Vary"] = "Accept"
+    return response
+
+
+class StreamingJsonListResponse(StreamingHttpResponse):
+    """
+    Writes a JSON array item by item, so the whole list is never held in memory. The output is
+    byte for byte the same as of `JsonResponse(list(items), safe=False)`, or - with
+    `compact=True` - of `json_dumps(list(items))`.
+    """
+
+    def __init__(
+        self, items, encoder=DjangoJSONEncoder, items_per_chunk=1000, compact=False, **kwargs
+    ):
+        kwargs.setdefault("content_type", "application/json")
+        if compact:
+            encode_item, item_separator = json_dumps, b","
+        else:
+            json_encoder = encoder()
+
+            def encode_item(item):
+                return json_encoder.encode(item).encode()
+
+            item_separator = b", "
+        super().__init__(
+            self._encode(items, encode_item, item_separator, items_per_chunk), **kwargs
+        )
+
+    @staticmethod
+    def _encode(items, encode_item, item_separator, items_per_chunk):
+        separator = b"["
+        chunk = []
+        for item in items:
+            chunk.append(separator)
+            chunk.append(encode_item(item))
+            separator = item_separator
+            if len(chunk) >= 2 * items_per_chunk:
+                yield b"".join(chunk)
+                chunk = []
+
+        if separator == b"[":
+            chunk.append(b"[")
+        chunk.append(b"]")
+        yield b"".join(chunk)
+
+
+def json_list_response(values, media_type, fields, stream):
+    """
+    Respond with the rows of the `values` queryset in the given format. With `stream` JSON rows
+    are read from the database and written to the client in chunks.
+    """
+    if stream and media_type == JSON:
+        response = StreamingJsonListResponse(
+            values.iterator(chunk_size=settings.STREAM_CHUNK_SIZE),
+            items_per_chunk=settings.STREAM_CHUNK_SIZE,
+            compact=settings.COMPACT_JSON_RESPONSES,
+        )
+        response["Vary"] = "Accept"
+        return response
+    return list_response(list(values), media_type, fields)
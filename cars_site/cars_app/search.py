@@ -0,0 +1,77 @@
+"""
+Typeahead search of the cars by make and model.
+
+On SQLite the FTS5 table `cars_app_car_search` (created by migration 0010) indexes the words of
+every make and model, and is kept in sync with the cars by triggers on insert, delete and rename.
+Other databases match the words with LIKE instead, ranked by name length - only prefixes of the
+whole make or model can use an index there.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, Q
+from django.db.models.functions import Length
+
+from .models import Car
+
+# Also named in migration 0010.
+SEARCH_TABLE = "cars_app_car_search"
+MAX_QUERY_LENGTH = 100
+# Characters after which a word of a name starts, for the LIKE search.
+WORD_SEPARATORS = (" ", "-")
+
+
+def query_words(query):
+    """Lowercase words (letters and digits) of a search query."""
+    return re.findall(r"\w+", query.lower())
+
+
+def search_cars(words, limit, with_rating=False):
+    """
+    The `limit` best matching cars whose make or model contain a word starting with every one of
+    the `words`, as dicts with id, make, model and, optionally, avg_rating.
+    """
+    cars = Car.objects.using(router.db_for_read(Car))
+    fields = ["id", "make", "model"]
+    if with_rating:
+        cars = cars.with_avg_rating()
+        fields.append("avg_rating")
+
+    if connections[cars.db].vendor != "sqlite":
+        return list(_like_matches(cars, words).values(*fields)[:limit])
+
+    ids = _fts_ranked_ids(cars.db, words, limit)
+    found = {car["id"]: car for car in cars.filter(id__in=ids).values(*fields)}
+    return [found[id] for id in ids if id in found]
+
+
+def _fts_ranked_ids(using, words, limit):
+    # Every word as a quoted prefix query, all of them have to match. `\w` characters need no
+    # escaping inside the quotes.
+    match = " ".join(f'"{word}"*' for word in words)
+    # Ranking (bm25) costs a callback per matched row, so only the first
+    # `SEARCH_RANK_CANDIDATES` matches (by id) are ranked - queries which match more cars are too
+    # broad for the order to matter much.
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM ("
+            f"  SELECT rowid, rank FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT %s"
+            f") ORDER BY rank, rowid LIMIT %s",
+            [match, settings.SEARCH_RANK_CANDIDATES, limit],
+        )
+        return [id for id, in cursor.fetchall()]
+
+
+def _like_matches(cars, words):
+    for word in words:
+        matches = Q()
+        for field in ("make", "model"):
+            matches |= Q(**{f"{field}__istartswith": word})
+            for separator in WORD_SEPARATORS:
+                matches |= Q(**{f"{field}__icontains": separator + word})
+        cars = cars.filter(matches)
+    # The shorter the name, the bigger part of it the query matched.
+    return cars.annotate(name_length=Length(F("make")) + Length(F("model"))).order_by(
+        "name_length", "id"
+    )
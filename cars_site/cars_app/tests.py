@@ -1,12 +1,73 @@
+import asyncio
+import csv
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import timedelta
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from typing import Dict
+from unittest import skipUnless
 from unittest.mock import patch
 
-from django.test import Client, TestCase
-
-from .models import Car, Rate
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, models, transaction
+from django.db.models.signals import post_delete
+from django.db.migrations.executor import MigrationExecutor
+from django.core.cache import cache
+from django.test import (
+    AsyncClient,
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from prometheus_client import REGISTRY
+
+from . import cache as cache_module, compression, rate_queue, responses, search, trending
+from . import leaderboard as leaderboard_module
+from .catalog import add_to_catalog, car_in_catalog
+from .leaderboard import leaderboard
+from .db import (
+    PIN_COOKIE,
+    PrimaryReplicaRouter,
+    ReplicaPinningMiddleware,
+    close_broken_connections,
+    import_sqlite_pragmas,
+)
+from .export import export_rows
+from .importer import import_batch
+from .models import Car, CatalogEntry, ImportCheckpoint, QueuedRate, Rate, RatingBucket
+from .pagination import encode_cursor
+from .responses import COLUMNAR_JSON, StreamingJsonListResponse
+from .trending import expire_rating_buckets, rebuild_rating_buckets
+from .views import CarsBatchView, CarsView, Popular
+from .validation import (
+    AsyncVpicClient,
+    CircuitBreaker,
+    CircuitOpen,
+    VpicClient,
+    VpicUnavailable,
+)
 
 
 class TestCarsViewPost(TestCase):
+    get_model_names_target = "cars_app.views.vpic_client.get_model_names"
+
     def setUp(self) -> None:
         self.client = Client()
 
@@ -15,10 +76,8 @@ class TestCarsViewPost(TestCase):
             "make": "Volkswagen",
             "model": "XXX-non-existing-model",
         }
-        with patch("cars_app.views.requests.get") as make_models_get:
-            make_models_get.return_value.json.return_value = {
-                "Results": [{"Model_Name": "Golf"}, {"Model_Name": "Passat"}]
-            }
+        with patch(self.get_model_names_target) as get_model_names:
+            get_model_names.return_value = ["Golf", "Passat"]
 
             response = self.client.post(
                 "/cars/",
@@ -33,8 +92,8 @@ class TestCarsViewPost(TestCase):
             "make": "non-existing-make-name",
             "model": "Golf",
         }
-        with patch("cars_app.views.requests.get") as make_models_get:
-            make_models_get.return_value.json.return_value = {"Results": []}
+        with patch(self.get_model_names_target) as get_model_names:
+            get_model_names.return_value = []
 
             response = self.client.post(
                 "/cars/",
@@ -49,10 +108,8 @@ class TestCarsViewPost(TestCase):
             "make": "Volkswagen",
             "model": "Golf",
         }
-        with patch("cars_app.views.requests.get") as make_models_get:
-            make_models_get.return_value.json.return_value = {
-                "Results": [{"Model_Name": "Golf"}, {"Model_Name": "Passat"}]
-            }
+        with patch(self.get_model_names_target) as get_model_names:
+            get_model_names.return_value = ["Golf", "Passat"]
             cars = Car.objects.all()
             self.assertEqual(len(cars), 0)
 
@@ -76,12 +133,10 @@ class TestCarsViewPost(TestCase):
             "make": "Volkswagen",
             "model": "Golf",
         }
-        with patch("cars_app.views.requests.get") as make_models_get:
+        with patch(self.get_model_names_target) as get_model_names:
             Car.objects.create(make=data["make"], model=data["model"])
 
-            make_models_get.return_value.json.return_value = {
-                "Results": [{"Model_Name": "Golf"}, {"Model_Name": "Passat"}]
-            }
+            get_model_names.return_value = ["Golf", "Passat"]
             cars = Car.objects.all()
             self.assertEqual(len(cars), 1)
 
@@ -96,6 +151,231 @@ class TestCarsViewPost(TestCase):
 
             self.assertEqual(response.status_code, 409)
 
+    def test_doesnt_create_car_differing_only_in_letter_case_or_whitespace(self):
+        add_to_catalog([("Volkswagen", "Golf")])
+        Car.objects.create(make="Volkswagen", model="Golf")
+
+        response = self.client.post("/cars/", data={"make": "volkswagen", "model": " GOLF "})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(1, Car.objects.count())
+
+    def test_returns_error_if_external_api_is_unavailable(self):
+        data = {
+            "make": "Volkswagen",
+            "model": "Golf",
+        }
+        with patch(self.get_model_names_target) as get_model_names:
+            get_model_names.side_effect = CircuitOpen()
+
+            response = self.client.post(
+                "/cars/",
+                data=data,
+                headers={"Content-Type": "application/json;charset=UTF-8"},
+            )
+
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(0, len(Car.objects.all()))
+
+
+class TestConcurrentCarsViewPost(TransactionTestCase):
+    def test_concurrent_identical_posts_create_single_car(self):
+        add_to_catalog([("Volkswagen", "Golf")])
+        threads_number = 16
+        barrier = threading.Barrier(threads_number)
+        statuses = []
+
+        def post():
+            try:
+                barrier.wait()
+                response = Client().post("/cars/", data={"make": "Volkswagen", "model": "Golf"})
+                statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post) for _ in range(threads_number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([201] + [409] * (threads_number - 1), sorted(statuses))
+        self.assertEqual(1, Car.objects.filter(make="Volkswagen", model="Golf").count())
+
+
+class TestConcurrentCarsBatchViewPost(TransactionTestCase):
+    def test_concurrent_batches_create_every_car_once(self):
+        pairs = [("Volkswagen", "Golf"), ("Volkswagen", "Passat"), ("Volkswagen", "Polo")]
+        add_to_catalog(pairs)
+        threads_number = 8
+        barrier = threading.Barrier(threads_number)
+        results = []
+
+        def post():
+            try:
+                barrier.wait()
+                response = Client().post(
+                    "/cars/batch",
+                    data=json.dumps([{"make": make, "model": model} for make, model in pairs]),
+                    content_type="application/json",
+                )
+                results.append(response.json())
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=post) for _ in range(threads_number)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(pairs), sum(result["created"] for result in results))
+        for index in range(len(pairs)):
+            self.assertEqual(
+                [201] + [409] * (threads_number - 1),
+                sorted(result["results"][index]["status"] for result in results),
+            )
+        self.assertEqual(len(pairs), Car.objects.count())
+
+
+class TestDeduplicateCarsMigration(TransactionTestCase):
+    migrate_from = [("cars_app", "0005_car_popularity_index")]
+    migrate_to = [("cars_app", "0007_car_unique_make_model")]
+
+    def tearDown(self) -> None:
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_merges_cars_differing_only_in_letter_case_or_whitespace_with_their_rates(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        OldCar = apps.get_model("cars_app", "Car")
+        OldRate = apps.get_model("cars_app", "Rate")
+
+        golf_1 = OldCar.objects.create(make="Volkswagen", model="Golf", rating_sum=5, rating_count=1)
+        golf_2 = OldCar.objects.create(make="Volkswagen", model="Golf", rating_sum=3, rating_count=2)
+        golf_3 = OldCar.objects.create(make="volkswagen", model=" GOLF", rating_sum=4, rating_count=1)
+        passat = OldCar.objects.create(make="Volkswagen", model="Passat")
+        OldRate.objects.create(car=golf_1, rating=5)
+        OldRate.objects.create(car=golf_2, rating=1)
+        OldRate.objects.create(car=golf_2, rating=2)
+        OldRate.objects.create(car=golf_3, rating=4)
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+
+        self.assertEqual(
+            [(golf_1.id, "volkswagen", "golf", 12, 4), (passat.id, "volkswagen", "passat", 0, 0)],
+            list(
+                Car.objects.order_by("id").values_list(
+                    "id", "make_key", "model_key", "rating_sum", "rating_count"
+                )
+            ),
+        )
+        self.assertEqual({golf_1.id}, set(Rate.objects.values_list("car_id", flat=True)))
+
+
+class TestCarsBatchView(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+
+    def _post(self, pairs):
+        return self.client.post(
+            "/cars/batch",
+            data=json.dumps([{"make": make, "model": model} for make, model in pairs]),
+            content_type="application/json",
+        )
+
+    def test_reports_status_of_every_pair_and_creates_new_cars(self):
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+        Car.objects.create(make="Volkswagen", model="Passat")
+        models_by_make = {"Honda": ["Civic", "Accord"], "Fiat": []}
+
+        with patch("cars_app.views.vpic_client.get_model_names") as get_model_names:
+            get_model_names.side_effect = lambda make: models_by_make[make]
+
+            response = self._post(
+                [
+                    ("Volkswagen", "Golf"),
+                    ("Volkswagen", "Passat"),
+                    ("Honda", "Civic"),
+                    ("Honda", "Accord"),
+                    ("Honda", "XXX-non-existing-model"),
+                    ("Fiat", "Punto"),
+                    ("Honda", "Civic"),
+                ]
+            )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [201, 409, 201, 201, 422, 422, 409],
+            [result["status"] for result in response.json()["results"]],
+        )
+        self.assertEqual(3, response.json()["created"])
+        self.assertEqual(
+            {("Volkswagen", "Golf"), ("Volkswagen", "Passat"), ("Honda", "Civic"),
+             ("Honda", "Accord")},
+            set(Car.objects.values_list("make", "model")),
+        )
+        # One call per make missing from the catalog.
+        self.assertEqual(
+            ["Fiat", "Honda"], sorted(call.args[0] for call in get_model_names.call_args_list)
+        )
+
+    def test_pairs_differing_only_in_letter_case_or_whitespace_are_the_same_car(self):
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+        Car.objects.create(make="Volkswagen", model="Passat")
+
+        response = self._post(
+            [("Volkswagen", "Golf"), ("VOLKSWAGEN", "golf "), ("volkswagen", "passat")]
+        )
+
+        self.assertEqual(
+            [201, 409, 409], [result["status"] for result in response.json()["results"]]
+        )
+        self.assertEqual(
+            [("Volkswagen", "Golf"), ("Volkswagen", "Passat")],
+            list(Car.objects.order_by("model").values_list("make", "model")),
+        )
+
+    def test_reports_cars_registered_meanwhile_as_existing(self):
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+        Car.objects.create(make="Volkswagen", model="Passat")
+
+        # Another request registers the car after it was checked.
+        with patch.object(CarsBatchView, "_existing_keys", return_value=set()):
+            response = self._post([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+
+        self.assertEqual(
+            [201, 409], [result["status"] for result in response.json()["results"]]
+        )
+        self.assertEqual(1, response.json()["created"])
+        self.assertEqual(2, Car.objects.count())
+
+    def test_reports_pairs_which_could_not_be_checked(self):
+        add_to_catalog([("Volkswagen", "Golf")])
+
+        with patch("cars_app.views.vpic_client.get_model_names") as get_model_names:
+            get_model_names.side_effect = CircuitOpen()
+
+            response = self._post([("Honda", "Civic"), ("Volkswagen", "Golf")])
+
+        self.assertEqual(
+            [503, 201], [result["status"] for result in response.json()["results"]]
+        )
+        self.assertEqual(1, Car.objects.count())
+
+    def test_returns_error_for_malformed_body(self):
+        for data in ("not json", '[{"make": "Honda"}]', '{"make": "Honda", "model": "Civic"}'):
+            response = self.client.post(
+                "/cars/batch", data=data, content_type="application/json"
+            )
+
+            self.assertEqual(400, response.status_code)
+
 
 class TestCarsViewGet(TestCase):
     def setUp(self) -> None:
@@ -124,7 +404,7 @@ class TestCarsViewGet(TestCase):
         )
 
         response = self.client.get(
-            "/cars/", headers={"Content-Type": "application/json;charset=UTF-8"}
+            "/cars/?unpaged=true", headers={"Content-Type": "application/json;charset=UTF-8"}
         )
 
         self.assertEqual(
@@ -153,7 +433,7 @@ class TestCarsViewGet(TestCase):
 
     def test_returns_empty_list_if_no_cars_created(self):
         response = self.client.get(
-            "/cars/", headers={"Content-Type": "application/json;charset=UTF-8"}
+            "/cars/?unpaged=true", headers={"Content-Type": "application/json;charset=UTF-8"}
         )
 
         self.assertEqual([], response.json())
@@ -198,6 +478,80 @@ class TestCarsDeleteView(TestCase):
 
         self.assertEqual(404, response.status_code)
 
+    def test_returns_error_for_id_out_of_database_range(self):
+        self.assertEqual(404, self.client.delete(f"/cars/{2**70}").status_code)
+
+    def test_deletes_rates_without_reading_them(self):
+        golf = Car.objects.create(make="Volkswagen", model="Golf")
+        passat = Car.objects.create(make="Volkswagen", model="Passat")
+        Rate.objects.bulk_create(
+            Rate(car=car, rating=4) for car in (golf, passat) for _ in range(50)
+        )
+
+        # Receivers would make Django's collector load every rate before deleting it.
+        def receiver(**kwargs):
+            pass
+
+        post_delete.connect(receiver, sender=Rate)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Rate)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(f"/cars/{golf.id}")
+
+        self.assertEqual(204, response.status_code)
+        self.assertEqual([], [q["sql"] for q in queries if q["sql"].startswith("SELECT")][1:])
+        self.assertFalse(Rate.objects.filter(car_id=golf.id).exists())
+        self.assertFalse(RatingBucket.objects.filter(car_id=golf.id).exists())
+        self.assertEqual(50, Rate.objects.filter(car=passat).count())
+
+
+class TestCarsBulkDelete(TransactionTestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.cars = [Car.objects.create(make="Fiat", model=f"Model-{i}") for i in range(5)]
+        Rate.objects.bulk_create(Rate(car=car, rating=3) for car in self.cars for _ in range(3))
+
+    def test_deletes_listed_cars_with_their_rates(self):
+        ids = [self.cars[0].id, self.cars[2].id, 999999]
+
+        response = self.client.delete(f"/cars/?ids={','.join(map(str, ids))}")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({"deleted": 2}, response.json())
+        self.assertEqual(
+            [self.cars[1].id, self.cars[3].id, self.cars[4].id],
+            list(Car.objects.order_by("id").values_list("id", flat=True)),
+        )
+        self.assertEqual(9, Rate.objects.count())
+
+    def test_deletes_all_cars_or_none(self):
+        raw_delete = models.QuerySet._raw_delete
+
+        def fail_on_cars(queryset, using):
+            if queryset.model is Car:
+                raise OperationalError("disk I/O error")
+            return raw_delete(queryset, using)
+
+        ids = ",".join(str(car.id) for car in self.cars)
+        with patch.object(models.QuerySet, "_raw_delete", fail_on_cars):
+            with self.assertRaises(OperationalError):
+                self.client.delete(f"/cars/?ids={ids}")
+
+        self.assertEqual(5, Car.objects.count())
+        self.assertEqual(15, Rate.objects.count())
+
+    @override_settings(CARS_BULK_DELETE_MAX_ITEMS=2)
+    def test_rejects_invalid_and_too_many_ids(self):
+        for query, status in (
+            ("", 400),
+            ("ids=1,x", 400),
+            ("ids=1,,2", 400),
+            (f"ids=1,{2**70}", 400),
+            ("ids=1,2,3", 413),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(status, self.client.delete(f"/cars/?{query}").status_code)
+        self.assertEqual(5, Car.objects.count())
+
 
 class TestRateView(TestCase):
     def setUp(self) -> None:
@@ -265,6 +619,291 @@ class TestRateView(TestCase):
         self.assertEqual(0, len(Rate.objects.all()))
 
 
+@override_settings(RATE_QUEUE_ENABLED=True)
+class TestRateQueue(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.car = Car.objects.create(make="Volkswagen", model="Golf")
+
+    def _drain(self, **options):
+        call_command("drain_rate_queue", once=True, stdout=open(os.devnull, "w"), **options)
+
+    def test_queues_rate_without_applying_it(self):
+        response = self.client.post("/rate/", data={"car_id": self.car.id, "rating": 5})
+
+        self.assertEqual(202, response.status_code)
+        self.assertFalse(Rate.objects.exists())
+        self.assertEqual(0, Car.objects.get(id=self.car.id).rating_count)
+        self.assertEqual(1, self.client.get("/rate/queue").json()["depth"])
+
+    def test_does_not_queue_invalid_rates(self):
+        for data in ({"car_id": self.car.id, "rating": 6}, {"car_id": 999999999, "rating": 5}):
+            response = self.client.post("/rate/", data=data)
+
+            self.assertEqual(422, response.status_code)
+        self.assertFalse(QueuedRate.objects.exists())
+
+    def test_drain_applies_queued_rates(self):
+        for rating in (5, 4, 4):
+            self.client.post("/rate/", data={"car_id": self.car.id, "rating": rating})
+        queued_at = QueuedRate.objects.order_by("id").first().created_at
+
+        self._drain(batch_size=2)
+
+        self.assertFalse(QueuedRate.objects.exists())
+        self.assertEqual([4, 4, 5], sorted(Rate.objects.values_list("rating", flat=True)))
+        self.assertEqual(queued_at, Rate.objects.order_by("id").first().created_at)
+        ratings = self.client.get(f"/cars/{self.car.id}/ratings").json()
+        self.assertEqual({"1": 0, "2": 0, "3": 0, "4": 2, "5": 1}, ratings["counts"])
+        trending = self.client.get("/trending?window=24h").json()
+        self.assertEqual(3, trending[0]["rates_number"])
+
+    def test_drains_in_batches(self):
+        for _ in range(5):
+            self.client.post("/rate/", data={"car_id": self.car.id, "rating": 3})
+
+        self.assertEqual((2, 0), rate_queue.drain_batch(2))
+        self.assertEqual(3, QueuedRate.objects.count())
+        self.assertEqual(2, Car.objects.get(id=self.car.id).rating_count)
+
+    def test_drops_rates_of_deleted_cars(self):
+        other_car = Car.objects.create(make="Volvo", model="V40")
+        self.client.post("/rate/", data={"car_id": self.car.id, "rating": 3})
+        self.client.post("/rate/", data={"car_id": other_car.id, "rating": 3})
+        other_car.delete()
+
+        self.assertEqual((1, 1), rate_queue.drain_batch(10))
+        self.assertFalse(QueuedRate.objects.exists())
+
+    def test_applies_rates_once_when_draining_fails(self):
+        for _ in range(3):
+            self.client.post("/rate/", data={"car_id": self.car.id, "rating": 3})
+
+        with patch.object(rate_queue, "data_changed", side_effect=RuntimeError("killed")):
+            with self.assertRaises(RuntimeError):
+                rate_queue.drain_batch(10)
+        self.assertFalse(Rate.objects.exists())
+        self.assertEqual(3, QueuedRate.objects.count())
+
+        self._drain()
+        self._drain()
+        self.assertEqual(3, Rate.objects.count())
+        self.assertEqual(3, Car.objects.get(id=self.car.id).rating_count)
+
+    def test_reports_queue_depth_and_lag(self):
+        self.assertEqual({"depth": 0, "lag_seconds": 0}, self.client.get("/rate/queue").json())
+
+        QueuedRate.objects.create(
+            car_id=self.car.id, rating=3, created_at=timezone.now() - timedelta(minutes=2)
+        )
+        QueuedRate.objects.create(car_id=self.car.id, rating=3)
+        status = self.client.get("/rate/queue").json()
+
+        self.assertEqual(2, status["depth"])
+        self.assertGreaterEqual(status["lag_seconds"], 120)
+
+
+class TestRateBulkView(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.golf = Car.objects.create(make="Volkswagen", model="Golf")
+        self.passat = Car.objects.create(make="Volkswagen", model="Passat")
+
+    def test_creates_rates_from_json_array(self):
+        response = self.client.post(
+            "/rate/bulk",
+            data=json.dumps(
+                [
+                    {"car_id": self.golf.id, "rating": 5},
+                    {"car_id": self.golf.id, "rating": 3},
+                    {"car_id": self.passat.id, "rating": 1},
+                ]
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, response.json()["created"])
+        self.assertEqual(
+            [201, 201, 201], [result["status"] for result in response.json()["results"]]
+        )
+        self.assertEqual(3, Rate.objects.count())
+        self.golf.refresh_from_db()
+        self.assertEqual((8, 2), (self.golf.rating_sum, self.golf.rating_count))
+
+    def test_creates_rates_from_ndjson(self):
+        response = self.client.post(
+            "/rate/bulk",
+            data=f'{{"car_id": {self.golf.id}, "rating": 5}}\n'
+            f'{{"car_id": {self.passat.id}, "rating": 2}}\n',
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(2, response.json()["created"])
+        self.assertEqual(2, Rate.objects.count())
+
+    def test_reports_failed_items_and_creates_the_rest(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/rate/bulk",
+                data=json.dumps(
+                    [
+                        {"car_id": self.golf.id, "rating": 6},
+                        {"car_id": self.golf.id, "rating": 4},
+                        {"car_id": 999999999, "rating": 4},
+                        {"car_id": self.passat.id, "rating": 0},
+                        {"rating": 3},
+                        {"car_id": self.passat.id, "rating": 2},
+                    ]
+                ),
+                content_type="application/json",
+            )
+
+        self.assertEqual(
+            [422, 201, 422, 422, 422, 201],
+            [result["status"] for result in response.json()["results"]],
+        )
+        self.assertEqual(2, response.json()["created"])
+        self.assertEqual(
+            [4, 2], list(Rate.objects.order_by("id").values_list("rating", flat=True))
+        )
+        # Cars are checked with a single query, not one per rate.
+        car_queries = [q for q in queries if q["sql"].startswith('SELECT "cars_app_car"."id"')]
+        self.assertEqual(1, len(car_queries))
+
+    def test_rejects_items_which_are_not_integers(self):
+        response = self.client.post(
+            "/rate/bulk",
+            data=json.dumps(
+                [
+                    {"car_id": True, "rating": 3},
+                    {"car_id": self.golf.id, "rating": True},
+                    {"car_id": self.golf.id, "rating": 3.7},
+                    {"car_id": 2**70, "rating": 3},
+                    {"car_id": self.golf.id, "rating": 4.0},
+                ]
+            ),
+            content_type="application/json",
+        )
+
+        self.assertEqual(
+            [422, 422, 422, 422, 201],
+            [result["status"] for result in response.json()["results"]],
+        )
+        self.assertEqual([4], list(Rate.objects.values_list("rating", flat=True)))
+
+    def test_reports_malformed_ndjson_line_as_failed_item(self):
+        response = self.client.post(
+            "/rate/bulk",
+            data=f'{{"car_id": {self.golf.id}, "rating": 5}}\n{{"car_id": \n',
+            content_type="application/x-ndjson",
+        )
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [
+                {"index": 0, "status": 201},
+                {"index": 1, "status": 422, "errors": ["Item has to be a JSON object."]},
+            ],
+            response.json()["results"],
+        )
+
+    @override_settings(RATE_BULK_BATCH_SIZE=2)
+    def test_inserts_rates_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(
+                "/rate/bulk",
+                data=json.dumps([{"car_id": self.golf.id, "rating": 1}] * 5),
+                content_type="application/json",
+            )
+
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "cars_app_rate"')]
+        self.assertEqual(3, len(inserts))
+        self.assertEqual(5, Rate.objects.count())
+
+    def test_returns_error_for_malformed_body(self):
+        for data in ("not json", '{"car_id": 1, "rating": 1}'):
+            response = self.client.post(
+                "/rate/bulk", data=data, content_type="application/json"
+            )
+
+            self.assertEqual(400, response.status_code)
+
+    @override_settings(RATE_BULK_MAX_ITEMS=2)
+    def test_returns_error_for_too_many_items(self):
+        response = self.client.post(
+            "/rate/bulk",
+            data=json.dumps([{"car_id": self.golf.id, "rating": 1}] * 3),
+            content_type="application/json",
+        )
+
+        self.assertEqual(413, response.status_code)
+        self.assertEqual(0, Rate.objects.count())
+
+
+class TestCarRatingsView(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.car = Car.objects.create(make="Volkswagen", model="Golf")
+
+    def test_returns_rating_breakdown_and_statistics(self):
+        for rating in (4, 1, 5, 4, 3):
+            Rate.objects.create(car=self.car, rating=rating)
+
+        response = self.client.get(f"/cars/{self.car.id}/ratings")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            {
+                "car_id": self.car.id,
+                "count": 5,
+                "counts": {"1": 1, "2": 0, "3": 1, "4": 2, "5": 1},
+                "mean": 3.4,
+                "median": 4,
+                "p25": 3,
+                "p75": 4,
+                "p90": 5,
+            },
+            response.json(),
+        )
+
+    def test_median_of_even_number_of_rates_is_average_of_middle_ones(self):
+        Rate.objects.create(car=self.car, rating=2)
+        Rate.objects.create(car=self.car, rating=5)
+
+        self.assertEqual(3.5, self.client.get(f"/cars/{self.car.id}/ratings").json()["median"])
+
+    def test_car_without_rates_has_no_statistics(self):
+        response = self.client.get(f"/cars/{self.car.id}/ratings")
+
+        self.assertEqual(
+            {
+                "car_id": self.car.id,
+                "count": 0,
+                "counts": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0},
+                "mean": None,
+                "median": None,
+                "p25": None,
+                "p75": None,
+                "p90": None,
+            },
+            response.json(),
+        )
+
+    def test_does_not_read_rates(self):
+        Rate.objects.create(car=self.car, rating=3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/cars/{self.car.id}/ratings")
+
+        self.assertEqual(1, len(queries))
+        self.assertNotIn("cars_app_rate", queries[0]["sql"])
+
+    def test_returns_404_for_non_existing_car(self):
+        self.assertEqual(404, self.client.get(f"/cars/{self.car.id + 1}/ratings").status_code)
+        self.assertEqual(404, self.client.get(f"/cars/{2**70}/ratings").status_code)
+
+
 class TestPopularView(TestCase):
     def setUp(self) -> None:
         self.client = Client()
@@ -299,7 +938,7 @@ class TestPopularView(TestCase):
         self._rate_cars(number_of_rates)
 
         response = self.client.get(
-            "/popular/", headers={"Content-Type": "application/json;charset=UTF-8"}
+            "/popular/?unpaged=true", headers={"Content-Type": "application/json;charset=UTF-8"}
         )
 
         self.assertEqual(
@@ -358,7 +997,7 @@ class TestPopularView(TestCase):
 
     def test_returns_empty_list_if_no_cars_were_created(self):
         response = self.client.get(
-            "/popular/", headers={"Content-Type": "application/json;charset=UTF-8"}
+            "/popular/?unpaged=true", headers={"Content-Type": "application/json;charset=UTF-8"}
         )
 
         self.assertEqual([], response.json())
@@ -375,7 +1014,7 @@ class TestPopularView(TestCase):
         cars = Car.objects.all()
 
         response = self.client.get(
-            "/popular/", headers={"Content-Type": "application/json;charset=UTF-8"}
+            "/popular/?unpaged=true", headers={"Content-Type": "application/json;charset=UTF-8"}
         )
 
         self.assertEqual(
@@ -402,6 +1041,41 @@ class TestPopularView(TestCase):
             response.json(),
         )
 
+    def test_returns_only_limit_most_popular_cars(self):
+        golf = Car.objects.create(make="Volkswagen", model="Golf")
+        passat = Car.objects.create(make="Volkswagen", model="Passat")
+        polo = Car.objects.create(make="Volkswagen", model="Polo")
+        self._rate_cars({golf.id: 1, passat.id: 3, polo.id: 1})
+
+        response = self.client.get("/popular/?limit=2")
+
+        self.assertEqual(
+            [
+                {"id": passat.id, "make": "Volkswagen", "model": "Passat", "rates_number": 3},
+                {"id": golf.id, "make": "Volkswagen", "model": "Golf", "rates_number": 1},
+            ],
+            response.json(),
+        )
+
+    def test_returns_error_if_limit_is_not_positive_integer_up_to_max_page_size(self):
+        for limit in ("0", "-1", "abc", "1001", "9223372036854775808"):
+            response = self.client.get(f"/popular/?limit={limit}")
+
+            self.assertEqual(400, response.status_code)
+
+    def test_reads_most_popular_cars_in_index_order(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plan format is specific to SQLite.")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/popular/?limit=10")
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = " ".join(str(row) for row in cursor.fetchall())
+
+        self.assertIn("car_popularity_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
     @staticmethod
     def _rate_cars(number_of_rates: Dict[int, int]):
         for car_id, rates_count in number_of_rates.items():
@@ -410,12 +1084,283 @@ class TestPopularView(TestCase):
                 Rate.objects.create(car_id=car_id, rating=5)
 
 
+class TestTrending(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.now = timezone.now()
+        self.cars = {
+            name: Car.objects.create(make="Volkswagen", model=name)
+            for name in ("Golf", "Passat", "Polo", "Arteon")
+        }
+
+    def rate(self, name, times, days_ago):
+        Rate.objects.bulk_create(
+            Rate(
+                car=self.cars[name],
+                rating=5,
+                created_at=self.now - timedelta(days=days_ago),
+            )
+            for _ in range(times)
+        )
+
+    def trending(self, window):
+        response = self.client.get(f"/trending?window={window}")
+        self.assertEqual(200, response.status_code)
+        return [(car["model"], car["rates_number"]) for car in response.json()]
+
+    def test_returns_cars_with_most_rates_in_window(self):
+        self.rate("Golf", 2, days_ago=0)
+        self.rate("Passat", 3, days_ago=2)
+        self.rate("Polo", 5, days_ago=10)
+        self.rate("Arteon", 9, days_ago=40)
+        Rate.objects.create(car=self.cars["Arteon"], rating=5, created_at=None)
+
+        self.assertEqual([("Golf", 2)], self.trending("24h"))
+        self.assertEqual([("Passat", 3), ("Golf", 2)], self.trending("7d"))
+        self.assertEqual([("Polo", 5), ("Passat", 3), ("Golf", 2)], self.trending("30d"))
+
+    def test_deleted_rates_are_not_counted(self):
+        self.rate("Golf", 3, days_ago=0)
+        self.rate("Passat", 2, days_ago=0)
+
+        first, second, _ = Rate.objects.filter(car=self.cars["Golf"])
+        first.delete()
+        Rate.objects.filter(pk=second.pk).delete()
+
+        self.assertEqual([("Passat", 2), ("Golf", 1)], self.trending("24h"))
+
+    def test_does_not_read_rates(self):
+        self.rate("Golf", 2, days_ago=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/trending?window=7d")
+
+        self.assertEqual(1, len(queries))
+        self.assertNotIn("cars_app_rate", queries[0]["sql"])
+
+    def test_rejects_invalid_window_and_limit(self):
+        for query in ("window=1y", "limit=0", "limit=x"):
+            with self.subTest(query=query):
+                self.assertEqual(400, self.client.get(f"/trending?{query}").status_code)
+
+    def test_expires_old_buckets(self):
+        car = self.cars["Golf"]
+        RatingBucket.objects.bulk_create(
+            [
+                RatingBucket(car=car, granularity=RatingBucket.HOUR, start=start)
+                for start in (self.now - timedelta(hours=100), self.now - timedelta(hours=1))
+            ]
+            + [
+                RatingBucket(car=car, granularity=RatingBucket.DAY, start=start)
+                for start in (self.now - timedelta(days=100), self.now - timedelta(days=10))
+            ]
+        )
+
+        self.assertEqual(2, expire_rating_buckets())
+        self.assertEqual(2, RatingBucket.objects.count())
+
+    def test_rebuilt_buckets_match_updated_ones(self):
+        for name, days_ago in (("Golf", 0), ("Passat", 1), ("Polo", 5), ("Golf", 20)):
+            self.rate(name, 2, days_ago)
+        fields = ["car", "granularity", "start", "rates_number"]
+        buckets = set(RatingBucket.objects.values_list(*fields))
+
+        rebuild_rating_buckets()
+
+        self.assertEqual(buckets, set(RatingBucket.objects.values_list(*fields)))
+
+    @override_settings(TRENDING_EXPIRY_INTERVAL=60)
+    def test_expires_buckets_in_background_once_per_interval(self):
+        cache.delete(trending.EXPIRY_KEY)
+        expired = threading.Event()
+
+        with patch("cars_app.trending._next_expiry_check", 0), patch(
+            "cars_app.trending.expire_rating_buckets", side_effect=expired.set
+        ) as expire:
+            trending.expire_in_background_if_due()
+            trending.expire_in_background_if_due()
+            self.assertTrue(expired.wait(5))
+
+        self.assertEqual(1, expire.call_count)
+
+
+@override_settings(LEADERBOARD_ENABLED=True)
+class TestLeaderboard(TransactionTestCase):
+    # A TransactionTestCase - the leaderboard is updated once the writes commit.
+
+    def setUp(self) -> None:
+        self.client = Client()
+        self.cars = [Car.objects.create(make="Fiat", model=f"Model-{i}") for i in range(6)]
+        for car, rates_number in zip(self.cars, (3, 1, 5, 0, 2, 0)):
+            Rate.objects.bulk_create(Rate(car=car, rating=4) for _ in range(rates_number))
+        # Like the workers do when they start.
+        leaderboard.build()
+
+    def top(self, limit):
+        response = self.client.get(f"/popular/?limit={limit}")
+        self.assertEqual(200, response.status_code)
+        return response.json()
+
+    def assertMatchesDatabase(self, limit):
+        with override_settings(LEADERBOARD_ENABLED=False):
+            expected = self.top(limit)
+        self.assertEqual(expected, self.top(limit))
+
+    def test_is_updated_with_writes(self):
+        self.assertMatchesDatabase(4)
+
+        self.client.post("/rate/", data={"car_id": self.cars[1].id, "rating": 5})
+        self.client.post(
+            "/rate/bulk",
+            data=json.dumps([{"car_id": self.cars[3].id, "rating": 2}] * 4),
+            content_type="application/json",
+        )
+        Rate.objects.filter(car=self.cars[0]).first().delete()
+        self.client.delete(f"/cars/{self.cars[2].id}")
+
+        self.assertEqual(
+            [(self.cars[3].id, 4), (self.cars[0].id, 2), (self.cars[1].id, 2)],
+            [(car["id"], car["rates_number"]) for car in self.top(3)],
+        )
+        self.assertMatchesDatabase(4)
+
+    def test_serves_top_cars_without_queries(self):
+        self.top(2)
+        for _ in range(2):
+            self.client.post("/rate/", data={"car_id": self.cars[4].id, "rating": 5})
+
+        with self.assertNumQueries(0):
+            cars = self.top(2)
+
+        self.assertEqual([self.cars[2].id, self.cars[4].id], [car["id"] for car in cars])
+
+    def test_is_rebuilt_in_background_after_writes_of_other_workers(self):
+        self.top(2)
+
+        # Another worker rates a car.
+        Car.objects.filter(id=self.cars[5].id).update(rating_count=10)
+        leaderboard_module._bump_shared_version()
+
+        # Read from the database while the leaderboard is outdated.
+        self.assertEqual(self.cars[5].id, self.top(1)[0]["id"])
+        leaderboard._rebuild.join()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cars[5].id, self.top(1)[0]["id"])
+        self.assertMatchesDatabase(4)
+
+    def test_outdated_leaderboard_is_rebuilt_once(self):
+        leaderboard_module._bump_shared_version()
+        release = threading.Event()
+
+        with patch.object(leaderboard, "build", side_effect=lambda: release.wait(5)) as build:
+            self.top(2)
+            self.top(2)
+            release.set()
+            leaderboard._rebuild.join()
+
+        build.assert_called_once_with()
+
+    def test_write_read_by_build_is_not_counted_twice(self):
+        on_commit = []
+        with patch.object(
+            transaction, "on_commit", lambda function, using=None: on_commit.append(function)
+        ):
+            self.client.post("/rate/", data={"car_id": self.cars[1].id, "rating": 5})
+        # The build reads the rate before the worker which made it updates the leaderboard.
+        leaderboard.build()
+        for function in on_commit:
+            function()
+
+        self.assertEqual(2, self.top(3)[2]["rates_number"])
+        self.assertMatchesDatabase(4)
+
+    def test_lists_unrated_cars_from_database(self):
+        self.assertEqual(
+            [self.cars[3].id, self.cars[5].id], [car["id"] for car in self.top(6)[4:]]
+        )
+
+
+class TestSearch(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        for make, model in (
+            ("Volkswagen", "Golf"),
+            ("Volkswagen", "Golf Variant"),
+            ("Volkswagen", "Passat"),
+            ("Volvo", "V60 Cross Country"),
+            ("Škoda", "Octavia"),
+        ):
+            Car.objects.create(make=make, model=model)
+
+    def search(self, query):
+        response = self.client.get(f"/cars/search?{query}")
+        self.assertEqual(200, response.status_code)
+        return [(car["make"], car["model"]) for car in response.json()]
+
+    def test_matches_prefixes_of_make_and_model_words(self):
+        self.assertEqual(
+            {"Golf", "Golf Variant", "Passat", "V60 Cross Country"},
+            {model for _, model in self.search("q=vol")},
+        )
+        self.assertEqual([("Volkswagen", "Golf")], self.search("q=volks+golf&limit=1"))
+        self.assertEqual([("Volvo", "V60 Cross Country")], self.search("q=cross"))
+        self.assertEqual([("Škoda", "Octavia")], self.search("q=skoda"))
+        self.assertEqual([], self.search("q=golfx"))
+
+    def test_best_matches_come_first(self):
+        self.assertEqual(
+            [("Volkswagen", "Golf"), ("Volkswagen", "Golf Variant")], self.search("q=golf")
+        )
+
+    @override_settings(SEARCH_RANK_CANDIDATES=2)
+    def test_ranks_only_first_matches(self):
+        self.assertEqual(
+            [("Volkswagen", "Golf"), ("Volkswagen", "Golf Variant")],
+            self.search("q=volkswagen&limit=3"),
+        )
+
+    def test_index_follows_created_renamed_and_deleted_cars(self):
+        Car.objects.create(make="Fiat", model="Panda")
+        Car.objects.filter(model="Passat").update(model="Arteon")
+        Car.objects.filter(model="Octavia").delete()
+
+        self.assertEqual([("Fiat", "Panda")], self.search("q=pan"))
+        self.assertEqual([("Volkswagen", "Arteon")], self.search("q=arte"))
+        self.assertEqual([], self.search("q=passat"))
+        self.assertEqual([], self.search("q=octavia"))
+
+    def test_includes_average_rating_on_request(self):
+        golf = Car.objects.get(model="Golf")
+        Rate.objects.bulk_create([Rate(car=golf, rating=4), Rate(car=golf, rating=5)])
+
+        response = self.client.get("/cars/search?q=golf&rating=true&limit=1")
+
+        self.assertEqual(
+            [{"id": golf.id, "make": "Volkswagen", "model": "Golf", "avg_rating": 4.5}],
+            response.json(),
+        )
+
+    def test_like_search_of_other_databases_finds_the_same_cars(self):
+        for words in (["vol"], ["volks", "golf"], ["cross"], ["golfx"]):
+            with self.subTest(words=words):
+                like_matches = search._like_matches(Car.objects.all(), words)
+                self.assertEqual(
+                    set(search._fts_ranked_ids("default", words, 10)),
+                    set(like_matches.values_list("id", flat=True)),
+                )
+
+    def test_rejects_invalid_query_and_limit(self):
+        for query in ("", "q=", "q=+-+", f"q={'a' * 101}", "q=golf&limit=0", "q=golf&limit=x"):
+            with self.subTest(query=query):
+                self.assertEqual(400, self.client.get(f"/cars/search?{query}").status_code)
+
+
 class TestCarsPostGetDeleteIntegration(TestCase):
     def setUp(self) -> None:
         self.client = Client()
 
     def test_all_operations_integrate_well_with_one_another(self):
-        get_response_1 = self.client.get("/cars/")
+        get_response_1 = self.client.get("/cars/?unpaged=true")
 
         self.assertEqual(200, get_response_1.status_code)
         self.assertEqual([], get_response_1.json())
@@ -437,7 +1382,7 @@ class TestCarsPostGetDeleteIntegration(TestCase):
         self.assertEqual(201, post_response_1.status_code)
         self.assertEqual(201, post_response_2.status_code)
 
-        get_response_2 = self.client.get("/cars/")
+        get_response_2 = self.client.get("/cars/?unpaged=true")
         self.assertEqual(200, get_response_2.status_code)
         self.assertEqual(2, len(get_response_2.json()))
 
@@ -447,8 +1392,1761 @@ class TestCarsPostGetDeleteIntegration(TestCase):
             f"/cars/{car['id']}"
         )
 
-        get_response_3 = self.client.get("/cars/")
+        get_response_3 = self.client.get("/cars/?unpaged=true")
         self.assertEqual(1, len(get_response_3.json()))
 
 
 # More integrations tests could be done.
+
+
+class StubVpicHandler(BaseHTTPRequestHandler):
+    """Imitates the GetModelsForMake endpoint of the external API."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests_count += 1
+            server.client_ports.add(self.client_address[1])
+        time.sleep(server.delay)
+
+        if server.status != 200:
+            body = b"error"
+        elif server.body is not None:
+            body = server.body
+        else:
+            make = self.path.split("?")[0].rsplit("/", 1)[-1]
+            models = server.models.get(make, [])
+            body = json.dumps(
+                {"Results": [{"Model_Name": model} for model in models]}
+            ).encode()
+
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubVpicServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubVpicHandler)
+        self.lock = threading.Lock()
+        self.requests_count = 0
+        self.client_ports = set()
+        self.delay = 0
+        self.status = 200
+        # Returned instead of the models, e.g. to imitate malformed responses.
+        self.body = None
+        self.models = {"Volkswagen": ["Golf", "Passat"]}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/"
+
+
+class TestVpicClient(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = StubVpicServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_returns_model_names_of_make(self):
+        client = VpicClient(self.server.url)
+
+        self.assertEqual(["Golf", "Passat"], client.get_model_names("Volkswagen"))
+        self.assertEqual([], client.get_model_names("non-existing-make-name"))
+
+    def test_reuses_connection_between_calls(self):
+        client = VpicClient(self.server.url)
+
+        for _ in range(5):
+            client.get_model_names("Volkswagen")
+
+        self.assertEqual(5, self.server.requests_count)
+        self.assertEqual(1, len(self.server.client_ports))
+
+    def test_raises_error_when_response_takes_too_long(self):
+        self.server.delay = 0.5
+        client = VpicClient(self.server.url, read_timeout=0.1)
+
+        start = time.monotonic()
+        with self.assertRaises(VpicUnavailable):
+            client.get_model_names("Volkswagen")
+
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_raises_error_when_api_signals_a_problem(self):
+        self.server.status = 500
+        client = VpicClient(self.server.url)
+
+        with self.assertRaises(VpicUnavailable):
+            client.get_model_names("Volkswagen")
+
+    def test_concurrent_calls_for_the_same_make_make_one_request(self):
+        self.server.delay = 0.3
+        client = VpicClient(self.server.url)
+        results = []
+
+        def get_model_names():
+            results.append(client.get_model_names("Volkswagen"))
+
+        threads = [threading.Thread(target=get_model_names) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, self.server.requests_count)
+        self.assertEqual([["Golf", "Passat"]] * 10, results)
+
+    def test_stops_calling_api_after_repeated_failures(self):
+        self.server.status = 500
+        client = VpicClient(self.server.url, failure_threshold=3, recovery_timeout=60)
+
+        for _ in range(3):
+            with self.assertRaises(VpicUnavailable):
+                client.get_model_names("Volkswagen")
+        with self.assertRaises(CircuitOpen):
+            client.get_model_names("Volkswagen")
+
+        self.assertEqual(3, self.server.requests_count)
+
+    def test_malformed_response_fails_the_trial_call(self):
+        now = [0]
+        client = VpicClient(self.server.url)
+        client.breaker = CircuitBreaker(
+            failure_threshold=1, recovery_timeout=10, clock=lambda: now[0]
+        )
+        self.server.status = 500
+        with self.assertRaises(VpicUnavailable):
+            client.get_model_names("Volkswagen")
+
+        self.server.status = 200
+        for body in (b"[]", b'{"Results": null}', b'{"Results": [{"x": 1}]}'):
+            now[0] += 10
+            self.server.body = body
+            with self.assertRaises(VpicUnavailable) as raised:
+                client.get_model_names("Volkswagen")
+            # The trial call was made and its failure opened the circuit again.
+            self.assertNotIsInstance(raised.exception, CircuitOpen)
+            self.assertEqual(CircuitBreaker.OPEN, client.breaker.state)
+
+        now[0] += 10
+        self.server.body = None
+        self.assertEqual(["Golf", "Passat"], client.get_model_names("Volkswagen"))
+        self.assertEqual(CircuitBreaker.CLOSED, client.breaker.state)
+
+
+class TestCircuitBreaker(SimpleTestCase):
+    def setUp(self) -> None:
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            failure_threshold=2, recovery_timeout=10, clock=lambda: self.now
+        )
+
+    def test_opens_after_threshold_is_reached(self):
+        self.breaker.record_failure()
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_lets_single_trial_call_through_after_recovery_timeout(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpen):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_failed_trial_call_opens_circuit_again(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+        self.breaker.before_call()
+        self.breaker.record_failure()
+
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+
+
+
+class TestCatalog(TestCase):
+    get_model_names_target = "cars_app.views.vpic_client.get_model_names"
+
+    def setUp(self) -> None:
+        self.client = Client()
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+
+    def test_matches_names_regardless_of_case_and_whitespace(self):
+        self.assertTrue(car_in_catalog("  VOLKSWAGEN", "golf "))
+        self.assertFalse(car_in_catalog("Volkswagen", "Polo"))
+
+    def test_skips_pairs_already_in_catalog(self):
+        add_to_catalog([("volkswagen", "GOLF"), ("Volkswagen", "Polo")])
+
+        self.assertEqual(3, CatalogEntry.objects.count())
+
+    def test_creates_car_found_in_catalog_without_calling_external_api(self):
+        with patch(self.get_model_names_target) as get_model_names:
+            response = self.client.post("/cars/", data={"make": "volkswagen", "model": "golf"})
+
+        self.assertEqual(201, response.status_code)
+        get_model_names.assert_not_called()
+
+    def test_calls_external_api_on_catalog_miss_and_remembers_result(self):
+        with patch(self.get_model_names_target) as get_model_names:
+            get_model_names.return_value = ["Civic", "Accord"]
+
+            response = self.client.post("/cars/", data={"make": "Honda", "model": "civic"})
+
+        self.assertEqual(201, response.status_code)
+        get_model_names.assert_called_once_with("Honda")
+        self.assertTrue(car_in_catalog("Honda", "Accord"))
+
+
+class TestSyncCatalogCommand(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_loads_json_snapshot(self):
+        path = os.path.join(self.directory.name, "catalog.json")
+        with open(path, "w") as file:
+            json.dump(
+                {
+                    "Results": [
+                        {"Make_Name": "Volkswagen", "Model_Name": "Golf"},
+                        {"Make_Name": "Honda", "Model_Name": "Civic"},
+                    ]
+                },
+                file,
+            )
+
+        call_command("sync_catalog", file=path, stdout=open(os.devnull, "w"))
+
+        self.assertTrue(car_in_catalog("Volkswagen", "Golf"))
+        self.assertTrue(car_in_catalog("Honda", "Civic"))
+
+    def test_syncs_csv_snapshot_incrementally_and_prunes_removed_models(self):
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Beetle"), ("Honda", "Civic")])
+        path = os.path.join(self.directory.name, "catalog.csv")
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["Make_Name", "Model_Name"])
+            writer.writerow(["Volkswagen", "Golf"])
+            writer.writerow(["Volkswagen", "Passat"])
+
+        call_command("sync_catalog", file=path, prune=True, stdout=open(os.devnull, "w"))
+
+        self.assertTrue(car_in_catalog("Volkswagen", "Passat"))
+        self.assertFalse(car_in_catalog("Volkswagen", "Beetle"))
+        # Makes missing from the source are left untouched.
+        self.assertTrue(car_in_catalog("Honda", "Civic"))
+        self.assertEqual(3, CatalogEntry.objects.count())
+
+    def test_loads_catalog_from_external_api(self):
+        server = StubVpicServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        with patch(
+            "cars_app.management.commands.sync_catalog.vpic_client", VpicClient(server.url)
+        ):
+            call_command("sync_catalog", make=["Volkswagen"], stdout=open(os.devnull, "w"))
+
+        self.assertTrue(car_in_catalog("Volkswagen", "Golf"))
+        self.assertTrue(car_in_catalog("Volkswagen", "Passat"))
+
+
+
+class TestAsyncVpicClient(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = StubVpicServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    async def test_returns_model_names_of_make_over_single_connection(self):
+        client = AsyncVpicClient(self.server.url)
+
+        for _ in range(3):
+            self.assertEqual(["Golf", "Passat"], await client.get_model_names("Volkswagen"))
+        self.assertEqual([], await client.get_model_names("non-existing-make-name"))
+        await client.aclose()
+
+        self.assertEqual(4, self.server.requests_count)
+        self.assertEqual(1, len(self.server.client_ports))
+
+    async def test_concurrent_calls_for_the_same_make_make_one_request(self):
+        self.server.delay = 0.3
+        client = AsyncVpicClient(self.server.url)
+
+        results = await asyncio.gather(
+            *[client.get_model_names("Volkswagen") for _ in range(10)]
+        )
+        await client.aclose()
+
+        self.assertEqual(1, self.server.requests_count)
+        self.assertEqual([["Golf", "Passat"]] * 10, results)
+
+    async def test_raises_error_when_response_takes_too_long(self):
+        self.server.delay = 0.5
+        client = AsyncVpicClient(self.server.url, read_timeout=0.1)
+
+        with self.assertRaises(VpicUnavailable):
+            await client.get_model_names("Volkswagen")
+        await client.aclose()
+
+    async def test_stops_calling_api_after_repeated_failures(self):
+        self.server.status = 500
+        client = AsyncVpicClient(self.server.url, failure_threshold=2, recovery_timeout=60)
+
+        for _ in range(2):
+            with self.assertRaises(VpicUnavailable):
+                await client.get_model_names("Volkswagen")
+        with self.assertRaises(CircuitOpen):
+            await client.get_model_names("Volkswagen")
+        await client.aclose()
+
+    async def test_malformed_response_fails_the_trial_call(self):
+        now = [0]
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+        client = AsyncVpicClient(self.server.url, breaker=breaker)
+        breaker.record_failure()
+
+        now[0] = 10
+        self.server.body = b'{"Results": null}'
+        with self.assertRaises(VpicUnavailable) as raised:
+            await client.get_model_names("Volkswagen")
+        self.assertNotIsInstance(raised.exception, CircuitOpen)
+
+        now[0] = 20
+        self.server.body = None
+        self.assertEqual(["Golf", "Passat"], await client.get_model_names("Volkswagen"))
+        await client.aclose()
+
+        self.assertEqual(2, self.server.requests_count)
+
+
+class TestExport(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.golf = Car.objects.create(make="Volkswagen", model="Golf")
+        self.v40 = Car.objects.create(make="Volvo", model="V40, T3")
+        self.rates = [
+            Rate.objects.create(car=self.golf, rating=5),
+            Rate.objects.create(car=self.v40, rating=2),
+            Rate.objects.create(car=self.golf, rating=4),
+        ]
+
+    def _get_content(self, url):
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        return response.getvalue()
+
+    def test_exports_cars_as_csv(self):
+        rows = list(csv.reader(StringIO(self._get_content("/export/cars").decode())))
+
+        self.assertEqual(
+            [
+                ["id", "make", "model", "rating_count", "rating_sum"],
+                [str(self.golf.id), "Volkswagen", "Golf", "2", "9"],
+                [str(self.v40.id), "Volvo", "V40, T3", "1", "2"],
+            ],
+            rows,
+        )
+
+    def test_exports_rates_as_ndjson(self):
+        content = self._get_content("/export/rates?format=ndjson")
+
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(
+            [
+                {
+                    "id": rate.id,
+                    "car_id": rate.car_id,
+                    "rating": rate.rating,
+                    "created_at": rate.created_at.isoformat(),
+                }
+                for rate in self.rates
+            ],
+            rows,
+        )
+
+    def test_exports_rows_since_id(self):
+        content = self._get_content(f"/export/rates?format=ndjson&since={self.rates[0].id}")
+
+        ids = [json.loads(line)["id"] for line in content.decode().splitlines()]
+        self.assertEqual([self.rates[1].id, self.rates[2].id], ids)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_reads_rows_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            content = self._get_content("/export/rates")
+
+        self.assertEqual(4, len(content.decode().splitlines()))
+        # A full chunk of two rates, then the last rate.
+        self.assertEqual(2, len(queries))
+
+    def test_rejects_invalid_parameters(self):
+        self.assertEqual(406, self.client.get("/export/cars?format=xml").status_code)
+        self.assertEqual(400, self.client.get("/export/cars?since=-1").status_code)
+        self.assertEqual(400, self.client.get(f"/export/cars?since={2**70}").status_code)
+
+    def test_command_exports_the_same_data(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "rates.ndjson")
+
+        call_command(
+            "export_cars_rates",
+            "rates",
+            format="ndjson",
+            since=self.rates[0].id,
+            output=path,
+            stdout=open(os.devnull, "w"),
+        )
+
+        with open(path, "rb") as exported:
+            self.assertEqual(
+                self._get_content(f"/export/rates?format=ndjson&since={self.rates[0].id}"),
+                exported.read(),
+            )
+
+    def test_memory_use_does_not_grow_with_table_size(self):
+        def peak_memory(rates_number):
+            Rate.objects.bulk_create(Rate(car=self.golf, rating=3) for _ in range(rates_number))
+            tracemalloc.start()
+            try:
+                for _ in self.client.get("/export/rates"):
+                    pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                Rate.objects.all().delete()
+
+        with self.settings(EXPORT_CHUNK_SIZE=500):
+            small = peak_memory(2_000)
+            large = peak_memory(8_000)
+
+        self.assertLess(large, small * 1.5)
+
+
+class TestImportCarsRates(TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        add_to_catalog([("Volkswagen", "Golf"), ("Volvo", "V40")])
+
+    def _write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        return path
+
+    def _import(self, table, path, **options):
+        call_command("import_cars_rates", table, path, stdout=open(os.devnull, "w"), **options)
+
+    def _rejects(self, path):
+        with open(f"{path}.rejected.ndjson", encoding="utf-8") as rejects:
+            return [json.loads(line) for line in rejects]
+
+    def test_imports_cars_from_csv_and_rates_from_ndjson(self):
+        cars = self._write("cars.csv", "id,make,model\n10,Volkswagen,Golf\n20,Volvo,V40\n")
+        rates = self._write(
+            "rates.ndjson",
+            '{"car_id": 10, "rating": 5, "created_at": "2021-03-01T10:00:00+00:00"}\n'
+            '{"car_id": 10, "rating": 2}\n'
+            '{"id": 7, "car_id": 20, "rating": 4, "created_at": "2021-03-01T11:00:00"}\n',
+        )
+
+        self._import("cars", cars)
+        self._import("rates", rates)
+
+        self.assertEqual(
+            [(10, "Volkswagen", "Golf", 2, 7), (20, "Volvo", "V40", 1, 4)],
+            list(
+                Car.objects.order_by("id").values_list(
+                    "id", "make", "model", "rating_count", "rating_sum"
+                )
+            ),
+        )
+        # Times without a time zone are in UTC.
+        self.assertEqual(
+            timezone.datetime(2021, 3, 1, 11, tzinfo=timezone.utc), Rate.objects.get(id=7).created_at
+        )
+        self.assertIsNone(Rate.objects.get(car_id=10, rating=2).created_at)
+
+    def test_reports_rejected_rows(self):
+        Car.objects.create(id=10, make="Volkswagen", model="Golf")
+        cars = self._write("cars.csv", "id,make,model\n10,Volvo,V40\n,volkswagen,GOLF\n,Volvo,\n")
+        rates = self._write(
+            "rates.ndjson",
+            '{"car_id": 10, "rating": 6}\nnot json\n{"car_id": 99, "rating": 3}\n'
+            '{"car_id": 10, "rating": 3}\n',
+        )
+
+        self._import("cars", cars)
+        self._import("rates", rates)
+
+        self.assertEqual(1, Car.objects.count())
+        self.assertEqual([3], list(Rate.objects.values_list("rating", flat=True)))
+        self.assertEqual(
+            [
+                (1, "Car with this ID already exists."),
+                (2, "Car with this make and model already exists."),
+                (3, "model: This field cannot be blank."),
+            ],
+            [(reject["row"], reject["reason"]) for reject in self._rejects(cars)],
+        )
+        self.assertEqual(
+            [
+                (
+                    1,
+                    "rating: Ensure this value is less than or equal to 5.",
+                    {"car_id": 10, "rating": 6},
+                ),
+                (2, "Row is not an object.", "not json"),
+                (3, "The car does not exist.", {"car_id": 99, "rating": 3}),
+            ],
+            [(reject["row"], reject["reason"], reject["data"]) for reject in self._rejects(rates)],
+        )
+
+    def test_rejects_rates_like_the_bulk_endpoint(self):
+        Car.objects.create(id=10, make="Volkswagen", model="Golf")
+        rates = self._write(
+            "rates.ndjson",
+            '{"car_id": 10, "rating": 3.7}\n{"car_id": 10, "rating": true}\n'
+            '{"car_id": 99999999999999999999, "rating": 3}\n'
+            '{"id": 99999999999999999999, "car_id": 10, "rating": 3}\n'
+            '{"car_id": 10, "rating": 4.0}\n',
+        )
+
+        self._import("rates", rates)
+
+        self.assertEqual([4], list(Rate.objects.values_list("rating", flat=True)))
+        self.assertEqual(
+            [
+                (1, "rating has to be an integer."),
+                (2, "rating has to be an integer."),
+                (3, "car_id has to be a positive integer."),
+                (4, "id has to be a positive integer."),
+            ],
+            [(reject["row"], reject["reason"]) for reject in self._rejects(rates)],
+        )
+
+    def test_checks_cars_against_the_catalog_unless_skipped(self):
+        cars = self._write("cars.csv", "make,model\nvolkswagen,GOLF\nTesla,Model S\n")
+
+        self._import("cars", cars)
+        self.assertEqual(["volkswagen"], list(Car.objects.values_list("make", flat=True)))
+        self.assertEqual(
+            ["The car is not in the catalog."], [reject["reason"] for reject in self._rejects(cars)]
+        )
+
+        self._import("cars", cars, validate="skip", restart=True)
+        self.assertTrue(Car.objects.filter(make="Tesla").exists())
+
+    def test_loads_catalog_snapshot_first(self):
+        snapshot = self._write(
+            "catalog.json", json.dumps([{"Make_Name": "Tesla", "Model_Name": "Model S"}])
+        )
+        cars = self._write("cars.csv", "make,model\nTesla,Model S\n")
+
+        self._import("cars", cars, catalog_snapshot=snapshot)
+
+        self.assertTrue(Car.objects.filter(make="Tesla", model="Model S").exists())
+
+    def test_resumes_from_checkpoint_after_interruption(self):
+        car = Car.objects.create(make="Volkswagen", model="Golf")
+        rates = self._write(
+            "rates.csv",
+            "car_id,rating\n" + "".join(f"{car.id},{1 + i % 5}\n" for i in range(10)),
+        )
+        batches = []
+
+        def fail_third_batch(*args, **kwargs):
+            batches.append(args)
+            if len(batches) == 3:
+                raise KeyboardInterrupt
+            return import_batch(*args, **kwargs)
+
+        target = "cars_app.management.commands.import_cars_rates.import_batch"
+        with patch(target, side_effect=fail_third_batch), self.assertRaises(KeyboardInterrupt):
+            self._import("rates", rates, batch_size=3)
+        self.assertEqual(6, Rate.objects.count())
+        self.assertEqual(6, ImportCheckpoint.objects.get().rows)
+
+        self._import("rates", rates, batch_size=3)
+
+        car.refresh_from_db()
+        self.assertEqual(10, car.rating_count)
+        self.assertEqual(sum(1 + i % 5 for i in range(10)), car.rating_sum)
+        self.assertEqual(10, ImportCheckpoint.objects.get().rows)
+
+    def test_imports_an_export(self):
+        golf = Car.objects.create(make="Volkswagen", model="Golf")
+        v40 = Car.objects.create(make="Volvo", model="V40")
+        Rate.objects.create(car=golf, rating=5)
+        Rate.objects.create(car=v40, rating=2, created_at=None)
+        paths = {}
+        exported = {}
+        for table, format in (("cars", "csv"), ("rates", "ndjson")):
+            paths[table] = os.path.join(self.directory, f"{table}.{format}")
+            call_command(
+                "export_cars_rates",
+                table,
+                format=format,
+                output=paths[table],
+                stdout=open(os.devnull, "w"),
+            )
+            exported[table] = list(export_rows(table))
+        Car.objects.all().delete()
+
+        self._import("cars", paths["cars"])
+        # The aggregates of the export are recomputed from the imported rates.
+        self.assertEqual(0, Car.objects.get(id=golf.id).rating_count)
+        self._import("rates", paths["rates"])
+
+        for table in ("cars", "rates"):
+            self.assertEqual(exported[table], list(export_rows(table)))
+
+
+class TestImportSqlitePragmas(TransactionTestCase):
+    def test_restores_sqlite_pragmas(self):
+        def synchronous():
+            with connection.cursor() as cursor:
+                return cursor.execute("PRAGMA synchronous").fetchone()[0]
+
+        before = synchronous()
+        with import_sqlite_pragmas(connection):
+            self.assertEqual(0, synchronous())  # OFF
+        self.assertEqual(before, synchronous())
+
+
+class TestPagination(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        Car.objects.bulk_create(
+            [Car(make="Volvo", model=f"volvo-model-{i}") for i in range(7)]
+        )
+        cars = Car.objects.order_by("id")
+        for car, rates_number in zip(cars, [1, 3, 0, 3, 1, 3, 2]):
+            Rate.objects.bulk_create([Rate(car=car, rating=4)] * rates_number)
+
+    def _read_all_pages(self, url):
+        items = []
+        response = self.client.get(url)
+        while True:
+            self.assertEqual(200, response.status_code)
+            page = response.json()
+            self.assertLessEqual(len(page["results"]), 3)
+            items += page["results"]
+            if page["next"] is None:
+                return items
+            response = self.client.get(f"{url}&after={page['next']}")
+
+    def test_pages_of_cars_hold_all_cars_in_order(self):
+        cars = self._read_all_pages("/cars/?page_size=3")
+
+        self.assertEqual(self.client.get("/cars/?unpaged=true").json(), cars)
+
+    def test_pages_of_popular_cars_hold_all_cars_in_order(self):
+        cars = self._read_all_pages("/popular/?page_size=3")
+
+        self.assertEqual(self.client.get("/popular/?unpaged=true").json(), cars)
+        self.assertEqual([3, 3, 3, 2, 1, 1, 0], [car["rates_number"] for car in cars])
+
+    def test_last_page_has_no_next_cursor(self):
+        response = self.client.get("/cars/?page_size=7")
+
+        self.assertEqual(7, len(response.json()["results"]))
+        self.assertIsNone(response.json()["next"])
+
+    def test_pages_are_read_without_offset(self):
+        first_page = self.client.get("/popular/?page_size=3").json()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/popular/", {"page_size": 3, "after": first_page["next"]})
+
+        self.assertNotIn("OFFSET", queries[0]["sql"])
+
+    def test_returns_error_for_invalid_parameters(self):
+        for url in (
+            "/cars/?after=not-a-cursor",
+            "/popular/?after=WzFd",  # Cursor of /cars/.
+            f"/cars/?after={encode_cursor([2**70])}",
+            f"/cars/?after={encode_cursor([True])}",
+            "/cars/?page_size=0",
+            "/popular/?page_size=abc",
+            "/cars/?page_size=1000000",
+        ):
+            response = self.client.get(url)
+
+            self.assertEqual(400, response.status_code, url)
+
+
+class TestStreamingLists(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+
+    def _get_content(self, url, stream):
+        with patch.object(CarsView, "stream_lists", stream), patch.object(
+            Popular, "stream_lists", stream
+        ):
+            response = self.client.get(url)
+        self.assertEqual(stream, response.streaming)
+        return response.getvalue()
+
+    def test_streamed_lists_are_identical_to_not_streamed_ones(self):
+        Car.objects.bulk_create(
+            [Car(make="Volvo", model=f"volvo-model-{i}") for i in range(25)]
+        )
+        cars = Car.objects.all()
+        Rate.objects.bulk_create([Rate(car=cars[0], rating=4), Rate(car=cars[3], rating=1)])
+
+        for url in ("/cars/?unpaged=true", "/popular/?unpaged=true"):
+            self.assertEqual(
+                self._get_content(url, stream=False), self._get_content(url, stream=True)
+            )
+
+    def test_streamed_empty_list_is_identical_to_not_streamed_one(self):
+        self.assertEqual(b"[]", self._get_content("/cars/?unpaged=true", stream=True))
+
+    def test_splits_list_into_chunks(self):
+        response = StreamingJsonListResponse(
+            ({"id": i} for i in range(5)), items_per_chunk=2
+        )
+
+        self.assertEqual(
+            [b'[{"id": 0}, {"id": 1}', b', {"id": 2}, {"id": 3}', b', {"id": 4}]'],
+            list(response),
+        )
+
+    def test_memory_use_does_not_grow_with_list_size(self):
+        def peak_memory(cars_number, stream):
+            Car.objects.bulk_create(
+                [Car(make="Volvo", model=f"volvo-model-{i}") for i in range(cars_number)]
+            )
+            tracemalloc.start()
+            try:
+                with patch.object(CarsView, "stream_lists", stream):
+                    response = self.client.get("/cars/?unpaged=true")
+                    for _ in response:
+                        pass
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                Car.objects.all().delete()
+
+        streamed_small = peak_memory(5_000, stream=True)
+        streamed_large = peak_memory(20_000, stream=True)
+        not_streamed_large = peak_memory(20_000, stream=False)
+
+        self.assertLess(streamed_large, streamed_small * 1.5)
+        self.assertLess(streamed_large * 4, not_streamed_large)
+
+
+class TestResponseFormats(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.car1 = Car.objects.create(make="Volkswagen", model="Golf")
+        self.car2 = Car.objects.create(make="Volvo", model="V40")
+        Rate.objects.create(car=self.car2, rating=4)
+
+    def test_returns_json_encoded_like_before_by_default(self):
+        response = self.client.get("/cars/?unpaged=true")
+
+        self.assertEqual("application/json", response["Content-Type"])
+        self.assertEqual("Accept", response["Vary"])
+        self.assertEqual(
+            JsonResponse(
+                list(Car.objects.with_avg_rating().order_by("id").values(*CarsView.fields)),
+                safe=False,
+            ).content,
+            response.content,
+        )
+
+    @override_settings(COMPACT_JSON_RESPONSES=True)
+    def test_returns_compact_json_when_enabled(self):
+        response = self.client.get("/cars/?unpaged=true")
+
+        self.assertEqual(
+            b'[{"id":%d,"make":"Volkswagen","model":"Golf","avg_rating":null},'
+            b'{"id":%d,"make":"Volvo","model":"V40","avg_rating":4.0}]'
+            % (self.car1.id, self.car2.id),
+            response.content,
+        )
+
+    def test_returns_columns(self):
+        for url in ("/popular/?unpaged=true", "/popular/?limit=5"):
+            response = self.client.get(url + "&format=columns")
+
+            self.assertEqual(COLUMNAR_JSON, response["Content-Type"])
+            self.assertEqual(
+                {
+                    "id": [self.car2.id, self.car1.id],
+                    "make": ["Volvo", "Volkswagen"],
+                    "model": ["V40", "Golf"],
+                    "rates_number": [1, 0],
+                },
+                json.loads(response.content),
+            )
+
+    def test_returns_columns_of_page(self):
+        response = self.client.get("/cars/?page_size=1&format=columns&fields=model")
+
+        page = json.loads(response.content)
+        self.assertEqual({"model": ["Golf"]}, page["results"])
+        self.assertIn("next", page)
+
+    def test_negotiates_format_with_accept_header(self):
+        response = self.client.get(
+            "/cars/?unpaged=true", HTTP_ACCEPT=f"text/html, {COLUMNAR_JSON};q=0.9"
+        )
+
+        self.assertEqual(COLUMNAR_JSON, response["Content-Type"])
+        self.assertEqual(["Golf", "V40"], json.loads(response.content)["model"])
+
+    def test_prefers_media_types_with_higher_q_value(self):
+        for accept, media_type in (
+            (f"application/json;q=0.5, {COLUMNAR_JSON}", COLUMNAR_JSON),
+            (f"{COLUMNAR_JSON};q=0, application/json", "application/json"),
+            (f"{COLUMNAR_JSON};q=0.2, */*;q=0.8", "application/json"),
+        ):
+            with self.subTest(accept=accept):
+                response = self.client.get("/cars/", HTTP_ACCEPT=accept)
+
+                self.assertEqual(media_type, response["Content-Type"])
+
+    def test_skips_unavailable_media_types(self):
+        with patch.object(responses, "msgpack", None):
+            response = self.client.get(
+                "/cars/", HTTP_ACCEPT="application/msgpack, application/json"
+            )
+
+        self.assertEqual("application/json", response["Content-Type"])
+
+    def test_rejects_accept_header_refusing_all_known_formats(self):
+        response = self.client.get("/cars/", HTTP_ACCEPT="application/json;q=0")
+
+        self.assertEqual(406, response.status_code)
+
+    def test_unsupported_accept_header_falls_back_to_json(self):
+        response = self.client.get("/cars/", HTTP_ACCEPT="text/html")
+
+        self.assertEqual("application/json", response["Content-Type"])
+
+    def test_rejects_unknown_format(self):
+        response = self.client.get("/cars/?format=xml")
+
+        self.assertEqual(406, response.status_code)
+
+    def test_returns_msgpack(self):
+        response = self.client.get("/popular/?limit=1&format=msgpack&fields=id,rates_number")
+
+        self.assertEqual("application/msgpack", response["Content-Type"])
+        self.assertEqual(
+            [{"id": self.car2.id, "rates_number": 1}], responses.msgpack.unpackb(response.content)
+        )
+
+    def test_rejects_msgpack_when_not_installed(self):
+        with patch.object(responses, "msgpack", None):
+            for url, accept in (
+                ("/cars/", "application/msgpack"),
+                ("/cars/?format=msgpack", "application/json"),
+            ):
+                response = self.client.get(url, HTTP_ACCEPT=accept)
+
+                self.assertEqual(406, response.status_code)
+
+    def test_returns_requested_fields(self):
+        for url in ("/cars/?fields=model,id", "/cars/?unpaged=true&fields=model,id"):
+            response = self.client.get(url)
+
+            rows = json.loads(response.content)
+            rows = rows["results"] if "results" in rows else rows
+            self.assertEqual(
+                [{"id": self.car1.id, "model": "Golf"}, {"id": self.car2.id, "model": "V40"}],
+                rows,
+            )
+
+    def test_pages_without_the_key_field(self):
+        first = json.loads(self.client.get("/popular/?page_size=1&fields=model").content)
+        second = json.loads(
+            self.client.get(
+                "/popular/", {"page_size": 1, "fields": "model", "after": first["next"]}
+            ).content
+        )
+
+        self.assertEqual([{"model": "V40"}], first["results"])
+        self.assertEqual([{"model": "Golf"}], second["results"])
+
+    def test_does_not_compute_fields_which_are_not_requested(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get("/cars/?unpaged=true&fields=id,make")
+
+        self.assertNotIn("rating_sum", queries.captured_queries[0]["sql"])
+        self.assertNotIn('"model"', queries.captured_queries[0]["sql"])
+
+    def test_rejects_unknown_fields(self):
+        for url in ("/cars/?fields=id,price", "/popular/?fields=", "/popular/?limit=1&fields=x"):
+            response = self.client.get(url)
+
+            self.assertEqual(400, response.status_code, url)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=60)
+class TestResponseCache(TransactionTestCase):
+    # Cache is invalidated when transactions commit, so the tests can't run in a transaction.
+
+    def setUp(self) -> None:
+        self.client = Client()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.car = Car.objects.create(make="Volkswagen", model="Golf")
+
+    def test_serves_repeated_requests_from_cache(self):
+        for url in ("/cars/", "/popular/?unpaged=true"):
+            first_response = self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                second_response = self.client.get(url)
+
+            self.assertEqual("MISS", first_response["X-Cache"])
+            self.assertEqual("HIT", second_response["X-Cache"])
+            self.assertEqual(first_response.content, second_response.content)
+            self.assertEqual(0, len(queries))
+
+    def test_writes_invalidate_cached_responses(self):
+        self.client.get("/popular/?unpaged=true")
+
+        self.client.post("/rate/", data={"car_id": self.car.id, "rating": 5})
+        response = self.client.get("/popular/?unpaged=true")
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(1, response.json()[0]["rates_number"])
+
+        with patch("cars_app.views.vpic_client.get_model_names") as get_model_names:
+            get_model_names.return_value = ["Passat"]
+            self.client.post("/cars/", data={"make": "Volkswagen", "model": "Passat"})
+        response = self.client.get("/popular/?unpaged=true")
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(2, len(response.json()))
+
+        self.client.delete(f"/cars/{self.car.id}")
+        response = self.client.get("/popular/?unpaged=true")
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual(1, len(response.json()))
+
+    def test_caches_formats_separately(self):
+        json_response = self.client.get("/cars/")
+        columns_response = self.client.get("/cars/", HTTP_ACCEPT=COLUMNAR_JSON)
+        cached_columns_response = self.client.get("/cars/", HTTP_ACCEPT=COLUMNAR_JSON)
+
+        self.assertEqual("MISS", columns_response["X-Cache"])
+        self.assertEqual("HIT", cached_columns_response["X-Cache"])
+        self.assertEqual(COLUMNAR_JSON, cached_columns_response["Content-Type"])
+        self.assertEqual("Accept", cached_columns_response["Vary"])
+        self.assertNotEqual(json_response.content, cached_columns_response.content)
+
+    def test_failed_writes_do_not_invalidate_cached_responses(self):
+        self.client.get("/cars/")
+
+        self.client.post("/rate/", data={"car_id": self.car.id, "rating": 6})
+        self.client.delete("/cars/999999999")
+
+        self.assertEqual("HIT", self.client.get("/cars/")["X-Cache"])
+
+    def test_counts_hits_and_misses(self):
+        self.client.get("/cars/")
+        self.client.get("/cars/")
+        self.client.get("/cars/")
+
+        self.assertEqual(
+            {"hits": 2, "stale_hits": 0, "misses": 1}, self.client.get("/cache/stats").json()
+        )
+
+    @override_settings(RESPONSE_CACHE_STALE_TIMEOUT=60)
+    def test_serves_stale_response_while_refreshing_it(self):
+        self.client.get("/popular/?unpaged=true")
+        self.client.post("/rate/", data={"car_id": self.car.id, "rating": 5})
+
+        with patch("cars_app.cache._refresh_in_background") as refresh_in_background:
+            stale_response = self.client.get("/popular/?unpaged=true")
+            refresh_in_background.call_args.args[0]()
+
+        self.assertEqual("STALE", stale_response["X-Cache"])
+        self.assertEqual(0, stale_response.json()[0]["rates_number"])
+
+        fresh_response = self.client.get("/popular/?unpaged=true")
+        self.assertEqual("HIT", fresh_response["X-Cache"])
+        self.assertEqual(1, fresh_response.json()[0]["rates_number"])
+
+    def test_works_with_file_based_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        file_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": directory.name,
+            }
+        }
+
+        with override_settings(CACHES=file_cache):
+            self.client.get("/cars/")
+            self.assertEqual("HIT", self.client.get("/cars/")["X-Cache"])
+            self.client.post("/rate/", data={"car_id": self.car.id, "rating": 5})
+            self.assertEqual("MISS", self.client.get("/cars/")["X-Cache"])
+
+
+@override_settings(CONDITIONAL_GET_ENABLED=True)
+class TestConditionalGet(TransactionTestCase):
+    # The data version changes when transactions commit, so the tests can't run in a transaction.
+
+    def setUp(self) -> None:
+        self.client = Client()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.car = Car.objects.create(make="Volkswagen", model="Golf")
+
+    def test_returns_not_modified_without_querying_database(self):
+        for url in ("/cars/", "/popular/?unpaged=true", f"/cars/{self.car.id}/ratings"):
+            etag = self.client.get(url)["ETag"]
+            with CaptureQueriesContext(connection) as queries, patch.object(
+                models.QuerySet, "annotate"
+            ) as annotate:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(304, response.status_code)
+            self.assertEqual(b"", response.content)
+            self.assertEqual(0, len(queries))
+            annotate.assert_not_called()
+
+    def test_writes_change_etag(self):
+        etag = self.client.get("/popular/")["ETag"]
+
+        self.client.post("/rate/", data={"car_id": self.car.id, "rating": 5})
+        response = self.client.get("/popular/", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertEqual(1, response.json()["results"][0]["rates_number"])
+
+    def test_formats_have_different_etags(self):
+        etag = self.client.get("/cars/")["ETag"]
+        response = self.client.get("/cars/?format=columns", HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
+    def test_returns_not_modified_since_last_write(self):
+        cache.set(cache_module.CHANGED_AT_KEY, time.time() - 10, timeout=None)
+        last_modified = self.client.get("/cars/")["Last-Modified"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get("/cars/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(304, response.status_code)
+
+    def test_matches_weak_etag_of_compressed_response(self):
+        Car.objects.bulk_create(
+            [Car(make="Volvo", model=f"volvo-model-{i}") for i in range(100)]
+        )
+        response = self.client.get("/cars/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertTrue(response["ETag"].startswith('W/"'))
+
+        response = self.client.get(
+            "/cars/", HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(304, response.status_code)
+
+    @override_settings(CONDITIONAL_GET_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+    def test_can_be_turned_off(self):
+        with patch.object(cache_module, "_cache") as shared_cache:
+            response = self.client.get("/cars/")
+
+        self.assertNotIn("ETag", response)
+        self.assertNotIn("Last-Modified", response)
+        # Not even the time of the last write is read from the cache.
+        shared_cache.assert_not_called()
+
+
+class TestCompression(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        Car.objects.bulk_create(
+            [Car(make="Volvo", model=f"volvo-model-{i}") for i in range(100)]
+        )
+
+    def test_compresses_large_responses_with_gzip(self):
+        plain = self.client.get("/cars/?unpaged=true")
+        compressed = self.client.get("/cars/?unpaged=true", HTTP_ACCEPT_ENCODING="gzip, deflate")
+
+        self.assertEqual("gzip", compressed["Content-Encoding"])
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertEqual(plain.content, gzip.decompress(compressed.content))
+
+    def test_compresses_streamed_responses(self):
+        plain = self.client.get("/cars/?unpaged=true")
+        with patch.object(CarsView, "stream_lists", True):
+            compressed = self.client.get("/cars/?unpaged=true", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual("gzip", compressed["Content-Encoding"])
+        self.assertEqual(plain.content, gzip.decompress(compressed.getvalue()))
+
+    def test_does_not_compress_small_responses(self):
+        response = self.client.get("/cars/?page_size=1", HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertNotIn("Content-Encoding", response)
+
+    def test_does_not_compress_without_accept_encoding(self):
+        self.assertNotIn("Content-Encoding", self.client.get("/cars/?unpaged=true"))
+
+    @skipUnless(compression.brotli, "brotli is not installed")
+    def test_compresses_with_brotli(self):
+        plain = self.client.get("/cars/?unpaged=true")
+        compressed = self.client.get("/cars/?unpaged=true", HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual("br", compressed["Content-Encoding"])
+        self.assertEqual(plain.content, compression.brotli.decompress(compressed.content))
+
+    def test_uses_gzip_when_brotli_is_not_installed(self):
+        with patch.object(compression, "brotli", None):
+            response = self.client.get("/cars/?unpaged=true", HTTP_ACCEPT_ENCODING="br, gzip")
+
+        self.assertEqual("gzip", response["Content-Encoding"])
+
+
+class TestApiProfile(SimpleTestCase):
+    # Settings are read once, so the profile is loaded in a separate process.
+    def _run_with_api_profile(self, code):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        process = subprocess.run(
+            [sys.executable, "-c", code],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                "DJANGO_PROFILE": "api",
+                "DJANGO_SETTINGS_MODULE": "cars_site.settings",
+                "ALLOWED_HOSTS": "testserver",
+                # Requests would otherwise open the database of the source tree, also to expire
+                # the trending buckets after the response.
+                "DATABASE_NAME": os.path.join(directory, "db.sqlite3"),
+                "TRENDING_EXPIRY_INTERVAL": "0",
+            },
+        )
+        return json.loads(process.stdout)
+
+    def test_serves_api_without_admin_sessions_and_auth(self):
+        result = self._run_with_api_profile(
+            """
+import json, sys
+import django
+django.setup()
+from django.conf import settings
+from django.test import Client
+
+print(json.dumps({
+    "apps": settings.INSTALLED_APPS,
+    "middleware": settings.MIDDLEWARE,
+    "api": Client().get("/cache/stats").status_code,
+    "admin": Client().get("/admin/").status_code,
+    "modules": [name for name in sys.modules if name.startswith(("django.contrib", "requests"))],
+}))
+"""
+        )
+
+        self.assertEqual(["cars_app.apps.CarsAppConfig"], result["apps"])
+        self.assertFalse(
+            [middleware for middleware in result["middleware"] if "contrib" in middleware]
+        )
+        self.assertEqual(200, result["api"])
+        self.assertEqual(404, result["admin"])
+        self.assertEqual([], result["modules"])
+
+    def test_imports_http_client_when_external_api_is_called(self):
+        result = self._run_with_api_profile(
+            """
+import json, sys
+import django
+django.setup()
+from cars_app.validation import VpicClient, VpicUnavailable
+
+imported = ["requests" in sys.modules]
+try:
+    VpicClient("http://127.0.0.1:9", connect_timeout=0.1).get_model_names("Volvo")
+except VpicUnavailable:
+    pass
+imported.append("requests" in sys.modules)
+print(json.dumps(imported))
+"""
+        )
+
+        self.assertEqual([False, True], result)
+
+
+class TestReplicaRouting(SimpleTestCase):
+    replicated_databases = {"default": {}, "replica_0": {}, "replica_1": {}}
+
+    def setUp(self) -> None:
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def _read_database(self, request):
+        read_from = []
+
+        def get_response(request):
+            read_from.append(self.router.db_for_read(Car))
+            return HttpResponse()
+
+        with override_settings(DATABASES=self.replicated_databases):
+            response = ReplicaPinningMiddleware(get_response)(request)
+        return read_from[0], response
+
+    def test_reads_from_replicas_and_writes_to_primary(self):
+        database, response = self._read_database(self.factory.get("/cars/"))
+
+        self.assertIn(database, ("replica_0", "replica_1"))
+        self.assertEqual("default", self.router.db_for_write(Car))
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_reads_from_primary_after_write(self):
+        database, response = self._read_database(self.factory.post("/rate/"))
+
+        self.assertEqual("default", database)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        request = self.factory.get("/cars/")
+        request.COOKIES[PIN_COOKIE] = response.cookies[PIN_COOKIE].value
+        database, _ = self._read_database(request)
+        self.assertEqual("default", database)
+
+    def test_reads_from_replicas_when_pin_expires(self):
+        request = self.factory.get("/cars/")
+        request.COOKIES[PIN_COOKIE] = str(int(time.time()) - 1)
+
+        database, _ = self._read_database(request)
+
+        self.assertIn(database, ("replica_0", "replica_1"))
+
+    def test_streamed_response_reads_from_primary_when_pinned(self):
+        def get_response(request):
+            return StreamingHttpResponse(self.router.db_for_read(Car) for _ in range(3))
+
+        request = self.factory.get("/export/rates")
+        request.COOKIES[PIN_COOKIE] = str(int(time.time()) + 60)
+        with override_settings(DATABASES=self.replicated_databases):
+            response = ReplicaPinningMiddleware(get_response)(request)
+            databases = [chunk.decode() for chunk in response]
+
+        self.assertEqual(["default"] * 3, databases)
+
+    async def test_pins_async_requests_in_the_threads_of_the_view(self):
+        read_from = []
+
+        async def get_response(request):
+            read_from.append(await sync_to_async(self.router.db_for_read)(Car))
+            return HttpResponse()
+
+        middleware = ReplicaPinningMiddleware(get_response)
+        with override_settings(DATABASES=self.replicated_databases):
+            response = await middleware(self.factory.post("/rate/"))
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertEqual(["default"], read_from)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_migrates_only_primary(self):
+        self.assertTrue(self.router.allow_migrate("default", "cars_app"))
+        self.assertFalse(self.router.allow_migrate("replica_0", "cars_app"))
+
+
+class TestDatabaseConnections(TestCase):
+    def test_sqlite_connections_use_wal_journal(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite specific.")
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual("wal", cursor.fetchone()[0])
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(5000, cursor.fetchone()[0])
+
+    def test_closes_broken_persistent_connections(self):
+        connection.ensure_connection()
+
+        with patch.object(connection, "is_usable", return_value=False), patch.object(
+            connection, "close"
+        ) as close:
+            close_broken_connections()
+
+        close.assert_called_once()
+
+
+# The async views are expected to behave exactly like the sync ones, so the same tests are run
+# against them.
+async_urls = override_settings(ROOT_URLCONF="cars_app.async_urls")
+
+
+@async_urls
+class TestAsyncCarsViewPost(TestCarsViewPost):
+    get_model_names_target = "cars_app.async_views.async_vpic_client.get_model_names"
+
+
+@async_urls
+class TestAsyncCarsViewGet(TestCarsViewGet):
+    pass
+
+
+@async_urls
+class TestAsyncCarsDeleteView(TestCarsDeleteView):
+    pass
+
+
+@async_urls
+class TestAsyncCarsBulkDelete(TestCarsBulkDelete):
+    pass
+
+
+@async_urls
+class TestAsyncRateView(TestRateView):
+    pass
+
+
+@async_urls
+class TestAsyncCarRatingsView(TestCarRatingsView):
+    pass
+
+
+@async_urls
+class TestAsyncPopularView(TestPopularView):
+    pass
+
+
+@async_urls
+class TestAsyncPagination(TestPagination):
+    pass
+
+
+@async_urls
+class TestAsyncCatalog(TestCatalog):
+    get_model_names_target = "cars_app.async_views.async_vpic_client.get_model_names"
+
+
+@async_urls
+class TestAsyncViewsOverAsgi(TestCase):
+    async def test_lists_cars(self):
+        car = await sync_to_async(Car.objects.create)(make="Volkswagen", model="Golf")
+
+        response = await AsyncClient().get("/cars/?unpaged=true")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            [{"id": car.id, "make": "Volkswagen", "model": "Golf", "avg_rating": None}],
+            response.json(),
+        )
+
+    async def test_returns_error_for_not_allowed_method(self):
+        response = await AsyncClient().put("/cars/")
+
+        self.assertEqual(405, response.status_code)
+
+    async def test_validates_concurrent_requests_at_once(self):
+        in_flight = 0
+        most_in_flight = 0
+
+        async def get_model_names(make):
+            nonlocal in_flight, most_in_flight
+            in_flight += 1
+            most_in_flight = max(most_in_flight, in_flight)
+            await asyncio.sleep(0.1)
+            in_flight -= 1
+            return []
+
+        with patch("cars_app.async_views.async_vpic_client.get_model_names", get_model_names):
+            responses = await asyncio.gather(
+                *(
+                    AsyncClient().post(
+                        "/cars/",
+                        data=f"make=Make-{i}&model=Model",
+                        content_type="application/x-www-form-urlencoded",
+                    )
+                    for i in range(8)
+                )
+            )
+
+        self.assertEqual([422] * 8, [response.status_code for response in responses])
+        # The whole middleware stack runs in the event loop, not one request at a time.
+        self.assertEqual(8, most_in_flight)
+
+
+
+class TestRatingAggregates(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.golf = Car.objects.create(make="Volkswagen", model="Golf")
+        self.passat = Car.objects.create(make="Volkswagen", model="Passat")
+
+    def assertAggregates(self, car, rating_sum, rating_count):
+        car.refresh_from_db()
+        self.assertEqual((rating_sum, rating_count), (car.rating_sum, car.rating_count))
+
+    def test_rate_view_updates_aggregates(self):
+        self.client.post("/rate/", data={"car_id": self.golf.id, "rating": 5})
+        self.client.post("/rate/", data={"car_id": self.golf.id, "rating": 2})
+        self.client.post("/rate/", data={"car_id": self.golf.id, "rating": 6})
+
+        self.assertAggregates(self.golf, 7, 2)
+        self.assertAggregates(self.passat, 0, 0)
+
+    def test_bulk_create_updates_aggregates(self):
+        Rate.objects.bulk_create(
+            [Rate(car=self.golf, rating=1), Rate(car=self.golf, rating=4),
+             Rate(car=self.passat, rating=3)]
+        )
+
+        self.assertAggregates(self.golf, 5, 2)
+        self.assertAggregates(self.passat, 3, 1)
+
+    def test_changing_rate_updates_aggregates(self):
+        rate = Rate.objects.create(car=self.golf, rating=1)
+        rate.rating = 4
+        rate.save()
+        rate.car = self.passat
+        rate.save()
+
+        self.assertAggregates(self.golf, 0, 0)
+        self.assertAggregates(self.passat, 4, 1)
+
+    def test_deleting_rates_updates_aggregates(self):
+        rate = Rate.objects.create(car=self.golf, rating=1)
+        Rate.objects.create(car=self.golf, rating=2)
+        Rate.objects.create(car=self.passat, rating=3)
+        Rate.objects.create(car=self.passat, rating=4)
+
+        rate.delete()
+        Rate.objects.filter(car=self.passat, rating=3).delete()
+
+        self.assertAggregates(self.golf, 2, 1)
+        self.assertAggregates(self.passat, 4, 1)
+
+    def test_deleting_car_removes_its_rates(self):
+        Rate.objects.create(car=self.golf, rating=1)
+        Rate.objects.create(car=self.passat, rating=3)
+
+        self.client.delete(f"/cars/{self.golf.id}")
+
+        self.assertEqual(1, Rate.objects.count())
+        self.assertAggregates(self.passat, 3, 1)
+
+    def test_listing_cars_does_not_read_rates(self):
+        Rate.objects.create(car=self.golf, rating=1)
+
+        for url in ("/cars/?unpaged=true", "/popular/?unpaged=true", "/cars/", "/popular/"):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+
+            self.assertEqual(1, len(queries))
+            self.assertNotIn("cars_app_rate", queries[0]["sql"])
+
+    def test_rate_writes_update_rating_histogram(self):
+        rate = Rate.objects.create(car=self.golf, rating=1)
+        Rate.objects.bulk_create(
+            [Rate(car=self.golf, rating=5), Rate(car=self.golf, rating=5),
+             Rate(car=self.passat, rating=2)]
+        )
+        rate.rating = 4
+        rate.save()
+        Rate.objects.filter(car=self.passat).delete()
+        Rate.objects.filter(car=self.golf, rating=5).first().delete()
+
+        self.golf.refresh_from_db()
+        self.passat.refresh_from_db()
+        self.assertEqual({1: 0, 2: 0, 3: 0, 4: 1, 5: 1}, self.golf.rating_histogram)
+        self.assertEqual({1: 0, 2: 0, 3: 0, 4: 0, 5: 0}, self.passat.rating_histogram)
+
+    def test_rating_out_of_range_is_not_saved(self):
+        with self.assertRaises(ValueError):
+            Rate.objects.create(car=self.golf, rating=6)
+
+        self.assertEqual(0, Rate.objects.count())
+        self.assertAggregates(self.golf, 0, 0)
+
+    def test_command_verifies_and_rebuilds_aggregates(self):
+        Rate.objects.create(car=self.golf, rating=1)
+        Rate.objects.create(car=self.golf, rating=5)
+        Car.objects.filter(pk=self.golf.pk).update(rating_sum=100, rating_count=1)
+        Car.objects.filter(pk=self.passat.pk).update(rating_2_count=3)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rating_aggregates", verify=True, stdout=open(os.devnull, "w"))
+
+        call_command("rebuild_rating_aggregates", stdout=open(os.devnull, "w"))
+
+        self.assertAggregates(self.golf, 6, 2)
+        self.assertEqual({1: 1, 2: 0, 3: 0, 4: 0, 5: 1}, self.golf.rating_histogram)
+        self.passat.refresh_from_db()
+        self.assertEqual({1: 0, 2: 0, 3: 0, 4: 0, 5: 0}, self.passat.rating_histogram)
+        self.assertAggregates(self.passat, 0, 0)
+        call_command("rebuild_rating_aggregates", verify=True, stdout=open(os.devnull, "w"))
+
+
+class TestQueryBudgets(TestCase):
+    """
+    Number of SQL queries every endpoint may make. None of them depends on the number of stored
+    cars or rates - a change here means a new query per request (or an N+1) sneaked in. Counts
+    include the savepoints of atomic blocks, which are nested in the test transaction.
+    """
+
+    def setUp(self) -> None:
+        self.client = Client()
+        add_to_catalog([("Volkswagen", "Golf"), ("Volkswagen", "Passat")])
+        self.cars = [Car.objects.create(make="Fiat", model=f"Model-{i}") for i in range(20)]
+        for car in self.cars:
+            Rate.objects.create(car=car, rating=3)
+
+    def test_reads(self):
+        for url in (
+            "/cars/",
+            "/cars/?unpaged=true",
+            "/popular/",
+            "/popular/?limit=10",
+            "/popular/?unpaged=true",
+        ):
+            with self.subTest(url=url), self.assertNumQueries(1):
+                self.assertEqual(200, self.client.get(url).status_code)
+
+        with self.assertNumQueries(0):
+            self.client.get("/cache/stats")
+
+        # Ranked IDs from the search index, then the cars.
+        with self.assertNumQueries(2):
+            self.assertEqual(200, self.client.get("/cars/search?q=fiat&rating=true").status_code)
+
+    def test_post_car(self):
+        with self.assertNumQueries(4):
+            response = self.client.post("/cars/", data={"make": "Volkswagen", "model": "Golf"})
+        self.assertEqual(201, response.status_code)
+
+        with patch("cars_app.views.vpic_client.get_model_names") as get_model_names:
+            get_model_names.return_value = ["Civic"]
+            with self.assertNumQueries(5):
+                response = self.client.post("/cars/", data={"make": "Honda", "model": "Civic"})
+        self.assertEqual(201, response.status_code)
+
+    def test_post_cars_batch(self):
+        # Including the savepoint around the insert (outside of tests it is the transaction).
+        with self.assertNumQueries(5):
+            response = self.client.post(
+                "/cars/batch",
+                data=json.dumps(
+                    [
+                        {"make": "Volkswagen", "model": "Golf"},
+                        {"make": "Volkswagen", "model": "Passat"},
+                    ]
+                ),
+                content_type="application/json",
+            )
+        self.assertEqual(2, response.json()["created"])
+
+    def test_post_cars_batch_of_cars_missing_from_catalog(self):
+        models_by_make = {f"Make-{i}": [f"Model-{i}", f"Other-{i}"] for i in range(10)}
+
+        # Plus a single insert of the fetched models of all makes into the catalog.
+        with patch("cars_app.views.vpic_client.get_model_names") as get_model_names, (
+            self.assertNumQueries(6)
+        ):
+            get_model_names.side_effect = lambda make: models_by_make[make]
+            response = self.client.post(
+                "/cars/batch",
+                data=json.dumps(
+                    [{"make": make, "model": models[0]} for make, models in models_by_make.items()]
+                ),
+                content_type="application/json",
+            )
+        self.assertEqual(10, response.json()["created"])
+        self.assertEqual(22, CatalogEntry.objects.count())
+
+    def test_post_rate(self):
+        # Inserting the rate, updating the car aggregates and its hourly and daily rating buckets
+        # (one statement for both).
+        with self.assertNumQueries(7):
+            response = self.client.post("/rate/", data={"car_id": self.cars[0].id, "rating": 5})
+        self.assertEqual(201, response.status_code)
+
+        # Checking that the car exists and inserting the queued rate.
+        with self.settings(RATE_QUEUE_ENABLED=True), self.assertNumQueries(2):
+            response = self.client.post("/rate/", data={"car_id": self.cars[0].id, "rating": 5})
+        self.assertEqual(202, response.status_code)
+
+    def test_post_rates_bulk(self):
+        # The aggregates and the rating buckets of all rated cars are updated with one statement
+        # each, whatever the number of cars.
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                "/rate/bulk",
+                data=json.dumps(
+                    [{"car_id": car.id, "rating": 4} for car in self.cars[:2] for _ in range(10)]
+                ),
+                content_type="application/json",
+            )
+        self.assertEqual(20, response.json()["created"])
+
+    def test_delete_car(self):
+        # Reading the ID of the car, then deleting its rates, rating buckets and the car itself.
+        with self.assertNumQueries(4):
+            response = self.client.delete(f"/cars/{self.cars[0].id}")
+        self.assertEqual(204, response.status_code)
+
+        ids = ",".join(str(car.id) for car in self.cars[1:])
+        with self.assertNumQueries(4):
+            response = self.client.delete(f"/cars/?ids={ids}")
+        self.assertEqual(19, response.json()["deleted"])
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        self.client = Client()
+        self.car = Car.objects.create(make="Volkswagen", model="Golf")
+
+    @staticmethod
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_records_requests_by_view(self):
+        requests_before = self.sample(
+            "cars_http_request_duration_seconds_count", view="Popular", method="GET"
+        )
+        not_found_before = self.sample(
+            "cars_http_responses_total", view="CarsDeleteView", method="DELETE", status="404"
+        )
+        queries_before = self.sample("cars_db_queries_total", view="Popular")
+
+        self.client.get("/popular/")
+        self.client.get("/popular/")
+        self.client.delete("/cars/123456")
+
+        self.assertEqual(
+            requests_before + 2,
+            self.sample("cars_http_request_duration_seconds_count", view="Popular", method="GET"),
+        )
+        self.assertEqual(
+            not_found_before + 1,
+            self.sample(
+                "cars_http_responses_total", view="CarsDeleteView", method="DELETE", status="404"
+            ),
+        )
+        self.assertEqual(queries_before + 2, self.sample("cars_db_queries_total", view="Popular"))
+
+    async def test_labels_async_views_like_the_sync_ones(self):
+        requests_before = self.sample(
+            "cars_http_request_duration_seconds_count", view="Popular", method="GET"
+        )
+        queries_before = self.sample("cars_db_queries_total", view="Popular")
+
+        with async_urls:
+            response = await AsyncClient().get("/popular/")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(
+            requests_before + 1,
+            self.sample("cars_http_request_duration_seconds_count", view="Popular", method="GET"),
+        )
+        # Made in a thread of the view.
+        self.assertEqual(queries_before + 1, self.sample("cars_db_queries_total", view="Popular"))
+
+    def test_records_external_api_calls(self):
+        server = StubVpicServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        client = VpicClient(server.url, failure_threshold=1)
+        calls_before = self.sample(
+            "cars_vpic_request_duration_seconds_count", operation="GetModelsForMake"
+        )
+        errors_before = {
+            reason: self.sample(
+                "cars_vpic_errors_total", operation="GetModelsForMake", reason=reason
+            )
+            for reason in ("status", "circuit_open")
+        }
+
+        client.get_model_names("Volkswagen")
+        server.status = 500
+        for _ in range(2):
+            with self.assertRaises(VpicUnavailable):
+                client.get_model_names("Volkswagen")
+
+        self.assertEqual(
+            calls_before + 2,
+            self.sample("cars_vpic_request_duration_seconds_count", operation="GetModelsForMake"),
+        )
+        for reason in ("status", "circuit_open"):
+            self.assertEqual(
+                errors_before[reason] + 1,
+                self.sample(
+                    "cars_vpic_errors_total", operation="GetModelsForMake", reason=reason
+                ),
+            )
+
+    def test_serves_metrics_in_prometheus_format(self):
+        self.client.get("/popular/")
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        self.assertIn(
+            'cars_http_request_duration_seconds_count{method="GET",view="Popular"}',
+            response.content.decode(),
+        )
+
+    def test_sums_metrics_of_all_worker_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        worker = (
+            "from cars_app.metrics import RESPONSES; "
+            "RESPONSES.labels('Popular', 'GET', 200).inc()"
+        )
+        for _ in range(2):
+            subprocess.run(
+                [sys.executable, "-c", worker],
+                check=True,
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory},
+            )
+
+        with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+            response = self.client.get("/metrics")
+
+        self.assertIn(
+            'cars_http_responses_total{method="GET",status="200",view="Popular"} 2.0',
+            response.content.decode(),
+        )
@@ -0,0 +1,112 @@
+"""
+Cars rated most in a recent time window, read from the hourly and daily rating buckets (see
+`models.RatingBucket`) instead of the rates.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Rate, RatingBucket
+
+log = logging.getLogger(__file__)
+
+# Window name -> granularity of the buckets read and their number. Windows start at a bucket
+# boundary and include the current (partial) bucket.
+WINDOWS = {
+    "24h": (RatingBucket.HOUR, 24),
+    "7d": (RatingBucket.DAY, 7),
+    "30d": (RatingBucket.DAY, 30),
+}
+EXPIRY_KEY = "cars:rating-buckets-expired"
+
+
+def window_start(window, now=None):
+    granularity, buckets_number = WINDOWS[window]
+    step = timedelta(days=1) if granularity == RatingBucket.DAY else timedelta(hours=1)
+    return RatingBucket.bucket_start(now or timezone.now(), granularity) - step * (
+        buckets_number - 1
+    )
+
+
+def trending_cars(window, limit, now=None):
+    """The `limit` cars with the most rates in the window, as dicts."""
+    granularity, _ = WINDOWS[window]
+    return (
+        RatingBucket.objects.filter(granularity=granularity, start__gte=window_start(window, now))
+        .values("car_id", "car__make", "car__model")
+        .annotate(rates_number=Sum("rates_number"))
+        .filter(rates_number__gt=0)
+        .order_by("-rates_number", "car_id")[:limit]
+    )
+
+
+def expire_rating_buckets(now=None):
+    """Delete the buckets older than the retention. Return number of deleted buckets."""
+    deleted = 0
+    for granularity in (RatingBucket.HOUR, RatingBucket.DAY):
+        expired = RatingBucket.objects.filter(
+            granularity=granularity, start__lt=RatingBucket.retained_since(granularity, now)
+        )
+        # Checked first, as a delete locks the database for writes even when nothing matches.
+        if expired.exists():
+            deleted += expired.delete()[0]
+    return deleted
+
+
+def rebuild_rating_buckets(now=None, batch_size=10_000):
+    """Recompute all the kept buckets from the timestamped rates."""
+    with transaction.atomic():
+        RatingBucket.objects.all().delete()
+        for granularity, trunc in ((RatingBucket.HOUR, TruncHour), (RatingBucket.DAY, TruncDay)):
+            rows = (
+                Rate.objects.filter(
+                    created_at__gte=RatingBucket.retained_since(granularity, now)
+                )
+                .order_by()
+                .values("car_id", start=trunc("created_at"))
+                .annotate(rates_number=Count("id"))
+            )
+            batch = []
+            for row in rows.iterator():
+                batch.append(RatingBucket(granularity=granularity, **row))
+                if len(batch) >= batch_size:
+                    RatingBucket.objects.bulk_create(batch)
+                    batch = []
+            RatingBucket.objects.bulk_create(batch)
+
+
+_next_expiry_check = 0.0
+
+
+def expire_in_background_if_due(**kwargs):
+    """
+    Start deleting the expired buckets in a background thread, if it was not done (by any worker
+    sharing the cache) in the last `TRENDING_EXPIRY_INTERVAL` seconds. Connected to
+    `request_finished`.
+    """
+    global _next_expiry_check
+    interval = settings.TRENDING_EXPIRY_INTERVAL
+    if not interval or time.monotonic() < _next_expiry_check:
+        return
+    _next_expiry_check = time.monotonic() + interval
+    if not caches[settings.RESPONSE_CACHE_ALIAS].add(EXPIRY_KEY, 1, timeout=interval):
+        return
+
+    def run():
+        try:
+            expire_rating_buckets()
+        except Exception:
+            log.exception("Expiring rating buckets failed.")
+        finally:
+            # Connections are per thread, this one would never be reused.
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
@@ -1,10 +1,23 @@
-from django.urls import path
+from django.urls import path, register_converter
 
 from . import views
+from .converters import IdConverter
+
+register_converter(IdConverter, 'id')
 
 urlpatterns = [
     path('cars/', views.CarsView.as_view()),
-    path('cars/<int:id>', views.CarsDeleteView.as_view()),
+    path('cars/batch', views.CarsBatchView.as_view()),
+    path('cars/search', views.SearchView.as_view()),
+    path('cars/<id:id>', views.CarsDeleteView.as_view()),
+    path('cars/<id:id>/ratings', views.CarRatingsView.as_view()),
     path('rate/', views.RateView.as_view()),
-    path('popular/', views.Popular.as_view())
+    path('rate/bulk', views.RateBulkView.as_view()),
+    path('rate/queue', views.RateQueueView.as_view()),
+    path('popular/', views.Popular.as_view()),
+    path('trending', views.Trending.as_view()),
+    path('export/cars', views.ExportView.as_view(), {'table': 'cars'}),
+    path('export/rates', views.ExportView.as_view(), {'table': 'rates'}),
+    path('cache/stats', views.CacheStatsView.as_view()),
+    path('metrics', views.MetricsView.as_view()),
 ]
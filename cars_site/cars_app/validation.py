@@ -0,0 +1,401 @@
+"""
+Client for the external NHTSA vPIC API, which is used to check if the posted cars exist in real
+life.
+
+The clients keep a pool of keep-alive connections, enforce connect/read deadlines, send a single
+upstream request for concurrent lookups of the same make and stop calling the API for a while
+when it keeps failing (circuit breaker). `VpicClient` is used by the sync views, `AsyncVpicClient`
+by the async ones.
+
+`requests` and `httpx` take a noticeable part of the start-up time of a worker, so they are
+imported on the first call of the external API.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional
+from urllib.parse import quote
+
+from django.conf import settings
+
+from .metrics import VPIC_ERRORS, VPIC_REQUEST_DURATION
+
+log = logging.getLogger(__file__)
+
+
+class VpicUnavailable(Exception):
+    """The external API could not tell whether the car exists."""
+
+
+class CircuitOpen(VpicUnavailable):
+    """The external API failed too many times recently, so it is not called at all."""
+
+
+class CircuitBreaker:
+    """
+    Counts consecutive failures of the external API. After `failure_threshold` of them the circuit
+    opens and calls fail fast for `recovery_timeout` seconds. After that a single trial call is let
+    through - its success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold, recovery_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if self._clock() - self._opened_at < self.recovery_timeout:
+                return self.OPEN
+            return self.HALF_OPEN
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if (
+                self._clock() - self._opened_at < self.recovery_timeout
+                or self._trial_in_progress
+            ):
+                raise CircuitOpen("External API is unhealthy, not calling it.")
+            self._trial_in_progress = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_progress = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+
+    def end_trial(self):
+        """Let the next trial call through, also when the current one ended without a result."""
+        with self._lock:
+            self._trial_in_progress = False
+
+
+ALL_MAKES_PATH = "vehicles/GetAllMakes"
+MODELS_FOR_MAKE_PATH = "vehicles/GetModelsForMake"
+
+
+def _models_for_make_path(make):
+    return f"{MODELS_FOR_MAKE_PATH}/{quote(make, safe='')}"
+
+
+def _operation(path):
+    """API operation name (e.g. "GetAllMakes") of the path, used as a metric label."""
+    return path.split("/")[1]
+
+
+def _result_names(payload, field):
+    """
+    Names - values of the `field` of every result - from a response of the external API. If nothing
+    matches the query the list of results is empty.
+
+    :raises ValueError: if the response does not have the expected shape.
+    """
+    results = payload.get("Results") if isinstance(payload, dict) else None
+    if not isinstance(results, list):
+        raise ValueError("External API response has no list of results.")
+    names = [result.get(field) if isinstance(result, dict) else None for result in results]
+    if not all(isinstance(name, str) for name in names):
+        raise ValueError(f"External API response has results without {field}.")
+    return names
+
+
+def _settings_options():
+    return dict(
+        connect_timeout=settings.VPIC_CONNECT_TIMEOUT,
+        read_timeout=settings.VPIC_READ_TIMEOUT,
+        pool_size=settings.VPIC_POOL_SIZE,
+        failure_threshold=settings.VPIC_FAILURE_THRESHOLD,
+        recovery_timeout=settings.VPIC_RECOVERY_TIMEOUT,
+    )
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class VpicClient:
+    def __init__(
+        self,
+        base_url,
+        connect_timeout=3.05,
+        read_timeout=10,
+        pool_size=10,
+        failure_threshold=5,
+        recovery_timeout=30,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.pool_size = pool_size
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._in_flight: Dict[Optional[str], _InFlightCall] = {}
+        self._in_flight_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(settings.VPIC_API_URL, **_settings_options())
+
+    def get_model_names(self, make) -> List[str]:
+        """
+        Return names of all models of the given make. The list is empty if the make does not
+        exist.
+
+        Concurrent calls for the same make share the result of a single upstream request.
+
+        :raises VpicUnavailable: if the external API could not give an answer.
+        """
+        return self._coalesced(make.lower(), _models_for_make_path(make), "Model_Name")
+
+    def get_make_names(self) -> List[str]:
+        """
+        Return names of all makes known to the external API.
+
+        :raises VpicUnavailable: if the external API could not give an answer.
+        """
+        return self._coalesced(None, ALL_MAKES_PATH, "Make_Name")
+
+    def _coalesced(self, key, path, field):
+        with self._in_flight_lock:
+            call = self._in_flight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._in_flight[key] = _InFlightCall()
+
+        if not is_leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = self._get_names(path, field)
+            except VpicUnavailable as e:
+                call.error = e
+            finally:
+                if call.result is None and call.error is None:
+                    call.error = VpicUnavailable("The external API call was interrupted.")
+                with self._in_flight_lock:
+                    del self._in_flight[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _get_session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                # Retrying is left to the breaker - a retry would only extend the time a worker
+                # is held.
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._session = session
+            return self._session
+
+    def _get_names(self, path, field):
+        import requests
+
+        session = self._get_session()
+        operation = _operation(path)
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            VPIC_ERRORS.labels(operation, "circuit_open").inc()
+            raise
+        try:
+            with VPIC_REQUEST_DURATION.labels(operation).time():
+                response = session.get(
+                    f"{self.base_url}/{path}", params={"format": "json"}, timeout=self.timeout
+                )
+            response.raise_for_status()
+            names = _result_names(response.json(), field)
+        except requests.exceptions.HTTPError as e:
+            VPIC_ERRORS.labels(operation, "status").inc()
+            self.breaker.record_failure()
+            log.exception(
+                "External API signaled a problem. Check status code for further "
+                "information. Aborting."
+            )
+            raise VpicUnavailable(str(e)) from e
+        except Exception as e:
+            is_connection_error = isinstance(e, requests.exceptions.RequestException)
+            VPIC_ERRORS.labels(
+                operation, "connection" if is_connection_error else "invalid_response"
+            ).inc()
+            self.breaker.record_failure()
+            log.exception(
+                "An exception occurred while making request to external API: {}. Aborting.".format(
+                    self.base_url
+                )
+            )
+            raise VpicUnavailable(str(e)) from e
+        else:
+            self.breaker.record_success()
+            return names
+        finally:
+            # Also after an interruption, which records neither a success nor a failure.
+            self.breaker.end_trial()
+
+
+class _LoopState:
+    def __init__(self, client):
+        self.client = client
+        self.in_flight: Dict[Optional[str], asyncio.Future] = {}
+
+
+class AsyncVpicClient:
+    """
+    Asynchronous counterpart of `VpicClient`.
+
+    httpx connections are bound to the event loop they were opened in, so a separate connection
+    pool is kept for each running loop.
+    """
+
+    def __init__(
+        self,
+        base_url,
+        connect_timeout=3.05,
+        read_timeout=10,
+        pool_size=10,
+        failure_threshold=5,
+        recovery_timeout=30,
+        breaker=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker(failure_threshold, recovery_timeout)
+        self._loop_states = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls, breaker=None):
+        return cls(settings.VPIC_API_URL, breaker=breaker, **_settings_options())
+
+    async def get_model_names(self, make) -> List[str]:
+        """
+        Return names of all models of the given make. The list is empty if the make does not
+        exist.
+
+        Concurrent calls for the same make share the result of a single upstream request.
+
+        :raises VpicUnavailable: if the external API could not give an answer.
+        """
+        return await self._coalesced(make.lower(), _models_for_make_path(make), "Model_Name")
+
+    async def get_make_names(self) -> List[str]:
+        """
+        Return names of all makes known to the external API.
+
+        :raises VpicUnavailable: if the external API could not give an answer.
+        """
+        return await self._coalesced(None, ALL_MAKES_PATH, "Make_Name")
+
+    async def aclose(self):
+        state = self._loop_states.pop(asyncio.get_event_loop(), None)
+        if state is not None:
+            await state.client.aclose()
+
+    def _state(self):
+        loop = asyncio.get_event_loop()
+        state = self._loop_states.get(loop)
+        if state is None:
+            import httpx
+
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.pool_size, max_keepalive_connections=self.pool_size
+                ),
+            )
+            state = self._loop_states[loop] = _LoopState(client)
+        return state
+
+    async def _coalesced(self, key, path, field):
+        state = self._state()
+        call = state.in_flight.get(key)
+        if call is None:
+            call = state.in_flight[key] = asyncio.ensure_future(
+                self._get_names(state.client, path, field)
+            )
+            call.add_done_callback(lambda _: state.in_flight.pop(key, None))
+
+        # A cancelled caller must not cancel the request other callers are waiting for.
+        return await asyncio.shield(call)
+
+    async def _get_names(self, client, path, field):
+        import httpx
+
+        operation = _operation(path)
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            VPIC_ERRORS.labels(operation, "circuit_open").inc()
+            raise
+        try:
+            with VPIC_REQUEST_DURATION.labels(operation).time():
+                response = await client.get(f"{self.base_url}/{path}", params={"format": "json"})
+            response.raise_for_status()
+            names = _result_names(response.json(), field)
+        except httpx.HTTPStatusError as e:
+            VPIC_ERRORS.labels(operation, "status").inc()
+            self.breaker.record_failure()
+            log.exception(
+                "External API signaled a problem. Check status code for further "
+                "information. Aborting."
+            )
+            raise VpicUnavailable(str(e)) from e
+        except Exception as e:
+            is_connection_error = isinstance(e, httpx.HTTPError)
+            VPIC_ERRORS.labels(
+                operation, "connection" if is_connection_error else "invalid_response"
+            ).inc()
+            self.breaker.record_failure()
+            log.exception(
+                "An exception occurred while making request to external API: {}. Aborting.".format(
+                    self.base_url
+                )
+            )
+            raise VpicUnavailable(str(e)) from e
+        else:
+            self.breaker.record_success()
+            return names
+        finally:
+            # Also after an interruption, which records neither a success nor a failure.
+            self.breaker.end_trial()
+
+
+vpic_client = VpicClient.from_settings()
+# Both clients talk to the same API, so they share its health state.
+async_vpic_client = AsyncVpicClient.from_settings(breaker=vpic_client.breaker)
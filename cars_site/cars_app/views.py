@@ -1,86 +1,320 @@
+import json
 import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models import Avg, Count
-from django.http import JsonResponse
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import HttpResponse
 from django.views import View
 
-from .models import Car, Rate
+from . import export, metrics, rate_queue, search, trending
+from .cache import cache_stats, cached_response, conditional_response, data_changed
+from .catalog import add_to_catalog, car_in_catalog, normalize_name
+from .leaderboard import leaderboard
+from .models import RATINGS, Car, CatalogEntry, Rate, is_db_integer, rating_count_field
+from .pagination import InvalidPageRequest, is_unpaged, keyset_page
+from .responses import NotAcceptable, json_list_response, list_format, list_response
+from .validation import VpicUnavailable, vpic_client
 
 log = logging.getLogger(__file__)
 
+HISTOGRAM_FIELDS = [rating_count_field(rating) for rating in RATINGS]
+
+
+def _parse_list_format(request, fields):
+    """Media type and fields of a list response, or the error response for invalid ones."""
+    try:
+        return list_format(request, fields), None
+    except NotAcceptable as e:
+        return None, HttpResponse(str(e), status=406)
+    except ValueError as e:
+        return None, HttpResponse(str(e), status=400)
+
 
 class CarsView(View):
-    VALIDATING_API = "https://vpic.nhtsa.dot.gov/api/"
+    stream_lists = settings.STREAM_LIST_RESPONSES
+    fields = ["id", "make", "model", "avg_rating"]
 
+    @conditional_response
+    @cached_response
     def get(self, request):
-        cars_with_avg_rating = Car.objects.annotate(
-            avg_rating=Avg("rate__rating")
-        ).values("id", "make", "model", "avg_rating")
+        list_format, error = _parse_list_format(request, self.fields)
+        if error:
+            return error
+        media_type, fields = list_format
+
+        cars = Car.objects.order_by("id")
+        # Computed only when requested.
+        if "avg_rating" in fields:
+            cars = cars.with_avg_rating()
+
+        if is_unpaged(request):
+            return json_list_response(
+                cars.values(*fields), media_type, fields, self.stream_lists
+            )
+
+        try:
+            page = keyset_page(
+                # The key of the page is read even if it is not requested.
+                cars.values(*fields, *({"id"} - set(fields))),
+                request,
+                ["id"],
+                lambda cars, id: cars.filter(id__gt=id),
+            )
+        except InvalidPageRequest as e:
+            return HttpResponse(str(e), status=400)
+        return list_response(page, media_type, fields)
+
+    def delete(self, request):
+        """Delete the cars with the comma separated `?ids=` (with their rates) at once."""
+        ids = request.GET.get("ids", "").split(",")
+        if not all(id.isdigit() and is_db_integer(int(id)) for id in ids):
+            return HttpResponse("Ids have to be comma separated integers.", status=400)
+        if len(ids) > settings.CARS_BULK_DELETE_MAX_ITEMS:
+            return HttpResponse(
+                f"At most {settings.CARS_BULK_DELETE_MAX_ITEMS} cars can be deleted at once.",
+                status=413,
+            )
 
-        return JsonResponse(list(cars_with_avg_rating), safe=False)
+        _, deleted = Car.objects.filter(id__in={int(id) for id in ids}).delete()
+        if deleted[Car._meta.label]:
+            data_changed()
+        return JsonResponse({"deleted": deleted[Car._meta.label]})
 
     def post(self, request):
         make = request.POST["make"]
         model = request.POST["model"]
-        if not self._check_car_exists(make, model):
+        try:
+            car_exists = self._check_car_exists(make, model)
+        except VpicUnavailable:
+            return HttpResponse(
+                "Cannot check the car right now, the external API is unavailable.",
+                status=503,
+            )
+
+        if not car_exists:
             return HttpResponse(
                 "The provided parameters do not match any real life cars.", status=422
             )
 
         else:
-            _, created = Car.objects.get_or_create(make=make, model=model)
-            if created:
-                return HttpResponse(status=201)
-            else:
-                return HttpResponse(
-                    "Car with this parameters already exists.",
-                    status=409,
-                )
+            return self._create_car(make, model)
 
-    def _check_car_exists(self, make, model):
+    @staticmethod
+    def _create_car(make, model):
+        # A single INSERT, which the unique constraint on the normalized make and model rejects for
+        # existing cars - unlike checking first, this can't create duplicates under concurrent
+        # requests.
         try:
-            response = requests.get(
-                f"{self.VALIDATING_API}/vehicles/GetModelsForMake/{make}",
-                params={"format": "json"},
-            )
-            response.raise_for_status()
-        except requests.exceptions.HTTPError:
-            log.exception(
-                "External API signaled a problem. Check status code for further "
-                "information. Aborting."
-            )
-        except requests.exceptions.RequestException:
-            log.exception(
-                "An exception occurred while making request to external API: {}. Aborting.".format(
-                    self.VALIDATING_API
-                )
+            with transaction.atomic():
+                Car.objects.create(make=make, model=model)
+        except IntegrityError:
+            return HttpResponse(
+                "Car with this parameters already exists.",
+                status=409,
             )
         else:
-            all_make_models = response.json()[
-                "Results"
-            ]  # If the make does not exist we will get an empty list.
+            data_changed()
+            return HttpResponse(status=201)
+
+    def _check_car_exists(self, make, model):
+        if car_in_catalog(make, model):
+            return True
+
+        model_names = vpic_client.get_model_names(make)
+        # Remember the fetched models, so next cars of this make are checked locally.
+        add_to_catalog((make, model_name) for model_name in model_names)
+
+        return self._model_in(model, model_names)
+
+    @staticmethod
+    def _model_in(model, model_names):
+        # If the make does not exist the list of its models is empty.
+        model_key = normalize_name(model)
+        return any(normalize_name(model_name) == model_key for model_name in model_names)
+
+
+class CarsBatchView(View):
+    """
+    Registers many cars at once. Accepts a JSON array of `{"make": ..., "model": ...}` objects and
+    reports for every pair the status `POST /cars/` would give it.
+
+    Cars missing from the catalog are checked with a single external API call per distinct make,
+    and up to `CARS_BATCH_VALIDATION_CONCURRENCY` of these calls run at once.
+    """
+
+    MESSAGES = {
+        201: None,
+        409: "Car with this parameters already exists.",
+        422: "The provided parameters do not match any real life cars.",
+        503: "Cannot check the car right now, the external API is unavailable.",
+    }
+
+    def post(self, request):
+        try:
+            pairs = self._parse_pairs(request)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
 
-            make_exists = all_make_models != []
-            model_exists = any(
-                [result["Model_Name"] == model for result in all_make_models]
+        if len(pairs) > settings.CARS_BATCH_MAX_ITEMS:
+            return HttpResponse(
+                f"At most {settings.CARS_BATCH_MAX_ITEMS} cars can be posted at once.",
+                status=413,
             )
-            return make_exists and model_exists
+
+        statuses = self._check_cars_exist(pairs)
+        existing_keys = self._existing_keys(
+            {pair for pair, status in statuses.items() if status is None}
+        )
+
+        results = []
+        new_cars = []
+        for index, (make, model) in enumerate(pairs):
+            status = statuses[(make, model)]
+            if status is None:
+                key = Car.name_key(make, model)
+                if key in existing_keys:
+                    status = 409
+                else:
+                    status = 201
+                    # Repeated pairs of the batch already exist when they are registered.
+                    existing_keys.add(key)
+                    new_cars.append((index, Car(make=make, model=model)))
+            results.append({"index": index, "make": make, "model": model, "status": status})
+
+        for index in self._insert([car for _, car in new_cars]):
+            results[new_cars[index][0]]["status"] = 409
+        for result in results:
+            if self.MESSAGES[result["status"]]:
+                result["error"] = self.MESSAGES[result["status"]]
+
+        created = sum(result["status"] == 201 for result in results)
+        if created:
+            data_changed()
+        return JsonResponse({"created": created, "results": results})
+
+    @staticmethod
+    def _insert(cars):
+        """
+        Insert the cars. Return the positions of those which other requests registered since they
+        were checked, like the unique constraint rejects them for `POST /cars/`.
+        """
+        try:
+            with transaction.atomic():
+                Car.objects.bulk_create(cars)
+            return []
+        except IntegrityError:
+            pass
+
+        # Rare - the cars are inserted one by one, to tell which ones exist.
+        conflicting = []
+        with transaction.atomic():
+            for index, car in enumerate(cars):
+                try:
+                    with transaction.atomic():
+                        car.save(force_insert=True)
+                except IntegrityError:
+                    conflicting.append(index)
+        return conflicting
+
+    @staticmethod
+    def _parse_pairs(request):
+        try:
+            items = json.loads(request.body.decode())
+        except (UnicodeDecodeError, ValueError):
+            raise ValueError("Request body is not valid JSON.")
+        if not isinstance(items, list) or not all(
+            isinstance(item, dict)
+            and isinstance(item.get("make"), str)
+            and isinstance(item.get("model"), str)
+            for item in items
+        ):
+            raise ValueError("Request body has to be a JSON array of objects with make and model.")
+        return [(item["make"], item["model"]) for item in items]
+
+    def _check_cars_exist(self, pairs):
+        """
+        Return a mapping of every distinct pair to None, if the car exists, or to the error status
+        otherwise.
+        """
+        catalog_keys = set(
+            CatalogEntry.objects.filter(
+                make_key__in={normalize_name(make) for make, _ in pairs}
+            ).values_list("make_key", "model_key")
+        )
+        statuses = {}
+        pairs_by_make = defaultdict(set)
+        for make, model in pairs:
+            if (normalize_name(make), normalize_name(model)) in catalog_keys:
+                statuses[(make, model)] = None
+            else:
+                pairs_by_make[normalize_name(make)].add((make, model))
+
+        def fetch_model_names(make_pairs):
+            make = next(iter(make_pairs))[0]
+            try:
+                return make, vpic_client.get_model_names(make)
+            except VpicUnavailable:
+                return make, None
+
+        with ThreadPoolExecutor(
+            max_workers=settings.CARS_BATCH_VALIDATION_CONCURRENCY
+        ) as executor:
+            fetched = list(executor.map(fetch_model_names, pairs_by_make.values()))
+
+        fetched_pairs = []
+        for (make, model_names), make_pairs in zip(fetched, pairs_by_make.values()):
+            if model_names is None:
+                statuses.update({pair: 503 for pair in make_pairs})
+                continue
+
+            fetched_pairs.extend((make, model_name) for model_name in model_names)
+            for pair in make_pairs:
+                statuses[pair] = None if CarsView._model_in(pair[1], model_names) else 422
+
+        # Remember the fetched models of all makes, so next cars of these makes are checked
+        # locally.
+        add_to_catalog(fetched_pairs)
+        return statuses
+
+    @staticmethod
+    def _existing_keys(pairs):
+        if not pairs:
+            return set()
+        keys = {Car.name_key(make, model) for make, model in pairs}
+        return set(
+            Car.objects.filter(
+                make_key__in={make for make, _ in keys}, model_key__in={model for _, model in keys}
+            ).values_list("make_key", "model_key")
+        ) & keys
 
 
 class CarsDeleteView(View):
     model = Car
 
     def delete(self, request, id):
+        _, deleted = Car.objects.filter(id=id).delete()
+        if not deleted[Car._meta.label]:
+            return HttpResponse(status=404)
+        data_changed()
+        return HttpResponse(status=204)
+
+
+class CarRatingsView(View):
+    """Rating breakdown of a car, read from the histogram stored on it."""
+
+    @conditional_response
+    @cached_response
+    def get(self, request, id):
         try:
-            car = Car.objects.get(id=id)
+            car = Car.objects.only(*HISTOGRAM_FIELDS).get(id=id)
         except Car.DoesNotExist:
             return HttpResponse(status=404)
-        else:
-            car.delete()
-            return HttpResponse(status=204)
+        return JsonResponse(car.rating_distribution())
 
 
 class RateView(View):
@@ -93,20 +327,247 @@ class RateView(View):
             rate.full_clean()
         except ValidationError:
             return HttpResponse(status=422)
-        else:
-            rate.save()
-            return HttpResponse(status=201)
+
+        if settings.RATE_QUEUE_ENABLED:
+            rate_queue.enqueue(rate.car_id, rate.rating)
+            return HttpResponse(status=202)
+        rate.save()
+        data_changed()
+        return HttpResponse(status=201)
+
+
+class RateQueueView(View):
+    def get(self, request):
+        return JsonResponse(rate_queue.queue_status())
+
+
+class RateBulkView(View):
+    """
+    Creates many rates at once. Accepts a JSON array or NDJSON (`application/x-ndjson`) of
+    `{"car_id": ..., "rating": ...}` objects and reports the result of every item, so the client
+    has to resend only the failed ones.
+    """
+
+    def post(self, request):
+        try:
+            items = self._parse_items(request)
+        except ValueError as e:
+            return HttpResponse(str(e), status=400)
+
+        if len(items) > settings.RATE_BULK_MAX_ITEMS:
+            return HttpResponse(
+                f"At most {settings.RATE_BULK_MAX_ITEMS} rates can be posted at once.",
+                status=413,
+            )
+
+        rating_field = Rate._meta.get_field("rating")
+        results = []
+        rates = []
+        for index, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValidationError("Item has to be a JSON object.")
+                if not is_db_integer(item.get("car_id")):
+                    raise ValidationError("Item needs an integer car_id.")
+                rating = item.get("rating")
+                # `clean` would truncate them, POST /rate/ rejects them.
+                if isinstance(rating, bool) or (
+                    isinstance(rating, float) and not rating.is_integer()
+                ):
+                    raise ValidationError("Rating has to be an integer.")
+                rating = rating_field.clean(rating, None)
+            except ValidationError as e:
+                results.append({"index": index, "status": 422, "errors": e.messages})
+            else:
+                results.append({"index": index, "status": 201})
+                rates.append((index, Rate(car_id=item["car_id"], rating=rating)))
+
+        existing_car_ids = set(
+            Car.objects.filter(id__in={rate.car_id for _, rate in rates}).values_list(
+                "id", flat=True
+            )
+        )
+        valid_rates = []
+        for index, rate in rates:
+            if rate.car_id in existing_car_ids:
+                valid_rates.append(rate)
+            else:
+                results[index] = {
+                    "index": index,
+                    "status": 422,
+                    "errors": [f"Car with id {rate.car_id} does not exist."],
+                }
+
+        Rate.objects.bulk_create(valid_rates, batch_size=settings.RATE_BULK_BATCH_SIZE)
+        if valid_rates:
+            data_changed()
+
+        return JsonResponse({"created": len(valid_rates), "results": results})
+
+    @staticmethod
+    def _parse_items(request):
+        try:
+            body = request.body.decode()
+            if request.content_type in ("application/x-ndjson", "application/ndjson"):
+                return [
+                    RateBulkView._parse_line(line) for line in body.splitlines() if line.strip()
+                ]
+
+            items = json.loads(body)
+        except (UnicodeDecodeError, ValueError):
+            raise ValueError("Request body is not valid JSON.")
+        if not isinstance(items, list):
+            raise ValueError("Request body has to be a JSON array.")
+        return items
+
+    @staticmethod
+    def _parse_line(line):
+        # An invalid line is returned as it is, to fail as an item, not the whole request.
+        try:
+            return json.loads(line)
+        except ValueError:
+            return line
 
 
 class Popular(View):
+    stream_lists = settings.STREAM_LIST_RESPONSES
+    fields = ["id", "make", "model", "rates_number"]
+
+    @conditional_response
+    @cached_response
+    def get(self, request):
+        list_format, error = _parse_list_format(request, self.fields)
+        if error:
+            return error
+        media_type, fields = list_format
+
+        limit = request.GET.get("limit")
+        if limit is not None and (
+            not limit.isdigit() or not 1 <= int(limit) <= settings.MAX_PAGE_SIZE
+        ):
+            return HttpResponse(
+                f"Limit has to be an integer between 1 and {settings.MAX_PAGE_SIZE}.", status=400
+            )
+
+        cars_with_rates_number = Car.objects.annotate(rates_number=F("rating_count")).order_by(
+            "-rating_count", "id"
+        )
+        # Top N cars are a bounded list already, so they are not paginated.
+        if limit is not None:
+            top_cars = leaderboard.top(int(limit)) if settings.LEADERBOARD_ENABLED else None
+            if top_cars is None:
+                top_cars = list(cars_with_rates_number.values(*fields)[: int(limit)])
+            return list_response(top_cars, media_type, fields)
+        if is_unpaged(request):
+            return json_list_response(
+                cars_with_rates_number.values(*fields), media_type, fields, self.stream_lists
+            )
+
+        try:
+            page = keyset_page(
+                # The key of the page is read even if it is not requested.
+                cars_with_rates_number.values(*fields, *({"rates_number", "id"} - set(fields))),
+                request,
+                ["rates_number", "id"],
+                self._seek,
+            )
+        except InvalidPageRequest as e:
+            return HttpResponse(str(e), status=400)
+        return list_response(page, media_type, fields)
+
+    @staticmethod
+    def _seek(cars, rates_number, id):
+        # Cars are ordered by descending rates number, then by ascending id. Written so that the
+        # database can start reading `car_popularity_idx` at `rates_number`.
+        return cars.filter(rating_count__lte=rates_number).exclude(
+            rating_count=rates_number, id__lte=id
+        )
+
+
+class Trending(View):
+    """Cars with the most rates in the last 24 hours, 7 or 30 days (`?window=`, 24h by default)."""
+
+    @cached_response
+    def get(self, request):
+        window = request.GET.get("window", "24h")
+        if window not in trending.WINDOWS:
+            return HttpResponse(
+                f"Window has to be one of: {', '.join(trending.WINDOWS)}.", status=400
+            )
+        limit = request.GET.get("limit", str(settings.PAGE_SIZE))
+        if not limit.isdigit() or not 1 <= int(limit) <= settings.MAX_PAGE_SIZE:
+            return HttpResponse(
+                f"Limit has to be an integer between 1 and {settings.MAX_PAGE_SIZE}.", status=400
+            )
+
+        cars = [
+            {
+                "id": car["car_id"],
+                "make": car["car__make"],
+                "model": car["car__model"],
+                "rates_number": car["rates_number"],
+            }
+            for car in trending.trending_cars(window, int(limit))
+        ]
+        return JsonResponse(cars, safe=False)
+
+
+class SearchView(View):
+    """
+    Cars whose make or model has words starting with every word of `?q=`, best matches first
+    (see `search.search_cars`). With `?rating=true` the average rating of every car is included.
+    """
+
+    @conditional_response
+    @cached_response
     def get(self, request):
-        cars_with_rates_number = Car.objects.annotate(rates_number=Count("rate")).values(
-            "id", "make", "model", "rates_number"
+        query = request.GET.get("q", "")
+        words = search.query_words(query)
+        if not words or len(query) > search.MAX_QUERY_LENGTH:
+            return HttpResponse(
+                f"Query has to contain letters or digits and have at most "
+                f"{search.MAX_QUERY_LENGTH} characters.",
+                status=400,
+            )
+        limit = request.GET.get("limit", str(settings.SEARCH_LIMIT))
+        if not limit.isdigit() or not 1 <= int(limit) <= settings.MAX_PAGE_SIZE:
+            return HttpResponse(
+                f"Limit has to be an integer between 1 and {settings.MAX_PAGE_SIZE}.", status=400
+            )
+
+        cars = search.search_cars(
+            words, int(limit), with_rating=request.GET.get("rating") == "true"
         )
+        return JsonResponse(cars, safe=False)
 
-        return JsonResponse(
-            sorted(
-                cars_with_rates_number, key=lambda car: car["rates_number"], reverse=True
-            ),
-            safe=False,
+
+class ExportView(View):
+    """Streams all rows of a table (`export.TABLES`) with an ID above `since`, as CSV or NDJSON."""
+
+    def get(self, request, table):
+        format = request.GET.get("format", "csv")
+        if format not in export.FORMATS:
+            return HttpResponse(
+                f"Format has to be one of: {', '.join(export.FORMATS)}.", status=406
+            )
+        since = request.GET.get("since", "0")
+        if not since.isdigit() or not is_db_integer(int(since)):
+            return HttpResponse("Since has to be a non-negative integer.", status=400)
+
+        response = StreamingHttpResponse(
+            export.export_chunks(table, format, int(since)),
+            content_type=export.FORMATS[format],
         )
+        response["Content-Disposition"] = f'attachment; filename="{table}.{format}"'
+        return response
+
+
+class CacheStatsView(View):
+    def get(self, request):
+        return JsonResponse(cache_stats())
+
+
+class MetricsView(View):
+    def get(self, request):
+        content, content_type = metrics.render()
+        return HttpResponse(content, content_type=content_type)
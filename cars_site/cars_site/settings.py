@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,8 +34,16 @@ ALLOWED_HOSTS = [host for host in ALLOWED_HOSTS.split(';')] if ALLOWED_HOSTS els
 
 # Application definition
 
+# "full" (default) - the API and the admin; "api" - only what the API (`cars_app.urls`) uses,
+# without the admin, auth, sessions, messages and templates, so workers start faster and requests
+# pass fewer middleware. The admin is then served by a separate deployment with the full profile.
+DJANGO_PROFILE = os.environ.get("DJANGO_PROFILE", "full")
+if DJANGO_PROFILE not in ("full", "api"):
+    raise ImproperlyConfigured('DJANGO_PROFILE has to be "full" or "api".')
+API_ONLY = DJANGO_PROFILE == "api"
+
 INSTALLED_APPS = [
-    'cars_app',
+    'cars_app.apps.CarsAppConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -40,8 +51,12 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
 ]
+if API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if not app.startswith('django.contrib.')]
 
 MIDDLEWARE = [
+    'cars_app.compression.CompressionMiddleware',
+    'cars_app.db.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,10 +65,23 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+if API_ONLY:
+    # The API keeps no sessions, users or messages, and returns no pages which could be framed.
+    MIDDLEWARE = [
+        middleware
+        for middleware in MIDDLEWARE
+        if not middleware.startswith(('django.contrib.', 'django.middleware.clickjacking.'))
+    ]
+
+# Record Prometheus metrics of every request (served at /metrics). For gunicorn with many workers
+# also set PROMETHEUS_MULTIPROC_DIR to an empty directory - see gunicorn.conf.py.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'cars_app.metrics.MetricsMiddleware')
 
 ROOT_URLCONF = 'cars_site.urls'
 
-TEMPLATES = [
+TEMPLATES = [] if API_ONLY else [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
@@ -71,17 +99,111 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'cars_site.wsgi.application'
 
+# Serve the API with async views. Meant for running over ASGI (e.g. with uvicorn), where a single
+# worker can then wait for many external API calls at once.
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "false").lower() == "true"
+
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# The primary database receives all writes. Read-only replicas of it can be given in
+# DATABASE_REPLICAS (separated with ";") - hosts for server databases, file names for SQLite. GET
+# requests then read from the replicas, except for clients which have just written something (see
+# `cars_app.db`).
+
+DATABASE_ENGINE = os.environ.get("DATABASE_ENGINE", 'django.db.backends.sqlite3')
+IS_SQLITE = DATABASE_ENGINE == 'django.db.backends.sqlite3'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'ENGINE': DATABASE_ENGINE,
+        'NAME': os.environ.get("DATABASE_NAME", BASE_DIR / 'db.sqlite3'),
+        'USER': os.environ.get("DATABASE_USER", ''),
+        'PASSWORD': os.environ.get("DATABASE_PASSWORD", ''),
+        'HOST': os.environ.get("DATABASE_HOST", ''),
+        'PORT': os.environ.get("DATABASE_PORT", ''),
+        # Seconds a connection is kept open for next requests (persistent connections).
+        'CONN_MAX_AGE': int(os.environ.get("DATABASE_CONN_MAX_AGE", "60")),
+        'TEST': {
+            # In-memory databases shared between threads fail with "table is locked" instead of
+            # waiting for each other, which breaks the concurrency tests. A file of the temporary
+            # directory, out of the source tree.
+            'NAME': Path(tempfile.gettempdir()) / 'cars_test_db.sqlite3',
+        } if IS_SQLITE else {},
     }
 }
 
+DATABASE_REPLICAS = os.environ.get("DATABASE_REPLICAS")
+DATABASE_REPLICAS = DATABASE_REPLICAS.split(';') if DATABASE_REPLICAS else []
+DATABASES.update({
+    f'replica_{index}': dict(
+        DATABASES['default'],
+        **({'NAME': replica} if IS_SQLITE else {'HOST': replica}),
+        TEST={'MIRROR': 'default'},
+    )
+    for index, replica in enumerate(DATABASE_REPLICAS)
+})
+
+DATABASE_ROUTERS = ['cars_app.db.PrimaryReplicaRouter'] if DATABASE_REPLICAS else []
+
+# Seconds after a write during which the client reads from the primary database, so it sees its
+# own writes even if the replicas lag behind.
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get("DATABASE_REPLICA_PIN_SECONDS", "5"))
+
+# Check persistent connections at the start of every request and replace the broken ones.
+DATABASE_HEALTH_CHECKS = os.environ.get("DATABASE_HEALTH_CHECKS", "true").lower() == "true"
+
+# Applied to every new SQLite connection. In WAL mode readers don't block the writer and the
+# writer doesn't block readers.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+    'cache_size': -20000,
+}
+# Applied by the `import_cars_rates` command for the duration of the import: nothing waits for the
+# disk (safe if the process crashes, but an OS crash or a power loss may corrupt the database) and
+# the write-ahead log is checkpointed once at the end instead of every 1000 pages. The journal mode
+# stays WAL, as other connections may use the database during the import.
+SQLITE_IMPORT_PRAGMAS = {
+    'synchronous': 'OFF',
+    'cache_size': -200000,
+    'wal_autocheckpoint': 0,
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# E.g. CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache with
+# CACHE_LOCATION=/var/tmp/cars_cache, or a Redis backend like django_redis.cache.RedisCache with
+# CACHE_LOCATION=redis://127.0.0.1:6379/1. The local-memory default is not shared between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            "CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get("CACHE_LOCATION", ''),
+    }
+}
+
+# Cache used for responses of the read endpoints.
+RESPONSE_CACHE_ALIAS = 'default'
+# Seconds a response of GET /cars/ or /popular/ stays cached; 0 turns the cache off. Writes
+# invalidate cached responses immediately anyway.
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", "0"))
+# Seconds after a write during which the outdated response is still served while a new one is
+# being computed (stale-while-revalidate); 0 turns it off.
+RESPONSE_CACHE_STALE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_STALE_TIMEOUT", "0"))
+# Answer GET /cars/, /popular/, /cars/search and /cars/<id>/ratings requests whose If-None-Match
+# or If-Modified-Since match the data version with 304. With several workers it needs a cache
+# backend shared by them, which holds the version.
+CONDITIONAL_GET_ENABLED = os.environ.get("CONDITIONAL_GET_ENABLED", "false").lower() == "true"
+# Responses shorter than that many bytes are not compressed.
+COMPRESSION_MIN_LENGTH = int(os.environ.get("COMPRESSION_MIN_LENGTH", "1024"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -120,3 +242,82 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# External API used for checking if the cars exist in real life.
+# https://vpic.nhtsa.dot.gov/api/
+
+VPIC_API_URL = os.environ.get("VPIC_API_URL", "https://vpic.nhtsa.dot.gov/api/")
+
+# Seconds to wait for establishing a connection and for the response respectively.
+VPIC_CONNECT_TIMEOUT = float(os.environ.get("VPIC_CONNECT_TIMEOUT", "3.05"))
+VPIC_READ_TIMEOUT = float(os.environ.get("VPIC_READ_TIMEOUT", "10"))
+
+# Number of keep-alive connections kept open to the API.
+VPIC_POOL_SIZE = int(os.environ.get("VPIC_POOL_SIZE", "10"))
+
+# After this many consecutive failures the API is not called for VPIC_RECOVERY_TIMEOUT seconds.
+VPIC_FAILURE_THRESHOLD = int(os.environ.get("VPIC_FAILURE_THRESHOLD", "5"))
+VPIC_RECOVERY_TIMEOUT = float(os.environ.get("VPIC_RECOVERY_TIMEOUT", "30"))
+
+# Number of rows inserted at once when loading the local make/model catalog.
+CATALOG_BATCH_SIZE = int(os.environ.get("CATALOG_BATCH_SIZE", "1000"))
+
+# Default and maximal number of items on a page of the paginated list endpoints.
+PAGE_SIZE = int(os.environ.get("PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", "1000"))
+
+# Encode the JSON lists of `GET /cars` and `GET /popular` as compact JSON with orjson - several
+# times faster - instead of the `JsonResponse` encoding (spaces after separators, non-ASCII
+# characters escaped). The data is the same, but the bytes differ.
+COMPACT_JSON_RESPONSES = os.environ.get("COMPACT_JSON_RESPONSES", "false").lower() == "true"
+
+# Write the unpaged lists (`?unpaged=true`) to the client while reading them from the database,
+# instead of building the whole response in memory. Ignored by the async views.
+STREAM_LIST_RESPONSES = os.environ.get("STREAM_LIST_RESPONSES", "false").lower() == "true"
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", "1000"))
+
+# Number of rows read with one query by `GET /export/cars`, `GET /export/rates` and the
+# `export_cars_rates` command.
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", "10000"))
+
+# Number of rows inserted in one transaction by the `import_cars_rates` command.
+IMPORT_BATCH_SIZE = int(os.environ.get("IMPORT_BATCH_SIZE", "10000"))
+
+# Maximal number of rates accepted by a single `POST /rate/bulk` and number of rates inserted with
+# a single query.
+RATE_BULK_MAX_ITEMS = int(os.environ.get("RATE_BULK_MAX_ITEMS", "10000"))
+RATE_BULK_BATCH_SIZE = int(os.environ.get("RATE_BULK_BATCH_SIZE", "500"))
+
+# Queue the rates of `POST /rate/` (answered with 202) instead of applying them in the request; the
+# `drain_rate_queue` command applies them in batches of RATE_QUEUE_BATCH_SIZE, checking the queue
+# every RATE_QUEUE_POLL_INTERVAL seconds when it is empty.
+RATE_QUEUE_ENABLED = os.environ.get("RATE_QUEUE_ENABLED", "false").lower() == "true"
+RATE_QUEUE_BATCH_SIZE = int(os.environ.get("RATE_QUEUE_BATCH_SIZE", "5000"))
+RATE_QUEUE_POLL_INTERVAL = float(os.environ.get("RATE_QUEUE_POLL_INTERVAL", "1"))
+
+# Maximal number of cars accepted by a single `POST /cars/batch` and number of external API calls
+# made at once while checking them.
+CARS_BATCH_MAX_ITEMS = int(os.environ.get("CARS_BATCH_MAX_ITEMS", "1000"))
+CARS_BATCH_VALIDATION_CONCURRENCY = int(
+    os.environ.get("CARS_BATCH_VALIDATION_CONCURRENCY", "8")
+)
+
+# Maximal number of cars deleted by a single `DELETE /cars/?ids=`.
+CARS_BULK_DELETE_MAX_ITEMS = int(os.environ.get("CARS_BULK_DELETE_MAX_ITEMS", "1000"))
+
+# Number of hours and days for which the hourly and daily numbers of rates of every car are kept
+# (`GET /trending` reads the last 24 hours, 7 or 30 days), and seconds between removals of the
+# older ones in the background (0 - only with the `expire_rating_buckets` command).
+TRENDING_HOURLY_RETENTION = int(os.environ.get("TRENDING_HOURLY_RETENTION", "48"))
+TRENDING_DAILY_RETENTION = int(os.environ.get("TRENDING_DAILY_RETENTION", "35"))
+TRENDING_EXPIRY_INTERVAL = int(os.environ.get("TRENDING_EXPIRY_INTERVAL", "3600"))
+
+# Serve `GET /popular/?limit=N` from a leaderboard kept in memory by every worker, updated with
+# the writes instead of sorting the cars in the database (see `cars_app/leaderboard.py`).
+LEADERBOARD_ENABLED = os.environ.get("LEADERBOARD_ENABLED", "false").lower() == "true"
+
+# Default number of cars returned by `GET /cars/search` (at most MAX_PAGE_SIZE can be requested).
+SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT", "10"))
+# Number of the first matches (by id) ranked by relevance on SQLite - ranking costs time per match.
+SEARCH_RANK_CANDIDATES = int(os.environ.get("SEARCH_RANK_CANDIDATES", "1000"))
@@ -13,10 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 urlpatterns = [
-    path('', include('cars_app.urls')),
-    path('admin/', admin.site.urls),
+    path('', include('cars_app.async_urls' if settings.ASYNC_VIEWS else 'cars_app.urls')),
 ]
+
+# Not installed with the API-only profile.
+if not settings.API_ONLY:
+    from django.contrib import admin
+
+    urlpatterns.append(path('admin/', admin.site.urls))
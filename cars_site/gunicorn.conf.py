@@ -0,0 +1,35 @@
+"""
+Gunicorn settings, loaded automatically when gunicorn is started from this directory.
+
+With LEADERBOARD_ENABLED set, every worker builds its leaderboard of the most rated cars before it
+accepts requests.
+
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its metrics to files in that directory.
+Files left by a previous run would be added to the new counts, so the directory is emptied when
+gunicorn starts.
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    from django.conf import settings
+
+    if settings.LEADERBOARD_ENABLED:
+        from cars_app.leaderboard import leaderboard
+
+        leaderboard.build()